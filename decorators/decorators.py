@@ -1,26 +1,82 @@
+import asyncio
 import functools
 import hashlib
-import collections
+import collections.abc
+import logging
+import random
+import re
+import threading
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 import time
 
+import requests
+
+import settings
+from exceptions.exceptions import CachedErrorException
+from helpers.cache_key import make_key
+from helpers.cache_policy import EXPIRED, PERMANENT, STALE, CachePolicies, CachePolicy
 from helpers.cacher import Cacher
+from helpers.singleflight import SingleFlight
+from helpers.tracer import get_tracer
 
 BUILD_IN_TYPES = (str, int, float, complex, tuple, list, dict, set)
 
+# Ключи прежней схемы - md5 от склеенных аргументов
+LEGACY_KEY_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+logger = logging.getLogger(__name__)
+
+_revalidation_executor = None
+_revalidating = set()
+_revalidation_lock = threading.Lock()
+
+
+class RetryBudget:
+    """
+    Общий бюджет повторных запросов: каждый вызов пополняет бюджет на ratio, каждый повтор тратит единицу.
+    Когда цель недоступна, бюджет быстро заканчивается и вызовы перестают повторяться все одновременно
+    """
+
+    def __init__(self, ratio=0.2, capacity=10):
+        self._ratio = ratio
+        self._capacity = capacity
+        self._tokens = float(capacity)
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self._capacity, self._tokens + self._ratio)
+
+    def withdraw(self):
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
 
-def retry(ExceptionToCheck, tries=3, delay=0.5, backoff=2):
+
+def _retry_delays(tries, delay, backoff, max_delay, jitter):
+    """Возвращает паузы перед повторами, при jitter пауза выбирается случайно от нуля до очередной задержки"""
+    mdelay = delay
+    for _ in range(tries - 1):
+        yield random.uniform(0, mdelay) if jitter else mdelay
+        mdelay = min(mdelay * backoff, max_delay)
+
+
+def retry(ExceptionToCheck, tries=3, delay=0.5, backoff=2, max_delay=30, jitter=True, budget=None):
     def deco_retry(f):
         @functools.wraps(f)
         def f_retry(*args, **kwargs):
-            mtries, mdelay = tries, delay
-            while mtries > 1:
+            if budget is not None:
+                budget.deposit()
+            for mdelay in _retry_delays(tries, delay, backoff, max_delay, jitter):
                 try:
                     return f(*args, **kwargs)
                 except ExceptionToCheck:
+                    if budget is not None and not budget.withdraw():
+                        raise
                     time.sleep(mdelay)
-                    mtries -= 1
-                    mdelay *= backoff
             return f(*args, **kwargs)
 
         return f_retry
@@ -28,25 +84,249 @@ def retry(ExceptionToCheck, tries=3, delay=0.5, backoff=2):
     return deco_retry
 
 
+def async_retry(ExceptionToCheck, tries=3, delay=0.5, backoff=2, max_delay=30, jitter=True, budget=None):
+    """Аналог retry для корутин, паузы между повторами не блокируют цикл событий"""
+    def deco_retry(f):
+        @functools.wraps(f)
+        async def f_retry(*args, **kwargs):
+            if budget is not None:
+                budget.deposit()
+            for mdelay in _retry_delays(tries, delay, backoff, max_delay, jitter):
+                try:
+                    return await f(*args, **kwargs)
+                except ExceptionToCheck:
+                    if budget is not None and not budget.withdraw():
+                        raise
+                    await asyncio.sleep(mdelay)
+            return await f(*args, **kwargs)
+
+        return f_retry
+
+    return deco_retry
+
+
+class NegativeResult:
+    """
+    Отметка в кеше о неудачном вызове: пустом результате или ошибке. Хранится settings.NEGATIVE_CACHE_TTL секунд,
+    в течение которых вызов сразу возвращает None или повторяет сохраненную ошибку
+    """
+
+    def __init__(self, error=None):
+        """
+        :param Exception error: Ошибка вызова, None - вызов вернул None
+        """
+        self.error_type = type(error) if error is not None else None
+        self.message = str(error) if error is not None else None
+        response = getattr(error, 'response', None)
+        self.status = getattr(response, 'status_code', None)
+
+    def error(self):
+        """
+        :return: Exception|None Ошибка того же типа и с тем же сообщением, что и у исходной, у ошибок HTTP -
+            с ответом с тем же кодом. Если ошибку такого типа нельзя создать по сообщению,
+            то возвращается CachedErrorException
+        """
+        if self.error_type is None:
+            return None
+        try:
+            error = self.error_type(self.message)
+        except Exception:
+            return CachedErrorException('{}: {}'.format(self.error_type.__name__, self.message))
+        # Отметки, сохраненные до появления кода ответа, его не содержат
+        status = getattr(self, 'status', None)
+        if status is not None:
+            error.response = requests.Response()
+            error.response.status_code = status
+        return error
+
+    def __repr__(self):
+        return 'NegativeResult({}: {})'.format(self.error_type and self.error_type.__name__, self.message)
+
+
 class SaveToCache(ABC):
-    def __init__(self, prefix=''):
-        self._cacher = Cacher(prefix)
+    def __init__(self, prefix='', backend=None, policy=None, revalidate=None, negative=None):
+        """
+        :param str prefix: Префикс кеша
+        :param str backend: Хранилище кеша
+        :param CachePolicy|CachePolicies policy: Политика хранения значений, по умолчанию значения хранятся всегда
+        :param callable revalidate: Функция обновления устаревшего значения, принимает сохраненное значение
+            и аргументы декорируемой функции. Если она вернула сохраненное значение, то оно не перезаписывается,
+            а только продлевается
+        :param tuple|callable negative: Типы ошибок или проверка ошибки, возвращающая True для ошибок, которые
+            вместе с результатом None сохраняются в кеше на settings.NEGATIVE_CACHE_TTL секунд.
+            None - неудачные вызовы не кешируются
+        """
+        self._prefix = prefix
+        self._cacher = Cacher(prefix, backend)
+        self._policies = policy if isinstance(policy, CachePolicies) else CachePolicies(default=policy or PERMANENT)
+        self._revalidator = revalidate
+        self._negative = negative
+        self._flight = SingleFlight()
+        self._legacy = None
 
     def __call__(self, func):
         @functools.wraps(func)
         def wrapper(*args):
-            if not isinstance(args, collections.Hashable):
+            if not isinstance(args, collections.abc.Hashable):
                 return func(*args)
             cache_key = self._generate_cache_key(*args)
-            value = self._cacher.get(cache_key)
-            if value is None:
-                value = func(*args)
-                if value is not None:
-                    self._cacher.put(cache_key, value)
-            return value
+            local_args = self._get_args(*args)
+            entry = self._get_entry(cache_key, args)
+            state = EXPIRED
+            if entry is not None:
+                state = self._policy(entry, local_args).state(time.time() - entry[1])
+            get_tracer().trace_cache(self._prefix, cache_key, state != EXPIRED, [str(arg) for arg in local_args])
+            if state == STALE:
+                self._revalidate(cache_key, func, args, entry)
+            if state != EXPIRED:
+                return self._result(entry[0])
+            return self._flight.do(cache_key, functools.partial(self._load_once, cache_key, func, args, entry))
+        wrapper.cache_state = self.state
+        wrapper.cache_lookup = self.lookup
         return wrapper
 
+    def state(self, *args):
+        """
+        Проверяет наличие значения в кеше, не вызывая функцию
+        :return: str|None FRESH, STALE или EXPIRED, None - значения нет в кеше
+        """
+        found = self.lookup(*args)
+        return found[1] if found is not None else None
+
+    def lookup(self, *args):
+        """
+        Возвращает значение из кеша, не вызывая функцию
+        :return: tuple|None (значение, состояние), для сохраненного неудачного вызова значение - None
+        """
+        entry = self._get_entry(self._generate_cache_key(*args), args, migrate=False)
+        if entry is None:
+            return None
+        state = self._policy(entry, self._get_args(*args)).state(time.time() - entry[1])
+        return (entry[0] if not isinstance(entry[0], NegativeResult) else None), state
+
+    def _get_entry(self, cache_key, args, migrate=True):
+        """
+        :param bool migrate: Переносить найденное по ключу прежней схемы значение под новый ключ,
+            иначе значение только читается
+        """
+        entry = self._cacher.get_entry(cache_key)
+        if entry is not None or not self._has_legacy_keys():
+            return entry
+        # Значения, сохраненные с ключом прежней схемы, переносятся под новый ключ при первом обращении
+        legacy_key = self._legacy_cache_key(*args)
+        if legacy_key is None:
+            return None
+        if not migrate:
+            return self._cacher.get_entry(legacy_key)
+        if self._cacher.rename(legacy_key, cache_key):
+            return self._cacher.get_entry(cache_key)
+        return None
+
+    def _has_legacy_keys(self):
+        """
+        Проверяет один раз за запуск, остались ли в хранилище ключи прежней схемы. Если их нет,
+        то промахи кеша не ищут значения по ключам прежней схемы
+        """
+        if self._legacy is None:
+            self._legacy = any(LEGACY_KEY_PATTERN.match(key) for key in self._cacher.keys())
+        return self._legacy
+
+    def _policy(self, entry, local_args):
+        if isinstance(entry[0], NegativeResult):
+            return CachePolicy(settings.NEGATIVE_CACHE_TTL)
+        return self._policies.select(local_args)
+
+    @staticmethod
+    def _result(value):
+        """Возвращает сохраненное значение, для отметки о неудачном вызове возвращает None или бросает ошибку"""
+        if isinstance(value, NegativeResult):
+            error = value.error()
+            if error is not None:
+                raise error
+            return None
+        return value
+
+    def _load_once(self, cache_key, func, args, entry):
+        """Загружает значение, если его не сохранил вызов, завершившийся после проверки кеша"""
+        current = self._cacher.get_entry(cache_key)
+        if current is not None and (entry is None or current[1] != entry[1]):
+            return self._result(current[0])
+        cached = entry[0] if entry is not None and not isinstance(entry[0], NegativeResult) else None
+        return self._load(cache_key, func, args, cached)
+
+    def _load(self, cache_key, func, args, cached):
+        try:
+            value = self._call(func, args, cached)
+        except Exception as e:
+            # Ошибка обновления не заменяет сохраненное ранее значение
+            if cached is None and self._is_negative(e):
+                self._save(cache_key, NegativeResult(e))
+            raise
+        if value is cached and cached is not None:
+            self._cacher.touch(cache_key)
+        elif value is not None:
+            self._save(cache_key, value)
+        elif self._negative is not None:
+            self._save(cache_key, NegativeResult())
+        return value
+
+    def _is_negative(self, error):
+        if self._negative is None:
+            return False
+        if isinstance(self._negative, tuple):
+            return isinstance(error, self._negative)
+        return self._negative(error)
+
+    def _call(self, func, args, cached):
+        if cached is None or self._revalidator is None:
+            return func(*args)
+        return self._revalidator(cached, *args)
+
+    def _save(self, cache_key, value):
+        if not self._cacher.update(cache_key, value):
+            self._cacher.put(cache_key, value)
+
+    def _revalidate(self, cache_key, func, args, entry):
+        """Обновляет значение в фоне, одновременно для одного ключа выполняется только одно обновление"""
+        global _revalidation_executor
+        with _revalidation_lock:
+            if (self._prefix, cache_key) in _revalidating:
+                return
+            _revalidating.add((self._prefix, cache_key))
+        # Пока значение проверялось, его могло обновить только что завершившееся обновление.
+        # Ключ уже занят, поэтому повторное чтение вне общей блокировки не пропустит новое обновление
+        current = self._cacher.get_entry(cache_key)
+        if current is not None and current[1] != entry[1]:
+            with _revalidation_lock:
+                _revalidating.discard((self._prefix, cache_key))
+            return
+        with _revalidation_lock:
+            if _revalidation_executor is None:
+                _revalidation_executor = ThreadPoolExecutor(max_workers=settings.CACHE_REVALIDATE_WORKERS)
+        _revalidation_executor.submit(self._refresh, cache_key, func, args, entry[0])
+
+    def _refresh(self, cache_key, func, args, cached):
+        try:
+            self._load(cache_key, func, args, cached)
+        except Exception as e:
+            logger.warning('Failed to revalidate cache `{}` for {}: {}'.format(self._prefix, args, e))
+        finally:
+            with _revalidation_lock:
+                _revalidating.discard((self._prefix, cache_key))
+
     def _generate_cache_key(self, *args):
+        """
+        Ключ из префикса кеша, версии схемы ключей и хеша аргументов (helpers.cache_key)
+        :raises TypeError: Если аргумент нельзя закодировать в ключ
+        """
+        local_args = self._get_args(*args)
+        # Аргументы None в конце отбрасываются: вызов с ними не отличается от вызова со значениями по умолчанию
+        while local_args and local_args[-1] is None:
+            local_args.pop()
+        return make_key(self._prefix, local_args)
+
+    def _legacy_cache_key(self, *args):
+        """Ключ прежней схемы: md5 от склеенных строковых представлений аргументов"""
         local_args = self._get_args(*args)
         hashes = []
         for arg in local_args:
@@ -57,8 +337,7 @@ class SaveToCache(ABC):
             if isinstance(arg, dict):
                 hashes.append(str(sorted(arg.items(), key=lambda x: x[0])))
             elif isinstance(arg, list):
-                arg.sort()
-                hashes.append(str(arg))
+                hashes.append(str(sorted(arg)))
             elif isinstance(arg, str):
                 hashes.append(arg)
             else:
@@ -86,7 +365,7 @@ class CacheMethod(SaveToCache):
 
 
 class DisableCache:
-    def __init__(self, prefix=''):
+    def __init__(self, prefix='', backend=None, policy=None, revalidate=None, negative=None):
         self._prefix = prefix
 
     def __call__(self, func):
@@ -96,13 +375,13 @@ class DisableCache:
         return wrapper
 
 
-def disable_cache(prefix):
-    return DisableCache(prefix)
+def disable_cache(prefix, backend=None, policy=None, revalidate=None, negative=None):
+    return DisableCache(prefix, backend, policy, revalidate, negative)
 
 
-def save_to_cache(prefix):
-    return CacheFunction(prefix)
+def save_to_cache(prefix, backend=None, policy=None, revalidate=None, negative=None):
+    return CacheFunction(prefix, backend, policy, revalidate, negative)
 
 
-def save_to_cache_method(prefix):
-    return CacheMethod(prefix)
+def save_to_cache_method(prefix, backend=None, policy=None, revalidate=None, negative=None):
+    return CacheMethod(prefix, backend, policy, revalidate, negative)
@@ -1,4 +1,6 @@
+import asyncio
 import unittest
+from unittest import mock
 
 from decorators import decorators
 
@@ -19,6 +21,96 @@ class TestRetryDecorator(unittest.TestCase):
 
         self.assertEqual(3, _counter)
 
+    def test_raise_exception_if_tries_ended(self):
+        @decorators.retry(RuntimeError, tries=3, delay=0.01)
+        def test():
+            self._counter += 1
+            raise RuntimeError
+
+        with self.assertRaises(RuntimeError):
+            test()
+        self.assertEqual(3, self._counter)
+
+    def test_full_jitter_delays(self):
+        delays = []
+
+        @decorators.retry(RuntimeError, tries=4, delay=1, backoff=2, max_delay=3)
+        def test():
+            raise RuntimeError
+
+        with mock.patch('time.sleep', side_effect=delays.append):
+            with self.assertRaises(RuntimeError):
+                test()
+        self.assertEqual(3, len(delays))
+        for delay, cap in zip(delays, (1, 2, 3)):
+            self.assertTrue(0 <= delay <= cap)
+
+    def test_delays_without_jitter(self):
+        delays = []
+
+        @decorators.retry(RuntimeError, tries=4, delay=1, backoff=2, max_delay=3, jitter=False)
+        def test():
+            raise RuntimeError
+
+        with mock.patch('time.sleep', side_effect=delays.append):
+            with self.assertRaises(RuntimeError):
+                test()
+        self.assertEqual([1, 2, 3], delays)
+
+    def test_stop_retrying_if_budget_is_exhausted(self):
+        budget = decorators.RetryBudget(ratio=0.5, capacity=2)
+
+        @decorators.retry(RuntimeError, tries=3, delay=0.01, budget=budget)
+        def test():
+            self._counter += 1
+            raise RuntimeError
+
+        with self.assertRaises(RuntimeError):
+            test()
+        self.assertEqual(3, self._counter)  # два повтора из бюджета
+        with self.assertRaises(RuntimeError):
+            test()
+        self.assertEqual(4, self._counter)  # остаток бюджета 0.5, повторов нет
+        with self.assertRaises(RuntimeError):
+            test()
+        self.assertEqual(6, self._counter)  # бюджет пополнился до 1
+
+    def test_async_retry_on_exception_raised(self):
+        @decorators.async_retry(RuntimeError, tries=3, delay=0.01)
+        async def test():
+            self._counter += 1
+            if self._counter < 3:
+                raise RuntimeError
+            return self._counter
+
+        loop = asyncio.new_event_loop()
+        try:
+            self.assertEqual(3, loop.run_until_complete(test()))
+        finally:
+            loop.close()
+
+    def test_async_retry_does_not_block_event_loop(self):
+        @decorators.async_retry(RuntimeError, tries=2, delay=0.2, jitter=False)
+        async def test():
+            self._counter += 1
+            if self._counter < 2:
+                raise RuntimeError
+            return 'done'
+
+        async def other():
+            await asyncio.sleep(0.05)
+            return self._counter
+
+        async def run():
+            return await asyncio.gather(test(), other())
+
+        loop = asyncio.new_event_loop()
+        try:
+            res = loop.run_until_complete(run())
+        finally:
+            loop.close()
+        self.assertEqual(['done', 1], res)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,13 +1,29 @@
+import hashlib
 import os
 import shutil
+import tempfile
+import threading
+import time
 import unittest
+from unittest import mock
+
+import requests
 
 from decorators import decorators
-from helpers.cacher import Cacher
+from exceptions.exceptions import CachedErrorException
+from helpers.cache_backends import SQLiteDatabase
+from helpers.cache_policy import CachePolicies, stale_while_revalidate, ttl_policy
+from helpers.cacher import Cacher, SQLITE_BACKEND
+from helpers.memory_cache import get_memory_cache
 
 FILE_SOURCE_NAME = 'http://test.com/some/url'
 
 
+class CustomError(Exception):
+    def __init__(self, code, message):
+        super().__init__('{}: {}'.format(code, message))
+
+
 class TestCacheDecorator(unittest.TestCase):
     def setUp(self):
         self.cache_prefix = 'test'
@@ -17,6 +33,7 @@ class TestCacheDecorator(unittest.TestCase):
     def tearDown(self):
         if os.path.isdir(self.test_dir):
             shutil.rmtree(self.test_dir)
+        get_memory_cache().clear()
 
     def test_can_save_data_to_file(self):
         @decorators.save_to_cache(self.cache_prefix)
@@ -68,8 +85,10 @@ class TestCacheDecorator(unittest.TestCase):
         self.assertEqual(res, [1, 2, 3])
         self.assertEqual(1, len(os.listdir(self.test_dir)))
 
-        res = test([2, 1, 3])
+        arg = [2, 1, 3]
+        res = test(arg)
         self.assertEqual(res, [1, 2, 3])
+        self.assertEqual([2, 1, 3], arg)
         self.assertEqual(1, len(os.listdir(self.test_dir)))
 
         res = test([2, 2, 3])
@@ -142,6 +161,321 @@ class TestCacheDecorator(unittest.TestCase):
 
         decorators.save_to_cache = tmp  # back to origin decorator
 
+    def test_can_save_data_to_sqlite(self):
+        tmp_dir = tempfile.mkdtemp()
+        db = SQLiteDatabase(os.path.join(tmp_dir, 'cache.sqlite3'))
+        try:
+            with mock.patch('helpers.cacher.get_sqlite_database', return_value=db):
+                @decorators.save_to_cache(self.cache_prefix, SQLITE_BACKEND)
+                def test(data):
+                    return data
+
+                self.assertEqual(FILE_SOURCE_NAME, test(FILE_SOURCE_NAME))
+                self.assertFalse(os.path.isdir(self.test_dir))
+                self.assertEqual(1, len(Cacher(self.cache_prefix, SQLITE_BACKEND).keys()))
+        finally:
+            db.close()
+            shutil.rmtree(tmp_dir)
+
+    def test_reload_expired_data(self):
+        calls = []
+
+        @decorators.save_to_cache(self.cache_prefix, policy=ttl_policy(10))
+        def test(data):
+            calls.append(data)
+            return '{}-{}'.format(data, len(calls))
+
+        with mock.patch('time.time', return_value=1000.0):
+            self.assertEqual('a-1', test('a'))
+        with mock.patch('time.time', return_value=1009.0):
+            self.assertEqual('a-1', test('a'))
+        with mock.patch('time.time', return_value=1011.0):
+            self.assertEqual('a-2', test('a'))
+        with mock.patch('time.time', return_value=1012.0):
+            self.assertEqual('a-2', test('a'))
+        self.assertEqual(1, len(os.listdir(self.test_dir)))
+
+    def test_serve_stale_data_while_revalidating(self):
+        calls = []
+        started = threading.Event()
+        release = threading.Event()
+        finished = threading.Event()
+
+        @decorators.save_to_cache(self.cache_prefix, policy=stale_while_revalidate(10))
+        def test(data):
+            calls.append(data)
+            if len(calls) > 1:
+                started.set()
+                release.wait(5)
+                finished.set()
+            return '{}-{}'.format(data, len(calls))
+
+        with mock.patch('time.time', return_value=1000.0):
+            self.assertEqual('a-1', test('a'))
+        with mock.patch('time.time', return_value=1020.0):
+            self.assertEqual('a-1', test('a'))
+            self.assertTrue(started.wait(5))
+            # Пока обновление выполняется, повторные обращения не запускают новых обновлений
+            self.assertEqual('a-1', test('a'))
+            release.set()
+            self.assertTrue(finished.wait(5))
+        with mock.patch('time.time', return_value=1025.0):
+            for _ in range(50):
+                if test('a') == 'a-2':
+                    break
+                time.sleep(0.01)
+            self.assertEqual('a-2', test('a'))
+        self.assertEqual(2, len(calls))
+
+    def test_skip_revalidation_if_entry_was_refreshed(self):
+        calls = []
+        get_entry = Cacher.get_entry
+
+        @decorators.save_to_cache(self.cache_prefix, policy=stale_while_revalidate(10))
+        def test(data):
+            calls.append(data)
+            return '{}-{}'.format(data, len(calls))
+
+        def refreshed_meanwhile(cacher, key):
+            # Между чтением устаревшего значения и запуском обновления значение успело обновиться
+            entry = get_entry(cacher, key)
+            refreshed_meanwhile.reads += 1
+            return entry if refreshed_meanwhile.reads == 1 else ('a-2', entry[1] + 15)
+        refreshed_meanwhile.reads = 0
+
+        with mock.patch('time.time', return_value=1000.0):
+            self.assertEqual('a-1', test('a'))
+        with mock.patch('time.time', return_value=1020.0):
+            with mock.patch.object(Cacher, 'get_entry', autospec=True, side_effect=refreshed_meanwhile):
+                self.assertEqual('a-1', test('a'))
+        time.sleep(0.05)
+        self.assertEqual(['a'], calls)
+        self.assertFalse([key for key in decorators._revalidating if key[0] == self.cache_prefix])
+
+    def test_revalidate_expired_data(self):
+        revalidated = []
+
+        def revalidate(cached, data):
+            revalidated.append(cached)
+            return cached if len(revalidated) == 1 else 'new'
+
+        @decorators.save_to_cache(self.cache_prefix, policy=ttl_policy(10), revalidate=revalidate)
+        def test(data):
+            return data
+
+        with mock.patch('time.time', return_value=1000.0):
+            self.assertEqual('a', test('a'))
+        with mock.patch('time.time', return_value=1020.0):
+            self.assertEqual('a', test('a'))
+        with mock.patch('time.time', return_value=1025.0):
+            # Значение продлено и еще не устарело
+            self.assertEqual('a', test('a'))
+        with mock.patch('time.time', return_value=1040.0):
+            self.assertEqual('new', test('a'))
+        self.assertEqual(['a', 'a'], revalidated)
+        get_memory_cache().clear()
+        self.assertEqual('new', Cacher(self.cache_prefix).get(os.listdir(self.test_dir)[0]))
+
+    def test_coalesce_concurrent_calls(self):
+        calls = []
+
+        @decorators.save_to_cache(self.cache_prefix)
+        def test(data):
+            calls.append(data)
+            time.sleep(0.1)
+            return data
+
+        threads = [threading.Thread(target=test, args=(FILE_SOURCE_NAME,)) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([FILE_SOURCE_NAME], calls)
+        self.assertEqual(FILE_SOURCE_NAME, test(FILE_SOURCE_NAME))
+        self.assertEqual(1, len(calls))
+
+    def test_select_policy_by_pattern(self):
+        calls = []
+        policies = CachePolicies([(r'^live/', ttl_policy(10))])
+
+        @decorators.save_to_cache(self.cache_prefix, policy=policies)
+        def test(data):
+            calls.append(data)
+            return data
+
+        with mock.patch('time.time', return_value=1000.0):
+            test('live/page')
+            test('archive/page')
+        with mock.patch('time.time', return_value=2000.0):
+            test('live/page')
+            test('archive/page')
+        self.assertEqual(['live/page', 'archive/page', 'live/page'], calls)
+
+    def test_move_values_with_legacy_keys(self):
+        calls = []
+
+        @decorators.save_to_cache(self.cache_prefix)
+        def test(*args):
+            calls.append(args)
+            return 'new'
+
+        legacy_key = hashlib.md5('f1news.ruChampionship/2017/'.encode('utf-8')).hexdigest()
+        Cacher(self.cache_prefix).put(legacy_key, 'old')
+        os.utime(os.path.join(self.test_dir, legacy_key), (1000, 1000))
+        get_memory_cache().clear()
+
+        self.assertEqual('old', test('f1news.ru', 'Championship/2017/', None))
+        self.assertEqual([], calls)
+        files = os.listdir(self.test_dir)
+        self.assertEqual(1, len(files))
+        self.assertTrue(files[0].startswith('{}-v'.format(self.cache_prefix)))
+        self.assertAlmostEqual(1000, os.path.getmtime(os.path.join(self.test_dir, files[0])))
+
+    def test_lookup_legacy_keys_without_moving(self):
+        @decorators.save_to_cache(self.cache_prefix)
+        def test(*args):
+            return 'new'
+
+        legacy_key = hashlib.md5('f1news.ruChampionship/2017/'.encode('utf-8')).hexdigest()
+        Cacher(self.cache_prefix).put(legacy_key, 'old')
+        get_memory_cache().clear()
+
+        self.assertEqual(('old', 'fresh'), test.cache_lookup('f1news.ru', 'Championship/2017/'))
+        self.assertEqual([legacy_key], os.listdir(self.test_dir))
+
+    def test_skip_legacy_keys_if_there_are_none(self):
+        @decorators.save_to_cache(self.cache_prefix)
+        def test(data):
+            return data
+
+        test('a')
+        with mock.patch.object(decorators.CacheFunction, '_legacy_cache_key') as legacy_cache_key:
+            test('b')
+            self.assertIsNone(test.cache_lookup('c'))
+        legacy_cache_key.assert_not_called()
+
+    def test_unsupported_argument_exception(self):
+        @decorators.save_to_cache(self.cache_prefix)
+        def test(data):
+            return data
+
+        with self.assertRaises(TypeError):
+            test(object())
+
+    def test_check_cache_state(self):
+        @decorators.save_to_cache(self.cache_prefix, policy=ttl_policy(10))
+        def test(data):
+            return data
+
+        with mock.patch('time.time', return_value=1000.0):
+            self.assertIsNone(test.cache_state('a'))
+            test('a')
+            self.assertEqual('fresh', test.cache_state('a'))
+        with mock.patch('time.time', return_value=1020.0):
+            self.assertEqual('expired', test.cache_state('a'))
+
+    def test_lookup_cache_without_call(self):
+        calls = []
+
+        @decorators.save_to_cache(self.cache_prefix, negative=(LookupError,))
+        def test(data):
+            calls.append(data)
+            if data == 'missing':
+                raise KeyError('Page not found')
+            return data.upper()
+
+        self.assertIsNone(test.cache_lookup('a'))
+        test('a')
+        with self.assertRaises(KeyError):
+            test('missing')
+        self.assertEqual(('A', 'fresh'), test.cache_lookup('a'))
+        self.assertEqual((None, 'fresh'), test.cache_lookup('missing'))
+        self.assertEqual(['a', 'missing'], calls)
+
+    def test_cache_failed_calls(self):
+        calls = []
+
+        @decorators.save_to_cache(self.cache_prefix, negative=(LookupError,))
+        def test(data):
+            calls.append(data)
+            if data == 'missing':
+                raise KeyError('Page not found')
+            return None
+
+        with mock.patch('settings.NEGATIVE_CACHE_TTL', 10):
+            with mock.patch('time.time', return_value=1000.0):
+                for _ in range(2):
+                    with self.assertRaisesRegex(KeyError, 'Page not found'):
+                        test('missing')
+                    self.assertIsNone(test('empty'))
+            self.assertEqual(['missing', 'empty'], calls)
+            with mock.patch('time.time', return_value=1011.0):
+                with self.assertRaises(KeyError):
+                    test('missing')
+                self.assertIsNone(test('empty'))
+            self.assertEqual(['missing', 'empty', 'missing', 'empty'], calls)
+
+    def test_do_not_cache_unexpected_errors(self):
+        calls = []
+
+        @decorators.save_to_cache(self.cache_prefix, negative=(KeyError,))
+        def test(data):
+            calls.append(data)
+            raise ValueError(data)
+
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                test('a')
+        self.assertEqual(['a', 'a'], calls)
+
+    def test_cache_failed_calls_matching_check(self):
+        calls = []
+
+        def is_missing(error):
+            return error.response.status_code == 404
+
+        @decorators.save_to_cache(self.cache_prefix, negative=is_missing)
+        def test(status):
+            calls.append(status)
+            response = requests.Response()
+            response.status_code = status
+            raise requests.HTTPError('{} error'.format(status), response=response)
+
+        for _ in range(2):
+            with self.assertRaises(requests.HTTPError) as context:
+                test(404)
+            self.assertEqual(404, context.exception.response.status_code)
+            with self.assertRaises(requests.HTTPError):
+                test(503)
+        self.assertEqual([404, 503, 503], calls)
+
+    def test_replace_cached_error_that_can_not_be_created(self):
+        @decorators.save_to_cache(self.cache_prefix, negative=(CustomError,))
+        def test(data):
+            raise CustomError(1, data)
+
+        with self.assertRaises(CustomError):
+            test('a')
+        with self.assertRaisesRegex(CachedErrorException, 'CustomError: 1: a'):
+            test('a')
+
+    def test_failed_revalidation_keeps_cached_value(self):
+        def revalidate(cached, data):
+            raise KeyError(data)
+
+        @decorators.save_to_cache(self.cache_prefix, policy=ttl_policy(10), revalidate=revalidate,
+                                  negative=(KeyError,))
+        def test(data):
+            return data
+
+        with mock.patch('time.time', return_value=1000.0):
+            self.assertEqual('a', test('a'))
+        with mock.patch('time.time', return_value=1020.0):
+            with self.assertRaises(KeyError):
+                test('a')
+        get_memory_cache().clear()
+        self.assertEqual('a', Cacher(self.cache_prefix).get(os.listdir(self.test_dir)[0]))
+
 
 if __name__ == '__main__':
     unittest.main()
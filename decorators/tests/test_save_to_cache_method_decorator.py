@@ -4,6 +4,7 @@ import unittest
 
 from decorators import decorators
 from helpers.cacher import Cacher
+from helpers.memory_cache import get_memory_cache
 
 
 FILE_SOURCE_NAME = 'http://test.com/some/url'
@@ -25,6 +26,7 @@ class TestCacheDecorator(unittest.TestCase):
     def tearDown(self):
         if os.path.isdir(self.test_dir):
             shutil.rmtree(self.test_dir)
+        get_memory_cache().clear()
 
     def test_can_save_data_to_file(self):
         class Test:
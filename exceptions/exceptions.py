@@ -4,3 +4,15 @@ class ProxyScraperException(Exception):
 
 class RaceCatalogException(Exception):
     pass
+
+
+class CircuitOpenException(Exception):
+    pass
+
+
+class CachedErrorException(Exception):
+    """Сохраненная в кеше ошибка, которую нельзя воссоздать с исходным типом"""
+
+
+class HostCircuitOpenException(CircuitOpenException):
+    """Сайт считается недоступным, поэтому запрос не выполняется ни напрямую, ни через другой прокси"""
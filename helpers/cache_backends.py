@@ -0,0 +1,428 @@
+import errno
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from helpers.file_lock import FileLock
+from settings import STORAGE_PATH
+
+
+class FileBackend:
+    """
+    Хранит каждое значение кеша в отдельном файле в директории префикса, время записи - время изменения файла,
+    время последнего обращения - время доступа к файлу.
+    Файлы записываются во временный файл и переименовываются, поэтому читатели никогда не видят частично
+    записанных значений, а проверка и запись выполняются под блокировкой директории, общей для всех процессов
+    """
+    _temp_prefix = '.tmp-'
+
+    def __init__(self, directory_path):
+        self._directory_path = directory_path
+        self._lock = FileLock(directory_path)
+
+    def get(self, key):
+        """
+        :return: tuple|None (данные, время записи)
+        """
+        try:
+            with open(os.path.join(self._directory_path, key), mode='rb') as fn:
+                return fn.read(), os.fstat(fn.fileno()).st_mtime
+        except (FileNotFoundError, IsADirectoryError):
+            return None
+
+    def get_many(self, keys):
+        res = {}
+        for key in keys:
+            record = self.get(key)
+            if record is not None:
+                res[key] = record
+        return res
+
+    def has(self, key):
+        return os.path.isfile(os.path.join(self._directory_path, key))
+
+    def add(self, key, data, stored_at=None):
+        """
+        :param float stored_at: Время записи, по умолчанию текущее
+        """
+        file_path = os.path.join(self._directory_path, key)
+        if os.path.isfile(file_path):
+            return False
+        temp_path = self._write_temp(data)
+        try:
+            if stored_at is not None:
+                os.utime(temp_path, (stored_at, stored_at))
+            with self._lock:
+                if os.path.isfile(file_path):
+                    return False
+                os.replace(temp_path, file_path)
+                return True
+        finally:
+            self._remove_temp(temp_path)
+
+    def add_many(self, items):
+        return [key for key, data in items.items() if self.add(key, data)]
+
+    def replace(self, key, data, stored_at=None):
+        """
+        :param float stored_at: Время записи, по умолчанию текущее
+        """
+        file_path = os.path.join(self._directory_path, key)
+        if not os.path.isfile(file_path):
+            return False
+        temp_path = self._write_temp(data)
+        try:
+            if stored_at is not None:
+                os.utime(temp_path, (stored_at, stored_at))
+            with self._lock:
+                # Значение могло быть удалено другим процессом
+                if not os.path.isfile(file_path):
+                    return False
+                os.replace(temp_path, file_path)
+                return True
+        finally:
+            self._remove_temp(temp_path)
+
+    def touch(self, key):
+        """Обновляет время записи значения"""
+        try:
+            os.utime(os.path.join(self._directory_path, key))
+            return True
+        except OSError:
+            return False
+
+    def accessed(self, keys, accessed_at=None):
+        """
+        Запоминает время последнего обращения к значениям
+        :param iterable keys: Ключи
+        :param float accessed_at: Время обращения, по умолчанию текущее
+        """
+        if not os.path.isdir(self._directory_path):
+            return
+        accessed_at = time.time() if accessed_at is None else accessed_at
+        # Время изменения файла сохраняется, а под блокировкой файл не может быть заменен между stat и utime
+        with self._lock:
+            for key in keys:
+                file_path = os.path.join(self._directory_path, key)
+                try:
+                    os.utime(file_path, (accessed_at, os.stat(file_path).st_mtime))
+                except OSError:
+                    pass
+
+    def entries(self):
+        """
+        :return: list (ключ, размер в байтах, время записи, время последнего обращения)
+        """
+        if not os.path.isdir(self._directory_path):
+            return []
+        res = []
+        for entry in os.scandir(self._directory_path):
+            if entry.name.startswith('.') or not entry.is_file():
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            res.append((entry.name, stat.st_size, stat.st_mtime, max(stat.st_mtime, stat.st_atime)))
+        return res
+
+    def delete(self, key):
+        try:
+            with self._lock:
+                os.remove(os.path.join(self._directory_path, key))
+            return True
+        except OSError:
+            return False
+
+    def delete_many(self, keys):
+        """
+        :return: int Количество удаленных значений
+        """
+        deleted = 0
+        if not os.path.isdir(self._directory_path):
+            return deleted
+        with self._lock:
+            for key in keys:
+                try:
+                    os.remove(os.path.join(self._directory_path, key))
+                    deleted += 1
+                except OSError:
+                    pass
+        return deleted
+
+    def remove_temporary(self, max_age):
+        """
+        Удаляет временные файлы, оставшиеся после аварийного завершения записи
+        :param float max_age: Минимальный возраст удаляемых файлов в секундах, более новые файлы еще записываются
+        :return: int Количество удаленных файлов
+        """
+        if not os.path.isdir(self._directory_path):
+            return 0
+        removed = 0
+        for entry in os.scandir(self._directory_path):
+            if not entry.name.startswith(self._temp_prefix):
+                continue
+            try:
+                if time.time() - entry.stat().st_mtime >= max_age:
+                    os.remove(entry.path)
+                    removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def flush(self):
+        try:
+            shutil.rmtree(self._directory_path)
+            return True
+        except OSError:
+            return False
+
+    def keys(self):
+        if not os.path.isdir(self._directory_path):
+            return []
+        return [name for name in os.listdir(self._directory_path)
+                if not name.startswith('.') and os.path.isfile(os.path.join(self._directory_path, name))]
+
+    @contextmanager
+    def transaction(self):
+        # Файлы пишутся по одному, транзакция нужна только для совместимости с другими хранилищами
+        yield
+
+    def _write_temp(self, data):
+        try:
+            os.makedirs(self._directory_path)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        fd, temp_path = tempfile.mkstemp(prefix=self._temp_prefix, dir=self._directory_path)
+        try:
+            with os.fdopen(fd, mode='wb') as fn:
+                fn.write(data)
+        except BaseException:
+            self._remove_temp(temp_path)
+            raise
+        return temp_path
+
+    @staticmethod
+    def _remove_temp(temp_path):
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+
+class SQLiteDatabase:
+    """
+    Общее для всех префиксов соединение с файлом SQLite. Соединение используется из разных потоков,
+    поэтому запросы выполняются под блокировкой, а транзакция удерживает ее до своего завершения
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        # Другие процессы могут удерживать блокировку записи, поэтому ждем ее дольше, чем по умолчанию
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS cache ('
+            'prefix TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, stored_at REAL NOT NULL DEFAULT 0, '
+            'accessed_at REAL NOT NULL DEFAULT 0, PRIMARY KEY (prefix, key)'
+            ') WITHOUT ROWID'
+        )
+        # Таблицы, созданные до появления времени записи, считаются записанными давно
+        columns = [row[1] for row in self._connection.execute('PRAGMA table_info(cache)')]
+        if 'stored_at' not in columns:
+            self._connection.execute('ALTER TABLE cache ADD COLUMN stored_at REAL NOT NULL DEFAULT 0')
+        if 'accessed_at' not in columns:
+            self._connection.execute('ALTER TABLE cache ADD COLUMN accessed_at REAL NOT NULL DEFAULT 0')
+
+    @contextmanager
+    def transaction(self):
+        """Вложенные транзакции объединяются с внешней"""
+        with self._lock:
+            if self._depth == 0:
+                self._connection.execute('BEGIN IMMEDIATE')
+            self._depth += 1
+            try:
+                yield self._connection
+            except BaseException:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._connection.execute('ROLLBACK')
+                raise
+            self._depth -= 1
+            if self._depth == 0:
+                self._connection.execute('COMMIT')
+
+    def execute(self, sql, parameters=()):
+        with self._lock:
+            return self._connection.execute(sql, parameters).fetchall()
+
+    def prefixes(self):
+        return [row[0] for row in self.execute('SELECT DISTINCT prefix FROM cache')]
+
+    def vacuum(self):
+        """Возвращает файловой системе место, освободившееся после удаления значений"""
+        self.execute('VACUUM')
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class SQLiteBackend:
+    """Хранит значения всех префиксов в одной таблице SQLite"""
+
+    # Ограничение SQLite на количество параметров в одном запросе
+    _batch_size = 500
+
+    def __init__(self, database, prefix):
+        """
+        :param SQLiteDatabase database: База данных
+        :param str prefix: Префикс кеша
+        """
+        self._db = database
+        self._prefix = prefix
+
+    def get(self, key):
+        """
+        :return: tuple|None (данные, время записи)
+        """
+        rows = self._db.execute(
+            'SELECT value, stored_at FROM cache WHERE prefix = ? AND key = ?', (self._prefix, key)
+        )
+        return (bytes(rows[0][0]), rows[0][1]) if rows else None
+
+    def get_many(self, keys):
+        keys = list(keys)
+        res = {}
+        for i in range(0, len(keys), self._batch_size):
+            batch = keys[i:i + self._batch_size]
+            rows = self._db.execute(
+                'SELECT key, value, stored_at FROM cache WHERE prefix = ? AND key IN ({})'.format(
+                    ','.join('?' * len(batch))
+                ),
+                [self._prefix] + batch
+            )
+            res.update((key, (bytes(value), stored_at)) for key, value, stored_at in rows)
+        return res
+
+    def has(self, key):
+        return bool(self._db.execute('SELECT 1 FROM cache WHERE prefix = ? AND key = ?', (self._prefix, key)))
+
+    def add(self, key, data, stored_at=None):
+        with self._db.transaction() as connection:
+            cursor = connection.execute(
+                'INSERT OR IGNORE INTO cache (prefix, key, value, stored_at) VALUES (?, ?, ?, ?)',
+                (self._prefix, key, data, time.time() if stored_at is None else stored_at)
+            )
+            return cursor.rowcount > 0
+
+    def add_many(self, items):
+        added = []
+        with self._db.transaction() as connection:
+            for key, data in items.items():
+                cursor = connection.execute(
+                    'INSERT OR IGNORE INTO cache (prefix, key, value, stored_at) VALUES (?, ?, ?, ?)',
+                    (self._prefix, key, data, time.time())
+                )
+                if cursor.rowcount > 0:
+                    added.append(key)
+        return added
+
+    def replace(self, key, data, stored_at=None):
+        with self._db.transaction() as connection:
+            cursor = connection.execute(
+                'UPDATE cache SET value = ?, stored_at = ? WHERE prefix = ? AND key = ?',
+                (data, time.time() if stored_at is None else stored_at, self._prefix, key)
+            )
+            return cursor.rowcount > 0
+
+    def touch(self, key):
+        with self._db.transaction() as connection:
+            cursor = connection.execute(
+                'UPDATE cache SET stored_at = ? WHERE prefix = ? AND key = ?', (time.time(), self._prefix, key)
+            )
+            return cursor.rowcount > 0
+
+    def accessed(self, keys, accessed_at=None):
+        """Аналог FileBackend.accessed"""
+        keys = list(keys)
+        accessed_at = time.time() if accessed_at is None else accessed_at
+        with self._db.transaction() as connection:
+            for i in range(0, len(keys), self._batch_size):
+                batch = keys[i:i + self._batch_size]
+                connection.execute(
+                    'UPDATE cache SET accessed_at = ? WHERE prefix = ? AND key IN ({})'.format(
+                        ','.join('?' * len(batch))
+                    ),
+                    [accessed_at, self._prefix] + batch
+                )
+
+    def entries(self):
+        """Аналог FileBackend.entries"""
+        return [tuple(row) for row in self._db.execute(
+            'SELECT key, length(value), stored_at, max(stored_at, accessed_at) FROM cache WHERE prefix = ?',
+            (self._prefix,)
+        )]
+
+    def delete(self, key):
+        with self._db.transaction() as connection:
+            cursor = connection.execute('DELETE FROM cache WHERE prefix = ? AND key = ?', (self._prefix, key))
+            return cursor.rowcount > 0
+
+    def delete_many(self, keys):
+        keys = list(keys)
+        deleted = 0
+        with self._db.transaction() as connection:
+            for i in range(0, len(keys), self._batch_size):
+                batch = keys[i:i + self._batch_size]
+                cursor = connection.execute(
+                    'DELETE FROM cache WHERE prefix = ? AND key IN ({})'.format(','.join('?' * len(batch))),
+                    [self._prefix] + batch
+                )
+                deleted += cursor.rowcount
+        return deleted
+
+    def remove_temporary(self, max_age):
+        # Значения записываются в транзакциях, временных данных не остается
+        return 0
+
+    def flush(self):
+        with self._db.transaction() as connection:
+            cursor = connection.execute('DELETE FROM cache WHERE prefix = ?', (self._prefix,))
+            return cursor.rowcount > 0
+
+    def keys(self):
+        return [row[0] for row in self._db.execute('SELECT key FROM cache WHERE prefix = ?', (self._prefix,))]
+
+    def transaction(self):
+        return self._db.transaction()
+
+
+def sqlite_database_path():
+    return os.path.join(STORAGE_PATH, 'cache.sqlite3')
+
+
+_databases = {}
+_databases_lock = threading.Lock()
+
+
+def get_sqlite_database(path=None):
+    """Возвращает общее соединение с базой данных кеша"""
+    path = path or sqlite_database_path()
+    with _databases_lock:
+        if path not in _databases:
+            _databases[path] = SQLiteDatabase(path)
+        return _databases[path]
@@ -0,0 +1,88 @@
+import pickle
+import struct
+import zlib
+
+import settings
+
+# Формат v2: заголовок (сигнатура, версия, тип значения, способ сжатия, размер несжатых данных) и данные
+MAGIC = b'F1C'
+
+VERSION = 2
+
+HEADER = struct.Struct('>3sBBBI')
+
+TYPE_TEXT = 1
+TYPE_BYTES = 2
+TYPE_PICKLE = 3
+
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+
+PICKLE_PROTOCOL = 4
+
+# Значения формата v1 сохранялись как pickle протокола 2
+LEGACY_PICKLE_PROTOCOL = 2
+
+
+def dumps(value, level=None):
+    """
+    Строки сохраняются в UTF-8, байты как есть, остальные значения через pickle. Данные сжимаются zlib,
+    если это уменьшает их размер
+    :param value: Значение
+    :param int level: Уровень сжатия zlib от 0 до 9, по умолчанию settings.CACHE_COMPRESSION_LEVEL
+    :return: bytes
+    """
+    if isinstance(value, str):
+        value_type, payload = TYPE_TEXT, value.encode('utf-8')
+    elif isinstance(value, bytes):
+        value_type, payload = TYPE_BYTES, value
+    else:
+        value_type, payload = TYPE_PICKLE, pickle.dumps(value, PICKLE_PROTOCOL)
+    level = settings.CACHE_COMPRESSION_LEVEL if level is None else level
+    compression, payload_size = COMPRESSION_NONE, len(payload)
+    if level > 0:
+        compressed = zlib.compress(payload, level)
+        if len(compressed) < payload_size:
+            compression, payload = COMPRESSION_ZLIB, compressed
+    return HEADER.pack(MAGIC, VERSION, value_type, compression, payload_size) + payload
+
+
+def loads(data):
+    """
+    Восстанавливает значение, сохраненное в формате v2 или v1
+    :param bytes data: Данные
+    :return: Значение
+    """
+    if is_legacy(data):
+        return pickle.loads(data)
+    _, version, value_type, compression, payload_size = HEADER.unpack_from(data)
+    if version != VERSION:
+        raise ValueError('Unsupported cache format version {}'.format(version))
+    payload = data[HEADER.size:]
+    if compression == COMPRESSION_ZLIB:
+        payload = zlib.decompress(payload)
+    elif compression != COMPRESSION_NONE:
+        raise ValueError('Unsupported cache compression {}'.format(compression))
+    if len(payload) != payload_size:
+        raise ValueError('Corrupted cache value')
+    if value_type == TYPE_TEXT:
+        return payload.decode('utf-8')
+    if value_type == TYPE_BYTES:
+        return payload
+    return pickle.loads(payload)
+
+
+def is_legacy(data):
+    """Проверяет, что данные сохранены в формате v1"""
+    return not data.startswith(MAGIC)
+
+
+def raw_size(data):
+    """
+    Возвращает размер несжатых данных, по нему оценивается объем значения в памяти
+    :param bytes data: Данные
+    :return: int
+    """
+    if is_legacy(data):
+        return len(data)
+    return HEADER.unpack_from(data)[4]
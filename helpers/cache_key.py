@@ -0,0 +1,53 @@
+import hashlib
+
+# Версия схемы ключей входит в ключ: при изменении кодирования аргументов ее нужно увеличить,
+# тогда значения со старыми ключами перестают находиться и со временем вытесняются
+KEY_VERSION = 2
+
+DIGEST_SIZE = 16
+
+
+def encode(value):
+    """
+    Кодирует значение однозначно: у каждого значения есть метка типа, а у строк и коллекций - длина, поэтому
+    ('ab', 'c') и ('a', 'bc'), 1 и '1' кодируются по-разному. Порядок элементов словарей, множеств и списков
+    не учитывается, аргументы не изменяются
+    :param value: None, bool, int, float, complex, str, bytes, tuple, list, dict, set или frozenset
+    :return: bytes
+    """
+    if value is None:
+        return b'N'
+    if isinstance(value, bool):
+        return b'T' if value else b'F'
+    if isinstance(value, (int, float, complex)):
+        tag = b'i' if isinstance(value, int) else b'f' if isinstance(value, float) else b'c'
+        return _sized(tag, repr(value).encode('ascii'))
+    if isinstance(value, str):
+        return _sized(b's', value.encode('utf-8'))
+    if isinstance(value, bytes):
+        return _sized(b'b', value)
+    if isinstance(value, tuple):
+        return _sized(b't', b''.join(encode(item) for item in value))
+    if isinstance(value, list):
+        return _sized(b'l', b''.join(sorted(encode(item) for item in value)))
+    if isinstance(value, (set, frozenset)):
+        return _sized(b'S', b''.join(sorted(encode(item) for item in value)))
+    if isinstance(value, dict):
+        return _sized(b'd', b''.join(sorted(encode(key) + encode(item) for key, item in value.items())))
+    raise TypeError('Unsupported cache key argument type `{}`'.format(type(value).__name__))
+
+
+def make_key(namespace, args):
+    """
+    Ключ вида <namespace>-v<версия схемы>-<хеш blake2b аргументов>, по пространству имен и версии можно отобрать
+    ключи одной функции или одной схемы
+    :param str namespace: Пространство имен, например префикс кеша
+    :param tuple args: Аргументы
+    :return: str
+    """
+    digest = hashlib.blake2b(encode(tuple(args)), digest_size=DIGEST_SIZE).hexdigest()
+    return '{}-v{}-{}'.format(namespace, KEY_VERSION, digest)
+
+
+def _sized(tag, payload):
+    return tag + str(len(payload)).encode('ascii') + b':' + payload
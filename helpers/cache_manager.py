@@ -0,0 +1,200 @@
+import argparse
+import time
+from collections import OrderedDict, defaultdict
+
+import settings
+from helpers.cache_backends import get_sqlite_database
+from helpers.cache_snapshot import snapshot_path
+from helpers.cacher import FILE_BACKEND, SQLITE_BACKEND, Cacher, cache_prefixes
+from helpers.tracer import read_summaries
+
+# Границы интервалов распределения значений по возрасту в секундах
+AGE_BUCKETS = (
+    ('<1h', 3600),
+    ('<1d', 24 * 3600),
+    ('<7d', 7 * 24 * 3600),
+    ('<30d', 30 * 24 * 3600),
+    ('>=30d', None),
+)
+
+MISSING = 'missing'
+
+
+def migrate(prefixes=None, backend=FILE_BACKEND):
+    """
+    Переводит значения кеша в текущий формат
+    :param list prefixes: Префиксы, по умолчанию все префиксы хранилища
+    :param str backend: Хранилище
+    :return: dict Префикс -> количество переведенных значений
+    """
+    return {prefix: Cacher(prefix, backend).migrate() for prefix in prefixes or cache_prefixes(backend)}
+
+
+def compact(prefixes=None, backend=FILE_BACKEND, temporary_age=3600):
+    """
+    Удаляет поврежденные значения и временные файлы и применяет ограничения размера settings.CACHE_QUOTAS
+    :param list prefixes: Префиксы, по умолчанию все префиксы хранилища
+    :param str backend: Хранилище
+    :param float temporary_age: Минимальный возраст удаляемых временных файлов в секундах
+    :return: dict Префикс -> количество удаленных значений по причинам
+    """
+    res = OrderedDict((prefix, Cacher(prefix, backend).compact(temporary_age))
+                      for prefix in prefixes or cache_prefixes(backend))
+    if backend == SQLITE_BACKEND and any(sum(removed.values()) for removed in res.values()):
+        get_sqlite_database().vacuum()
+    return res
+
+
+def export(prefixes=None, backend=FILE_BACKEND, directory_path=None):
+    """
+    Упаковывает значения каждого префикса в снимок, который можно скопировать на другую машину
+    :param list prefixes: Префиксы, по умолчанию все префиксы хранилища
+    :param str backend: Хранилище
+    :param str directory_path: Директория снимков, по умолчанию settings.CACHE_SNAPSHOTS_PATH
+    :return: dict Префикс -> количество значений
+    """
+    return OrderedDict((prefix, Cacher(prefix, backend).export(snapshot_path(prefix, directory_path)))
+                       for prefix in prefixes or cache_prefixes(backend))
+
+
+def cache_counters(trace_path, runs=5):
+    """
+    Суммирует счетчики обращений к кешу из сводок последних запусков в файле трассировки
+    :param str trace_path: Путь к файлу трассировки
+    :param int runs: Количество последних запусков
+    :return: dict Префикс -> количество попаданий, промахов и вытеснений
+    """
+    counters = defaultdict(lambda: {'hits': 0, 'misses': 0, 'evictions': 0})
+    for summary in read_summaries(trace_path, runs):
+        for prefix, stats in summary.get('cache', {}).items():
+            for name in counters[prefix]:
+                counters[prefix][name] += stats.get(name, 0)
+    return counters
+
+
+def stats(prefixes=None, backend=FILE_BACKEND, top=5, runs=5, trace_path=None):
+    """
+    Собирает статистику кеша
+    :param list prefixes: Префиксы, по умолчанию все префиксы хранилища
+    :param str backend: Хранилище
+    :param int top: Количество самых больших значений
+    :param int runs: Количество последних запусков, по которым считаются попадания в кеш
+    :param str trace_path: Путь к файлу трассировки, по умолчанию settings.TRACE_PATH
+    :return: dict Префикс -> статистика
+    """
+    counters = cache_counters(trace_path or settings.TRACE_PATH, runs)
+    now = time.time()
+    res = OrderedDict()
+    for prefix in prefixes or cache_prefixes(backend):
+        cacher = Cacher(prefix, backend)
+        entries = cacher.entries()
+        ages = OrderedDict((name, 0) for name, _ in AGE_BUCKETS)
+        raw_size = 0
+        for key, _, stored_at, _ in entries:
+            ages[_age_bucket(now - stored_at)] += 1
+            info = cacher.inspect(key)
+            raw_size += info['raw_size'] if info is not None else 0
+        res[prefix] = dict(
+            counters[prefix],
+            entries=len(entries),
+            size=sum(entry[1] for entry in entries),
+            raw_size=raw_size,
+            ages=ages,
+            largest=[(key, size) for key, size, _, _ in sorted(entries, key=lambda entry: -entry[1])[:top]],
+        )
+    return res
+
+
+def warmup(cache_state, uris, *args):
+    """
+    Проверяет, какие страницы уже есть в кеше, не загружая их
+    :param callable cache_state: Проверка кеша декорированной функции (атрибут cache_state)
+    :param iterable uris: Список uri
+    :param args: Аргументы функции перед uri
+    :return: OrderedDict uri -> fresh, stale, expired или missing
+    """
+    return OrderedDict((uri, cache_state(*(args + (uri,))) or MISSING) for uri in uris)
+
+
+def _age_bucket(age):
+    for name, limit in AGE_BUCKETS:
+        if limit is None or age < limit:
+            return name
+
+
+def _format_time(timestamp):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manages the cache storage')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+    migrate_parser = subparsers.add_parser('migrate', help='convert cached values to the current format')
+    migrate_parser.add_argument('prefixes', nargs='*')
+    migrate_parser.add_argument('--backend', choices=(FILE_BACKEND, SQLITE_BACKEND), default=FILE_BACKEND)
+    compact_parser = subparsers.add_parser('compact', help='remove corrupted values and apply size quotas')
+    compact_parser.add_argument('prefixes', nargs='*')
+    compact_parser.add_argument('--backend', choices=(FILE_BACKEND, SQLITE_BACKEND), default=FILE_BACKEND)
+    compact_parser.add_argument('--temporary-age', type=float, default=3600,
+                                help='minimal age of removed temporary files in seconds')
+    export_parser = subparsers.add_parser('export', help='pack cached values into read-only snapshots')
+    export_parser.add_argument('prefixes', nargs='*')
+    export_parser.add_argument('--backend', choices=(FILE_BACKEND, SQLITE_BACKEND), default=FILE_BACKEND)
+    export_parser.add_argument('--output', help='directory for snapshots, settings.CACHE_SNAPSHOTS_PATH by default')
+    stats_parser = subparsers.add_parser('stats', help='show cache size, age and efficiency')
+    stats_parser.add_argument('prefixes', nargs='*')
+    stats_parser.add_argument('--backend', choices=(FILE_BACKEND, SQLITE_BACKEND), default=FILE_BACKEND)
+    stats_parser.add_argument('--top', type=int, default=5, help='number of the largest values')
+    stats_parser.add_argument('--runs', type=int, default=5, help='number of the last runs to count hits')
+    inspect_parser = subparsers.add_parser('inspect', help='show a cached value metadata')
+    inspect_parser.add_argument('prefix')
+    inspect_parser.add_argument('key')
+    inspect_parser.add_argument('--backend', choices=(FILE_BACKEND, SQLITE_BACKEND), default=FILE_BACKEND)
+    warmup_parser = subparsers.add_parser('warmup', help='check which pages from a file with uris are cached')
+    warmup_parser.add_argument('path', help='file with one uri per line')
+    warmup_parser.add_argument('--source', default='f1news.ru')
+    args = parser.parse_args()
+    if args.command == 'migrate':
+        for prefix, migrated in migrate(args.prefixes, args.backend).items():
+            print('{}: {} values migrated'.format(prefix, migrated))
+    elif args.command == 'compact':
+        for prefix, removed in compact(args.prefixes, args.backend, args.temporary_age).items():
+            print('{}: {corrupted} corrupted values, {temporary} temporary files, {evicted} evicted values '
+                  'removed'.format(prefix, **removed))
+    elif args.command == 'export':
+        for prefix, exported in export(args.prefixes, args.backend, args.output).items():
+            print('{}: {} values exported to {}'.format(prefix, exported, snapshot_path(prefix, args.output)))
+    elif args.command == 'stats':
+        for prefix, prefix_stats in stats(args.prefixes, args.backend, args.top, args.runs).items():
+            print('{}: {entries} values, {size} bytes stored, {raw_size} bytes uncompressed, '
+                  '{hits} hits, {misses} misses, {evictions} evictions'.format(prefix, **prefix_stats))
+            print('  age: {}'.format(', '.join('{} {}'.format(name, count)
+                                               for name, count in prefix_stats['ages'].items())))
+            for key, size in prefix_stats['largest']:
+                print('  {} {} bytes'.format(key, size))
+    elif args.command == 'inspect':
+        info = Cacher(args.prefix, args.backend).inspect(args.key)
+        if info is None:
+            print('{}: not found'.format(args.key))
+        else:
+            print('{}: {} bytes stored, {} bytes uncompressed, {} format, stored at {}'.format(
+                args.key, info['size'], info['raw_size'], 'legacy' if info['legacy'] else 'current',
+                _format_time(info['stored_at'])
+            ))
+    elif args.command == 'warmup':
+        # Модуль сборки данных загружается только здесь, остальным командам его зависимости не нужны
+        import main as app
+        with open(args.path, encoding='utf-8') as f:
+            uris = [line.strip() for line in f if line.strip()]
+        states = warmup(app.scrape_data.cache_state, uris, args.source)
+        for uri, state in states.items():
+            print('{} {}'.format(state, uri))
+        counts = OrderedDict()
+        for state in states.values():
+            counts[state] = counts.get(state, 0) + 1
+        print('total: {}'.format(', '.join('{} {}'.format(state, count) for state, count in counts.items())))
+
+
+if __name__ == '__main__':
+    main()
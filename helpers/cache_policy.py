@@ -0,0 +1,67 @@
+import re
+
+FRESH = 'fresh'
+
+STALE = 'stale'
+
+EXPIRED = 'expired'
+
+
+class CachePolicy:
+    """
+    Политика хранения значений в кеше: значение считается свежим в течение ttl секунд после записи,
+    затем еще stale_ttl секунд его можно отдавать, обновляя кеш в фоне, после чего оно устаревает
+    """
+
+    def __init__(self, ttl=None, stale_ttl=0):
+        """
+        :param float ttl: Время жизни значения в секундах, None - значение не устаревает
+        :param float stale_ttl: Время, в течение которого отдается устаревшее значение, None - без ограничения
+        """
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+
+    def state(self, age):
+        """
+        :param float age: Время, прошедшее с записи значения, в секундах
+        :return: str FRESH, STALE или EXPIRED
+        """
+        if self.ttl is None or age < self.ttl:
+            return FRESH
+        if self.stale_ttl is None or age < self.ttl + self.stale_ttl:
+            return STALE
+        return EXPIRED
+
+    def __repr__(self):
+        return 'CachePolicy(ttl={}, stale_ttl={})'.format(self.ttl, self.stale_ttl)
+
+
+PERMANENT = CachePolicy()
+
+
+def ttl_policy(seconds):
+    """Значение хранится заданное время, затем загружается заново"""
+    return CachePolicy(seconds)
+
+
+def stale_while_revalidate(seconds, stale_seconds=None):
+    """Значение хранится заданное время, затем отдается из кеша, пока в фоне загружается новое"""
+    return CachePolicy(seconds, stale_seconds)
+
+
+class CachePolicies:
+    """Выбирает политику по первому шаблону, найденному в одном из строковых аргументов"""
+
+    def __init__(self, rules=(), default=PERMANENT):
+        """
+        :param iterable rules: Пары (регулярное выражение, CachePolicy)
+        :param CachePolicy default: Политика для аргументов, не подходящих ни под один шаблон
+        """
+        self._rules = [(re.compile(pattern), policy) for pattern, policy in rules]
+        self._default = default
+
+    def select(self, args):
+        for pattern, policy in self._rules:
+            if any(isinstance(arg, str) and pattern.search(arg) for arg in args):
+                return policy
+        return self._default
@@ -0,0 +1,164 @@
+import errno
+import mmap
+import os
+import struct
+import tempfile
+import threading
+
+import settings
+
+# Снимок кеша: заголовок (сигнатура, версия, количество значений, смещение индекса), данные значений подряд,
+# индекс из записей фиксированного размера, отсортированных по ключу, и ключи подряд
+MAGIC = b'F1S'
+
+VERSION = 1
+
+HEADER = struct.Struct('>3sBIQ')
+
+# Смещение ключа от начала блока ключей, длина ключа, смещение значения, длина значения, время записи
+RECORD = struct.Struct('>QHQId')
+
+
+def write_snapshot(path, records):
+    """
+    Записывает снимок атомарно: читатели старого снимка продолжают работать с ним до переоткрытия
+    :param str path: Путь к файлу снимка
+    :param iterable records: Тройки (ключ, данные в формате кеша, время записи)
+    :return: int Количество значений
+    """
+    directory_path = os.path.dirname(path)
+    try:
+        os.makedirs(directory_path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    fd, temp_path = tempfile.mkstemp(prefix='.tmp-', dir=directory_path)
+    try:
+        with os.fdopen(fd, mode='wb') as fn:
+            fn.write(HEADER.pack(MAGIC, VERSION, 0, 0))
+            index = []
+            offset = HEADER.size
+            for key, data, stored_at in records:
+                fn.write(data)
+                index.append((key.encode('utf-8'), offset, len(data), stored_at))
+                offset += len(data)
+            index.sort()
+            key_offset = 0
+            for key, value_offset, value_size, stored_at in index:
+                fn.write(RECORD.pack(key_offset, len(key), value_offset, value_size, stored_at))
+                key_offset += len(key)
+            for key, _, _, _ in index:
+                fn.write(key)
+            fn.seek(0)
+            fn.write(HEADER.pack(MAGIC, VERSION, len(index), offset))
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    return len(index)
+
+
+class SnapshotBackend:
+    """
+    Хранилище только для чтения поверх снимка кеша. Файл отображается в память, поэтому поиск ключа двоичным
+    поиском по индексу не читает файл целиком, а страницы файла общие для всех процессов
+    """
+
+    def __init__(self, path):
+        """
+        :param str path: Путь к файлу снимка
+        """
+        self.path = path
+        with open(path, mode='rb') as fn:
+            self._mmap = mmap.mmap(fn.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self._count, self._index_offset = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise ValueError('Incorrect cache snapshot `{}`'.format(path))
+        if version != VERSION:
+            raise ValueError('Unsupported cache snapshot version {}'.format(version))
+        self._keys_offset = self._index_offset + self._count * RECORD.size
+
+    def get(self, key):
+        """
+        :return: tuple|None (данные, время записи)
+        """
+        position = self._find(key.encode('utf-8'))
+        if position is None:
+            return None
+        _, _, value_offset, value_size, stored_at = self._record(position)
+        return self._mmap[value_offset:value_offset + value_size], stored_at
+
+    def get_many(self, keys):
+        res = {}
+        for key in keys:
+            record = self.get(key)
+            if record is not None:
+                res[key] = record
+        return res
+
+    def has(self, key):
+        return self._find(key.encode('utf-8')) is not None
+
+    def keys(self):
+        return [self._key(position).decode('utf-8') for position in range(self._count)]
+
+    def entries(self):
+        """Аналог FileBackend.entries, время обращения к значениям снимка не хранится"""
+        res = []
+        for position in range(self._count):
+            _, _, _, value_size, stored_at = self._record(position)
+            res.append((self._key(position).decode('utf-8'), value_size, stored_at, stored_at))
+        return res
+
+    def close(self):
+        self._mmap.close()
+
+    def _find(self, key):
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            current = self._key(middle)
+            if current < key:
+                low = middle + 1
+            elif current > key:
+                high = middle
+            else:
+                return middle
+        return None
+
+    def _record(self, position):
+        return RECORD.unpack_from(self._mmap, self._index_offset + position * RECORD.size)
+
+    def _key(self, position):
+        key_offset, key_size, _, _, _ = self._record(position)
+        start = self._keys_offset + key_offset
+        return self._mmap[start:start + key_size]
+
+
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+
+
+def get_snapshot(path):
+    """
+    Возвращает общий для процесса снимок кеша
+    :param str path: Путь к файлу снимка
+    :return: SnapshotBackend|None Снимок или None, если файла нет. Файл открывается один раз, поэтому
+        замененный снимок читается только новыми процессами
+    """
+    with _snapshots_lock:
+        if path not in _snapshots and os.path.isfile(path):
+            _snapshots[path] = SnapshotBackend(path)
+        return _snapshots.get(path)
+
+
+def snapshot_path(prefix, directory_path=None):
+    """
+    :param str prefix: Префикс кеша
+    :param str directory_path: Директория снимков, по умолчанию settings.CACHE_SNAPSHOTS_PATH
+    :return: str
+    """
+    return os.path.join(directory_path or settings.CACHE_SNAPSHOTS_PATH, '{}.snapshot'.format(prefix))
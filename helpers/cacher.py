@@ -1,66 +1,380 @@
 import os
-import pickle
-import errno
 import re
-import shutil
+import threading
+import time
+import weakref
+from contextlib import contextmanager
 
-from settings import STORAGE_PATH
+import settings
+from helpers import cache_format
+from helpers.cache_backends import FileBackend, SQLiteBackend, get_sqlite_database, sqlite_database_path
+from helpers.cache_snapshot import get_snapshot, snapshot_path, write_snapshot
+from helpers.memory_cache import get_memory_cache
+from helpers.tracer import get_tracer
+
+FILE_BACKEND = 'file'
+
+SQLITE_BACKEND = 'sqlite'
+
+# Все созданные кеши, чтобы по окончании работы сохранить накопленные времена обращений
+_cachers = weakref.WeakSet()
+_cachers_lock = threading.Lock()
 
 
 class Cacher:
-    _protocol = 2
+    """
+    Кеш значений с префиксом. Прочитанные и записанные значения дополнительно хранятся в общем LRU кеше в памяти,
+    поэтому повторное чтение ключа не обращается к хранилищу и не распаковывает значение заново.
+    Если для префикса задано ограничение размера (settings.CACHE_QUOTAS), то при его превышении из хранилища
+    вытесняются значения, к которым дольше всего не обращались.
+    Если для префикса есть снимок (settings.CACHE_SNAPSHOTS_PATH), то значения, которых нет в хранилище, читаются
+    из снимка. Снимок не изменяется: новые значения записываются в хранилище, а удалить значение из снимка нельзя
+    """
 
-    def __init__(self, prefix=''):
+    # Времена обращений накапливаются и сохраняются в хранилище пачками
+    _access_batch_size = 100
+
+    # После вытеснения размер кеша уменьшается до этой доли ограничения, чтобы не вытеснять при каждой записи
+    _eviction_target = 0.9
+
+    def __init__(self, prefix='', backend=None):
+        """
+        :param str prefix: Префикс кеша
+        :param str backend: Хранилище: file или sqlite, по умолчанию берется из settings.CACHE_BACKENDS
+            для префикса или settings.CACHE_BACKEND
+        """
         # В целях безопасности проверяем на слеш и точки
         if re.search(r'[/.\\]+', prefix):
             raise ValueError('Incorrect cache prefix')
-        self._directory_path = os.path.join(STORAGE_PATH, 'cache', prefix)
+        self._directory_path = os.path.join(settings.STORAGE_PATH, 'cache', prefix)
+        backend = backend or settings.CACHE_BACKENDS.get(prefix, settings.CACHE_BACKEND)
+        if backend == FILE_BACKEND:
+            self._backend = FileBackend(self._directory_path)
+        elif backend == SQLITE_BACKEND:
+            self._backend = SQLiteBackend(get_sqlite_database(), prefix)
+        else:
+            raise ValueError('Unknown cache backend `{}`'.format(backend))
+        self._prefix = prefix
+        self._namespace = (backend, prefix)
+        self._memory = get_memory_cache()
+        self._snapshot = get_snapshot(snapshot_path(prefix))
+        self._quota = settings.CACHE_QUOTAS.get(prefix)
+        self._size = None
+        self._accessed = set()
+        self._lock = threading.Lock()
+        with _cachers_lock:
+            _cachers.add(self)
 
     def put(self, key, value):
-        try:
-            os.makedirs(self._directory_path)
-        except OSError as e:
-            if e.errno != errno.EEXIST:
-                raise
-        file_path = os.path.join(self._directory_path, key)
-        if os.path.isfile(file_path):
+        if self._snapshot is not None and self._snapshot.has(key):
+            return False
+        data = self._dumps(value)
+        if not self._backend.add(key, data):
             return False
-        with open(file_path, mode='wb') as fn:
-            pickle.dump(value, fn, self._protocol)
+        self._remember(key, value, time.time(), data)
+        self._account(len(data))
         return True
 
+    def put_many(self, items):
+        """
+        Сохраняет несколько значений в одной транзакции, существующие значения не перезаписываются
+        :param dict items: Ключ -> значение
+        :return: list Ключи сохраненных значений
+        """
+        items = {key: (value, self._dumps(value)) for key, value in items.items()
+                 if self._snapshot is None or not self._snapshot.has(key)}
+        added = self._backend.add_many({key: data for key, (_, data) in items.items()})
+        stored_at = time.time()
+        for key in added:
+            value, data = items[key]
+            self._remember(key, value, stored_at, data)
+        self._account(sum(len(items[key][1]) for key in added))
+        return added
+
     def get(self, key):
-        file_path = os.path.join(self._directory_path, key)
-        if os.path.isfile(file_path):
-            with open(file_path, mode='rb') as fn:
-                res = pickle.load(fn)
-            return res
-        else:
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    def get_entry(self, key):
+        """
+        :return: tuple|None (значение, время записи)
+        """
+        found, entry = self._memory.get((self._namespace, key))
+        if found:
+            self._access([key])
+            return entry
+        record = self._record(key)
+        if record is None:
             return None
+        data, stored_at = record
+        value = cache_format.loads(data)
+        self._remember(key, value, stored_at, data)
+        self._access([key])
+        return value, stored_at
+
+    def get_many(self, keys):
+        """
+        :param iterable keys: Ключи
+        :return: dict Ключ -> значение для найденных ключей
+        """
+        res = {}
+        missing = []
+        for key in keys:
+            found, entry = self._memory.get((self._namespace, key))
+            if found:
+                res[key] = entry[0]
+            else:
+                missing.append(key)
+        records = self._backend.get_many(missing)
+        if self._snapshot is not None:
+            records.update(self._snapshot.get_many([key for key in missing if key not in records]))
+        for key, (data, stored_at) in records.items():
+            res[key] = cache_format.loads(data)
+            self._remember(key, res[key], stored_at, data)
+        self._access(res)
+        return res
 
     def has(self, key):
-        file_path = os.path.join(self._directory_path, key)
-        return os.path.isfile(file_path)
+        return self._memory.contains((self._namespace, key)) or self._backend.has(key) or \
+            (self._snapshot is not None and self._snapshot.has(key))
 
     def update(self, key, value):
-        file_path = os.path.join(self._directory_path, key)
-        if os.path.isfile(file_path):
-            with open(file_path, mode='wb') as fn:
-                pickle.dump(value, fn, self._protocol)
-            return True
-        return False
+        data = self._dumps(value)
+        if not self._backend.replace(key, data) and not self._copy_from_snapshot(key, data):
+            return False
+        self._remember(key, value, time.time(), data)
+        self._account(len(data))
+        return True
+
+    def touch(self, key):
+        """
+        Продлевает жизнь значения, не перезаписывая его
+        :return: bool Значение найдено
+        """
+        if not self._backend.touch(key):
+            record = self._snapshot.get(key) if self._snapshot is not None else None
+            if record is None or not self._copy_from_snapshot(key, record[0]):
+                return False
+        found, entry = self._memory.get((self._namespace, key))
+        if found:
+            self._memory.update((self._namespace, key), (entry[0], time.time()))
+        return True
 
     def delete(self, key):
-        file_path = os.path.join(self._directory_path, key)
-        try:
-            os.remove(file_path)
-            return True
-        except OSError:
+        self._memory.delete((self._namespace, key))
+        return self._backend.delete(key)
+
+    def rename(self, key, new_key):
+        """
+        Переносит значение под новый ключ, сохраняя время записи. Значение снимка копируется в хранилище
+        :return: bool Значение перенесено: старый ключ найден, а нового ключа еще нет
+        """
+        record = self._record(key)
+        if record is None or self.has(new_key) or not self._backend.add(new_key, record[0], record[1]):
             return False
+        self.delete(key)
+        self._account(len(record[0]))
+        return True
 
     def flush(self):
+        self._forget_all()
+        return self._backend.flush()
+
+    def keys(self):
+        keys = self._backend.keys()
+        if self._snapshot is not None:
+            stored = set(keys)
+            keys += [key for key in self._snapshot.keys() if key not in stored]
+        return keys
+
+    def entries(self):
+        """
+        :return: list (ключ, размер в байтах, время записи, время последнего обращения)
+        """
+        self.sync()
+        return self._backend.entries()
+
+    def inspect(self, key):
+        """
+        :return: dict|None Размер значения в хранилище и без сжатия, время записи и формат
+        """
+        record = self._record(key)
+        if record is None:
+            return None
+        data, stored_at = record
+        return {
+            'size': len(data),
+            'raw_size': cache_format.raw_size(data),
+            'stored_at': stored_at,
+            'legacy': cache_format.is_legacy(data),
+        }
+
+    def export(self, path=None):
+        """
+        Записывает все значения префикса, включая значения текущего снимка, в снимок
+        :param str path: Путь к файлу снимка, по умолчанию снимок префикса в settings.CACHE_SNAPSHOTS_PATH
+        :return: int Количество значений
+        """
+        def records():
+            for key in self.keys():
+                record = self._record(key)
+                if record is not None:
+                    yield key, record[0], record[1]
+
+        return write_snapshot(path or snapshot_path(self._prefix), records())
+
+    def sync(self):
+        """Сохраняет в хранилище накопленные времена обращений к значениям"""
+        with self._lock:
+            keys, self._accessed = self._accessed, set()
+        if keys:
+            self._backend.accessed(keys)
+
+    def evict(self, max_size):
+        """
+        Удаляет значения, к которым дольше всего не обращались, пока их суммарный размер больше заданного
+        :param int max_size: Размер в байтах
+        :return: int Количество удаленных значений
+        """
+        entries = sorted(self.entries(), key=lambda entry: entry[3])
+        size = sum(entry[1] for entry in entries)
+        evicted = []
+        for key, entry_size, _, _ in entries:
+            if size <= max_size:
+                break
+            evicted.append(key)
+            size -= entry_size
+        for key in evicted:
+            self._memory.delete((self._namespace, key))
+        if evicted:
+            self._backend.delete_many(evicted)
+            get_tracer().trace_eviction(self._prefix, len(evicted))
+        with self._lock:
+            self._size = size
+        return len(evicted)
+
+    def enforce_quota(self):
+        """
+        Применяет ограничение размера settings.CACHE_QUOTAS
+        :return: int Количество удаленных значений
+        """
+        return self.evict(self._quota) if self._quota is not None else 0
+
+    def compact(self, temporary_age=3600):
+        """
+        Удаляет значения, которые не удается прочитать (поврежденные или сохраненные несуществующими больше
+        классами), временные файлы, оставшиеся после сбоев, и применяет ограничение размера
+        :param float temporary_age: Минимальный возраст удаляемых временных файлов в секундах
+        :return: dict Количество удаленных значений по причинам
+        """
+        corrupted = []
+        for key in self._backend.keys():
+            record = self._backend.get(key)
+            if record is None:
+                continue
+            try:
+                cache_format.loads(record[0])
+            except Exception:
+                corrupted.append(key)
+        for key in corrupted:
+            self._memory.delete((self._namespace, key))
+        self._backend.delete_many(corrupted)
+        return {
+            'corrupted': len(corrupted),
+            'temporary': self._backend.remove_temporary(temporary_age),
+            'evicted': self.enforce_quota(),
+        }
+
+    @contextmanager
+    def transaction(self):
+        """Контекстный менеджер, все изменения внутри которого сохраняются или отменяются вместе"""
         try:
-            shutil.rmtree(self._directory_path)
-            return True
-        except OSError:
-            return False
+            with self._backend.transaction():
+                yield
+        except BaseException:
+            # Значения, записанные в отмененной транзакции, могли попасть в память
+            self._forget_all()
+            raise
+
+    def _record(self, key):
+        record = self._backend.get(key)
+        if record is None and self._snapshot is not None:
+            record = self._snapshot.get(key)
+        return record
+
+    def _copy_from_snapshot(self, key, data):
+        """Записывает в хранилище новое значение ключа, который есть только в снимке"""
+        return self._snapshot is not None and self._snapshot.has(key) and self._backend.add(key, data)
+
+    def _access(self, keys):
+        with self._lock:
+            self._accessed.update(keys)
+            if len(self._accessed) < self._access_batch_size:
+                return
+            keys, self._accessed = self._accessed, set()
+        self._backend.accessed(keys)
+
+    def _account(self, size):
+        """Учитывает размер записанного значения и вытесняет старые значения при превышении ограничения"""
+        if self._quota is None:
+            return
+        with self._lock:
+            if self._size is None:
+                # Размер считается приблизительно: перезапись значения учитывается как новое значение,
+                # а записи других процессов - только при следующем вытеснении
+                self._size = sum(entry[1] for entry in self._backend.entries())
+            else:
+                self._size += size
+            exceeded = self._size > self._quota
+        if exceeded:
+            self.evict(int(self._quota * self._eviction_target))
+
+    def _remember(self, key, value, stored_at, data):
+        self._memory.put((self._namespace, key), (value, stored_at), cache_format.raw_size(data))
+
+    def _forget_all(self):
+        self._memory.delete_many(lambda key: key[0] == self._namespace)
+
+    def migrate(self):
+        """
+        Переводит значения, сохраненные в формате v1, в текущий формат
+        :return: int Количество переведенных значений
+        """
+        migrated = 0
+        for key in self._backend.keys():
+            record = self._backend.get(key)
+            if record is not None and cache_format.is_legacy(record[0]):
+                self._backend.replace(key, self._dumps(cache_format.loads(record[0])), record[1])
+                self._memory.delete((self._namespace, key))
+                migrated += 1
+        return migrated
+
+    def _dumps(self, value):
+        return cache_format.dumps(value)
+
+
+def sync_all():
+    """Сохраняет в хранилище накопленные времена обращений всех созданных кешей"""
+    with _cachers_lock:
+        cachers = list(_cachers)
+    for cacher in cachers:
+        cacher.sync()
+
+
+def cache_prefixes(backend=FILE_BACKEND):
+    """
+    Возвращает префиксы, для которых в хранилище есть значения
+    :param str backend: Хранилище
+    :return: list
+    """
+    if backend == FILE_BACKEND:
+        directory_path = os.path.join(settings.STORAGE_PATH, 'cache')
+        if not os.path.isdir(directory_path):
+            return []
+        return sorted(name for name in os.listdir(directory_path)
+                      if os.path.isdir(os.path.join(directory_path, name)))
+    if backend == SQLITE_BACKEND:
+        if not os.path.isfile(sqlite_database_path()):
+            return []
+        return sorted(get_sqlite_database().prefixes())
+    raise ValueError('Unknown cache backend `{}`'.format(backend))
@@ -0,0 +1,69 @@
+import threading
+import time
+
+import settings
+from exceptions.exceptions import CircuitOpenException
+
+
+class CircuitBreaker:
+    """
+    Размыкается после threshold ошибок подряд и в течение reset_timeout секунд сразу отклоняет запросы,
+    затем пропускает один пробный запрос: если он успешен, то цепь замыкается, иначе снова размыкается
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, name, threshold=5, reset_timeout=30):
+        self.name = name
+        self._threshold = threshold
+        self._reset_timeout = reset_timeout
+        self._failures = 0
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def allow(self):
+        """Выбрасывает CircuitOpenException, если цель считается недоступной"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            # Если результат пробного запроса так и не был получен, то через reset_timeout пропускаем следующий
+            if time.monotonic() - self._opened_at >= self._reset_timeout:
+                self._state = self.HALF_OPEN
+                self._opened_at = time.monotonic()
+                return
+        raise CircuitOpenException('Circuit `{}` is open'.format(self.name))
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._state = self.CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self._threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(name):
+    """Возвращает общий предохранитель для хоста или прокси с заданным именем"""
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(
+                name,
+                threshold=settings.CIRCUIT_BREAKER_THRESHOLD,
+                reset_timeout=settings.CIRCUIT_BREAKER_RESET_TIMEOUT,
+            )
+        return _breakers[name]
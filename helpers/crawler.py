@@ -0,0 +1,60 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from decorators.decorators import async_retry
+
+logger = logging.getLogger(__name__)
+
+
+class Crawler:
+    """Асинхронно загружает набор страниц, ограничивая количество одновременных запросов"""
+
+    def __init__(self, fetch, concurrency=8, tries=1):
+        """
+        :param callable fetch: Функция загрузки одной страницы, принимает uri
+        :param int concurrency: Максимальное количество одновременных запросов
+        :param int tries: Количество попыток загрузки страницы
+        """
+        if not isinstance(concurrency, int) or concurrency < 1:
+            raise ValueError('Concurrency must be a positive integer')
+        self._fetch = fetch
+        self._concurrency = concurrency
+        self._tries = tries
+
+    def crawl(self, uris):
+        """
+        Загружает все страницы и возвращает результаты в порядке следования uri,
+        для страниц, которые не удалось загрузить, возвращается None
+        :param iterable uris: Список uri
+        :return: OrderedDict
+        """
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(self.crawl_async(uris))
+        finally:
+            loop.close()
+
+    async def crawl_async(self, uris):
+        loop = asyncio.get_event_loop()
+        semaphore = asyncio.Semaphore(self._concurrency)
+        uris = list(OrderedDict.fromkeys(uris))
+        with ThreadPoolExecutor(max_workers=self._concurrency) as executor:
+            results = await asyncio.gather(*[
+                self._fetch_one(uri, loop, executor, semaphore) for uri in uris
+            ])
+        return OrderedDict(zip(uris, results))
+
+    async def _fetch_one(self, uri, loop, executor, semaphore):
+        # Пауза между попытками не занимает ни поток, ни место в семафоре
+        @async_retry(Exception, tries=self._tries)
+        async def fetch():
+            async with semaphore:
+                return await loop.run_in_executor(executor, self._fetch, uri)
+
+        try:
+            return await fetch()
+        except Exception as e:
+            logger.warning('Failed to fetch `{}`: {}'.format(uri, e))
+            return None
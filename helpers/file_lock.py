@@ -0,0 +1,44 @@
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # На системах без fcntl блокировка действует только между потоками одного процесса
+    fcntl = None
+
+
+class FileLock:
+    """Монопольная блокировка между потоками и процессами на основе flock существующего файла или директории"""
+
+    def __init__(self, path):
+        """
+        :param str path: Путь к файлу или директории
+        """
+        self._path = path
+        self._thread_lock = threading.Lock()
+        self._fd = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        try:
+            if fcntl is not None:
+                self._fd = os.open(self._path, os.O_RDONLY)
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+        except BaseException:
+            self._close()
+            self._thread_lock.release()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            self._close()
+        finally:
+            self._thread_lock.release()
+
+    def _close(self):
+        if self._fd is not None:
+            # Закрытие дескриптора снимает блокировку
+            os.close(self._fd)
+            self._fd = None
@@ -0,0 +1,159 @@
+import argparse
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlsplit, urlunsplit
+
+from helpers.recorder import Recorder, fixture_key
+
+PROXY_LIST_PATH = '/proxy-list'
+
+CHECK_PROXY_PATH = '/check-proxy'
+
+# Заголовки, которые описывают передачу исходного ответа, а не его содержимое
+SKIPPED_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding', 'connection', 'keep-alive')
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        # В режиме прокси в строке запроса передается абсолютный адрес, хост которого входит в ключ,
+        # кроме запросов к самому серверу
+        fixture_server = self.server.fixture_server
+        parts = urlsplit(self.path)
+        if parts.netloc in (fixture_server.address, 'localhost:{}'.format(fixture_server.port)):
+            key = fixture_key(urlunsplit(('', '', parts.path, parts.query, '')))
+        else:
+            key = fixture_key(self.path)
+        if fixture_server.proxy_list and key.endswith(PROXY_LIST_PATH):
+            status, headers, body = 200, {'Content-Type': 'text/html; charset=utf-8'}, fixture_server.proxy_list_page()
+        elif key == CHECK_PROXY_PATH:
+            status, headers, body = 200, {}, b''
+        elif key in fixture_server.fixtures:
+            fixture = fixture_server.fixtures[key]
+            status, headers, body = fixture.status, fixture.headers, fixture.body
+        else:
+            status, headers, body = 404, {}, b''
+        fixture_server.delay(key)
+        self.send_response(status)
+        for name, value in headers.items():
+            if name.lower() not in SKIPPED_HEADERS:
+                self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FixtureServer:
+    """
+    Локальный HTTP сервер, воспроизводящий ответы, записанные Recorder. Может работать как прокси для http запросов
+    и отдавать страницу каталога прокси, в которой указан он сам и, при необходимости, несколько неработающих прокси
+    """
+
+    def __init__(self, fixtures_path, *, host='127.0.0.1', port=0, latency=0.0, jitter=0.0,
+                 recorded_latency=False, proxy_list=False, dead_proxies=0):
+        """
+        :param str fixtures_path: Директория с записанными ответами
+        :param float latency: Задержка каждого ответа в секундах
+        :param float jitter: Случайная добавка к задержке от нуля до jitter секунд
+        :param bool recorded_latency: Добавлять к задержке время ответа, записанное вместе с ответом
+        :param bool proxy_list: Отдавать страницу каталога прокси
+        :param int dead_proxies: Количество неработающих прокси в каталоге
+        """
+        self.fixtures = Recorder(fixtures_path).load()
+        self.proxy_list = proxy_list
+        self._latency = latency
+        self._jitter = jitter
+        self._recorded_latency = recorded_latency
+        self._dead_proxies = dead_proxies
+        self._server = _ThreadingHTTPServer((host, port), FixtureHandler)
+        self._server.fixture_server = self
+        self._thread = None
+
+    @property
+    def address(self):
+        host, port = self._server.server_address[:2]
+        return '{}:{}'.format(host, port)
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    @property
+    def url(self):
+        return 'http://{}'.format(self.address)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def delay(self, key):
+        delay = self._latency
+        if self._jitter:
+            delay += random.uniform(0, self._jitter)
+        if self._recorded_latency and key in self.fixtures:
+            delay += self.fixtures[key].elapsed
+        if delay > 0:
+            time.sleep(delay)
+
+    def proxy_list_page(self):
+        # Порт 1 на локальном адресе закрыт, соединение с таким прокси сразу отклоняется
+        proxies = ['127.0.0.1:1'] * self._dead_proxies + [self.address]
+        rows = ''.join('<tr><td>{}</td></tr>'.format(proxy) for proxy in proxies)
+        return '<table class="proxylist"><tbody>{}</tbody></table>'.format(rows).encode('utf-8')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replays recorded responses')
+    parser.add_argument('fixtures_path')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--recorded-latency', action='store_true')
+    parser.add_argument('--proxy-list', action='store_true')
+    parser.add_argument('--dead-proxies', type=int, default=0)
+    args = parser.parse_args()
+    server = FixtureServer(
+        args.fixtures_path,
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        jitter=args.jitter,
+        recorded_latency=args.recorded_latency,
+        proxy_list=args.proxy_list,
+        dead_proxies=args.dead_proxies,
+    )
+    print('Serving {} responses on {}'.format(len(server.fixtures), server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+import threading
+from collections import OrderedDict
+
+import settings
+
+
+class MemoryCache:
+    """
+    LRU кеш в памяти процесса, ограниченный суммарным размером значений в байтах.
+    Значения хранятся как есть, без копирования, поэтому изменять полученные из кеша объекты нельзя
+    """
+
+    def __init__(self, max_size):
+        """
+        :param int max_size: Максимальный суммарный размер значений в байтах, 0 - кеш отключен
+        """
+        self._max_size = max_size
+        self._size = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """
+        :return: tuple (найдено ли значение, значение)
+        """
+        with self._lock:
+            if key not in self._items:
+                self.misses += 1
+                return False, None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return True, self._items[key][0]
+
+    def contains(self, key):
+        """Проверяет наличие ключа, не изменяя порядок вытеснения и счетчики"""
+        with self._lock:
+            return key in self._items
+
+    def put(self, key, value, size):
+        """
+        :param key: Ключ
+        :param value: Значение
+        :param int size: Размер значения в байтах
+        """
+        if size > self._max_size:
+            self.delete(key)
+            return
+        with self._lock:
+            if key in self._items:
+                self._size -= self._items.pop(key)[1]
+            self._items[key] = (value, size)
+            self._size += size
+            while self._size > self._max_size:
+                _, (_, evicted_size) = self._items.popitem(last=False)
+                self._size -= evicted_size
+                self.evictions += 1
+
+    def update(self, key, value):
+        """Заменяет значение, если оно есть в кеше, сохраняя его размер"""
+        with self._lock:
+            if key in self._items:
+                self._items[key] = (value, self._items[key][1])
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._items:
+                self._size -= self._items.pop(key)[1]
+
+    def delete_many(self, predicate):
+        """Удаляет значения, для ключей которых predicate возвращает True"""
+        with self._lock:
+            for key in [key for key in self._items if predicate(key)]:
+                self._size -= self._items.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'items': len(self._items),
+                'size': self._size,
+            }
+
+
+_memory_cache = MemoryCache(settings.MEMORY_CACHE_SIZE)
+
+
+def get_memory_cache():
+    """Возвращает общий для всех экземпляров Cacher кеш в памяти"""
+    return _memory_cache
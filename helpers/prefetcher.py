@@ -0,0 +1,102 @@
+import functools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Prefetcher:
+    """
+    Декоратор функции загрузки: после каждого вызова в фоне вызывает ту же функцию для аргументов, которые
+    скорее всего понадобятся следом, чтобы их результаты оказались в кеше к моменту запроса. Каждый набор
+    аргументов загружается один раз, вызовы из фоновых потоков новых загрузок не порождают
+    """
+
+    def __init__(self, predict, workers=None, queue_size=None):
+        """
+        :param callable predict: Принимает аргументы и результат вызова, возвращает список наборов аргументов
+        :param int workers: Количество потоков, по умолчанию settings.PREFETCH_WORKERS, 0 - не загружать
+        :param int queue_size: Максимальное количество ожидающих загрузок, по умолчанию settings.PREFETCH_QUEUE_SIZE
+        """
+        self._predict = predict
+        self._workers = settings.PREFETCH_WORKERS if workers is None else workers
+        self._queue_size = settings.PREFETCH_QUEUE_SIZE if queue_size is None else queue_size
+        self._executor = None
+        self._futures = set()
+        self._scheduled = set()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._closed = False
+        self.prefetched = 0
+        self.dropped = 0
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args):
+            result = func(*args)
+            if self._workers > 0 and not getattr(self._local, 'prefetching', False):
+                self.schedule(func, args, result)
+            return result
+        return wrapper
+
+    def schedule(self, func, args, result):
+        """
+        Ставит в очередь загрузку аргументов, предсказанных по вызову
+        :param callable func: Функция загрузки
+        :param tuple args: Аргументы вызова
+        :param result: Результат вызова
+        """
+        try:
+            predicted = self._predict(args, result)
+        except Exception as e:
+            logger.warning('Failed to predict pages after {}: {}'.format(args, e))
+            return
+        for sibling in predicted:
+            sibling = tuple(sibling)
+            with self._lock:
+                if self._closed or sibling in self._scheduled:
+                    continue
+                if len(self._futures) >= self._queue_size:
+                    self.dropped += 1
+                    continue
+                self._scheduled.add(sibling)
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self._workers)
+                future = self._executor.submit(self._prefetch, func, sibling)
+                self._futures.add(future)
+            future.add_done_callback(self._done)
+
+    def wait(self, timeout=None):
+        """Дожидается завершения загрузок, поставленных в очередь"""
+        with self._lock:
+            futures = list(self._futures)
+        wait(futures, timeout=timeout)
+
+    def close(self):
+        """Отменяет ожидающие загрузки и дожидается выполняющихся"""
+        with self._lock:
+            self._closed = True
+            futures = list(self._futures)
+            executor = self._executor
+        for future in futures:
+            future.cancel()
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def _prefetch(self, func, args):
+        self._local.prefetching = True
+        try:
+            func(*args)
+            with self._lock:
+                self.prefetched += 1
+        except Exception as e:
+            logger.debug('Failed to prefetch {}: {}'.format(args, e))
+        finally:
+            self._local.prefetching = False
+
+    def _done(self, future):
+        with self._lock:
+            self._futures.discard(future)
@@ -0,0 +1,83 @@
+import errno
+import hashlib
+import json
+import os
+import threading
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+import settings
+
+Fixture = namedtuple('Fixture', ['url', 'status', 'headers', 'body', 'elapsed'])
+
+
+def fixture_key(url):
+    """
+    Возвращает ключ записанного ответа: хост, путь и строку запроса без протокола, например /f1news.ru/path?q=1.
+    Ключ имеет вид пути, поэтому локальный сервер отдает ответ каждого источника по пути с его хостом
+    :param str url: Абсолютный адрес или путь запроса
+    :return: str
+    """
+    parts = urlsplit(url)
+    path = '{}{}'.format(parts.path or '/', '?{}'.format(parts.query) if parts.query else '')
+    return '/{}{}'.format(parts.netloc, path) if parts.netloc else path
+
+
+class Recorder:
+    """
+    Сохраняет ответы на запросы (код, заголовки, тело и время ответа) в директорию
+    для последующего воспроизведения
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._lock = threading.Lock()
+
+    def record(self, url, status, headers, body, elapsed):
+        """
+        :param str url: Адрес запроса
+        :param int status: Код ответа
+        :param dict headers: Заголовки ответа
+        :param bytes body: Тело ответа
+        :param float elapsed: Время ответа в секундах
+        """
+        name = hashlib.sha1(fixture_key(url).encode('utf-8')).hexdigest()
+        meta = {'url': url, 'status': status, 'headers': dict(headers), 'elapsed': elapsed}
+        with self._lock:
+            try:
+                os.makedirs(self._path)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            with open(os.path.join(self._path, '{}.body'.format(name)), mode='wb') as fn:
+                fn.write(body)
+            with open(os.path.join(self._path, '{}.json'.format(name)), mode='w', encoding='utf-8') as fn:
+                json.dump(meta, fn, ensure_ascii=False)
+
+    def load(self):
+        """
+        Загружает все записанные ответы
+        :return: dict Ключ ответа (см. fixture_key) -> Fixture
+        """
+        fixtures = {}
+        if not os.path.isdir(self._path):
+            return fixtures
+        for file_name in os.listdir(self._path):
+            if not file_name.endswith('.json'):
+                continue
+            with open(os.path.join(self._path, file_name), encoding='utf-8') as fn:
+                meta = json.load(fn)
+            with open(os.path.join(self._path, file_name.replace('.json', '.body')), mode='rb') as fn:
+                body = fn.read()
+            fixtures[fixture_key(meta['url'])] = Fixture(
+                meta['url'], meta['status'], meta['headers'], body, meta['elapsed']
+            )
+        return fixtures
+
+
+_recorder = Recorder(settings.RECORD_PATH) if settings.RECORD_PATH else None
+
+
+def get_recorder():
+    """Возвращает Recorder, если включен режим записи ответов, иначе None"""
+    return _recorder
@@ -1,58 +1,188 @@
 import re
+import time
+from collections import namedtuple
+
 import requests
-from urllib.parse import urlencode, quote_plus
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlencode, urlparse, quote_plus
 from abc import ABC, abstractmethod
 
-from decorators.decorators import retry
+import settings
+from decorators.decorators import RetryBudget, retry
+from exceptions.exceptions import CircuitOpenException, HostCircuitOpenException
+from helpers.circuit_breaker import get_circuit_breaker
 from helpers.fields import CharField, DictionaryField, IntegerField, BooleanField
+from helpers.recorder import get_recorder
+from helpers.throttle import get_throttle
+from helpers.tracer import get_tracer
+
+RETRY_BUDGET = RetryBudget(settings.RETRY_BUDGET_RATIO, settings.RETRY_BUDGET_CAPACITY)
+
+# Ответ на запрос: текст, код ответа и валидаторы для условных запросов (заголовки ETag и Last-Modified)
+Page = namedtuple('Page', ['text', 'status', 'etag', 'last_modified'])
+
+
+class RequestContext:
+    """Параметры одного запроса, хранятся отдельно от экземпляра Request, чтобы он мог выполнять запросы параллельно"""
+    url = CharField(required=True)
+    params = DictionaryField(nullable=True)
+    headers = DictionaryField(nullable=True)
+    secure = BooleanField()
+    proxy = CharField(nullable=True)
+    attempts = IntegerField()
+
+    def __init__(self, url, *, params=None, headers=None, secure=True, proxy=None):
+        self.url = url
+        self.params = params
+        self.headers = headers
+        self.secure = secure
+        self.proxy = proxy
+        self.attempts = 0
 
 
 class Request(ABC):
-    _url = CharField(required=True)
     _params = DictionaryField(nullable=True)
     _headers = DictionaryField(nullable=True)
-    _secure = BooleanField()
-    proxy = CharField(nullable=True)  # TODO: Возможно стоит сделать отлельное поле для url адреса
+    proxy = CharField(nullable=True)
     timeout = IntegerField(required=True)
 
-    def __init__(self, timeout=3, proxy=None):
+    def __init__(self, timeout=3, proxy=None, pool_size=settings.HTTP_POOL_SIZE):
         self.timeout = timeout
         self.proxy = proxy
         self._params = None
         self._headers = None
+        self._session = self._create_session(pool_size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Закрывает все открытые соединения пула"""
+        self._session.close()
 
-    def get(self, *, params=None, headers=None, secure=True):
-        self._url = self.get_url()
-        self._secure = secure
+    def get(self, url=None, *, params=None, headers=None, secure=True, proxy=None):
+        """
+        Выполняет запрос, параметры, заголовки и прокси, переданные в метод, действуют только на этот запрос
+        :param str url: Адрес запроса, по умолчанию get_url()
+        :param dict params: Параметры запроса, по умолчанию параметры экземпляра
+        :param dict headers: Заголовки запроса, по умолчанию заголовки экземпляра
+        :param bool secure: Использовать https
+        :param str proxy: Адрес прокси, по умолчанию прокси экземпляра
+        :return: str
+        """
+        return self.get_page(url, params=params, headers=headers, secure=secure, proxy=proxy).text
+
+    def get_page(self, url=None, *, params=None, headers=None, secure=True, proxy=None):
+        """
+        Выполняет запрос так же, как get, но возвращает кроме текста код ответа и валидаторы.
+        На условный запрос (заголовки If-None-Match и If-Modified-Since) сайт может ответить 304 без тела
+        :return: Page
+        """
+        context = RequestContext(
+            url if url is not None else self.get_url(),
+            params=params if params is not None else self._params,
+            headers=headers if headers is not None else self._headers,
+            secure=secure,
+            proxy=proxy if proxy is not None else self.proxy,
+        )
+        return self._do_get_request(context)
+
+    def get_full_url(self, url=None, params=None):
+        url = re.sub(r'/?$', '', url if url is not None else self.get_url())
+        params = params if params is not None else self._params
         if params is not None:
-            self._params = params
-        if headers is not None:
-            self._headers = headers
-        return self._do_get_request()
-
-    def get_full_url(self):
-        url = re.sub(r'/?$', '', self.get_url())
-        if self._params is not None:
-            return '{}?{}'.format(url, urlencode(self._params, quote_via=quote_plus))
+            return '{}?{}'.format(url, urlencode(params, quote_via=quote_plus))
         return url
 
     @abstractmethod
     def get_url(self):
         """Returns request url"""
 
-    @retry(requests.RequestException)
-    def _do_get_request(self):
-        # TODO: Логировать все запросы в файл
-        protocol = 'https' if self._secure else 'http'
-
-        response = requests.get(
-            url=self._url,
-            timeout=self.timeout,
-            params=self._params,
-            headers=self._headers,
-            proxies={protocol: self.proxy}
+    @retry(requests.RequestException, budget=RETRY_BUDGET)
+    def _do_get_request(self, context):
+        protocol = 'https' if context.secure else 'http'
+        host = urlparse(context.url).netloc
+        context.attempts += 1
+
+        # Ошибки соединения через прокси говорят о проблемах прокси, а не сайта, без прокси - о проблемах сайта
+        host_breaker = get_circuit_breaker('host:{}'.format(host))
+        proxy_breaker = get_circuit_breaker('proxy:{}'.format(context.proxy)) if context.proxy else None
+        if proxy_breaker is not None:
+            proxy_breaker.allow()
+        try:
+            host_breaker.allow()
+        except CircuitOpenException as e:
+            raise HostCircuitOpenException(str(e)) from None
+
+        queued_at = time.monotonic()
+        started_at = queued_at
+        received_at = None
+        try:
+            with get_throttle(host).slot() as slot:
+                started_at = time.monotonic()
+                response = self._session.get(
+                    url=context.url,
+                    timeout=self.timeout,
+                    params=context.params,
+                    headers=context.headers,
+                    proxies={protocol: context.proxy},
+                    stream=True,
+                )
+                received_at = time.monotonic()
+                content = response.content
+                slot.record(response)
+        except requests.RequestException as e:
+            (proxy_breaker or host_breaker).record_failure()
+            finished_at = time.monotonic()
+            get_tracer().trace_fetch(
+                context.url,
+                proxy=context.proxy,
+                attempt=context.attempts,
+                wait=started_at - queued_at,
+                ttfb=received_at - started_at if received_at is not None else None,
+                total=finished_at - queued_at,
+                error=type(e).__name__,
+            )
+            raise
+
+        finished_at = time.monotonic()
+        recorder = get_recorder()
+        if recorder is not None:
+            url = (response.history[0] if response.history else response).url
+            recorder.record(url, response.status_code, response.headers, content, finished_at - started_at)
+        get_tracer().trace_fetch(
+            context.url,
+            proxy=context.proxy,
+            attempt=context.attempts,
+            status=response.status_code,
+            wait=started_at - queued_at,
+            ttfb=received_at - started_at,
+            download=finished_at - received_at,
+            total=finished_at - queued_at,
+            size=len(content),
         )
 
+        if proxy_breaker is not None:
+            proxy_breaker.record_success()
+        if response.status_code >= 500:
+            host_breaker.record_failure()
+        else:
+            host_breaker.record_success()
+
         response.raise_for_status()
 
-        return response.text
+        return Page(
+            response.text, response.status_code, response.headers.get('ETag'), response.headers.get('Last-Modified')
+        )
+
+    @staticmethod
+    def _create_session(pool_size):
+        """Создает сессию, переиспользующую keep-alive соединения (не более pool_size на каждый хост)"""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
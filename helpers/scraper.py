@@ -1,62 +1,199 @@
 import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 import requests
 
 import settings
-from exceptions.exceptions import ProxyScraperException
+from exceptions.exceptions import CircuitOpenException, HostCircuitOpenException, ProxyScraperException
 from helpers.fields import CharField, IntegerField
 from helpers.request import Request
 from proxy.proxy_manager import ProxyManager
 
 
 class Scraper(Request):
-    _path = CharField(required=False)
     _port = IntegerField(nullable=True)
     _protocol = CharField(required=True)
 
-    def __init__(self, host, *, protocol='http', port=None, proxy=None, timeout=3):
-        super().__init__(timeout, proxy)
-        self._host = host.lower().strip()
+    def __init__(self, host, *, protocol='http', port=None, proxy=None, timeout=3, pool_size=settings.HTTP_POOL_SIZE):
+        super().__init__(timeout, proxy, pool_size)
+        self._host = re.sub(r'^http[s]?://(.*?)/?$', r'\1', host.lower().strip())
         self._protocol = protocol.lower()
         self._port = port
         self.proxy = proxy
         if self._protocol not in ('http', 'https',):
             raise ValueError('Unsupported protocol `{}`. You must use `http` or `https` only'.format(protocol))
 
-    def scrape(self, uri='', *, params=None, headers=None):
-        self._path = re.sub(r'^/?(.*?)/?$', r'\1', uri.lower().strip())
+    def scrape(self, uri='', *, params=None, headers=None, proxy=None):
+        return self.scrape_page(uri, params=params, headers=headers, proxy=proxy).text
+
+    def scrape_page(self, uri='', *, params=None, headers=None, proxy=None):
         secure = self._protocol == 'https'
-        return self.get(params=params, headers=headers, secure=secure)
+        return self.get_page(self.get_url(uri), params=params, headers=headers, secure=secure, proxy=proxy)
 
-    def get_url(self):
-        if self._host.startswith('http'):
-            self._host = re.sub(r'^http[s]?://(.*?)/?$', r'\1', self._host)
+    def get_full_url(self, uri='', params=None):
+        return super().get_full_url(self.get_url(uri), params)
+
+    def get_url(self, uri=''):
+        path = re.sub(r'^/?(.*?)/?$', r'\1', uri.lower().strip())
         url = '{}://{}{}'.format(self._protocol, self._host, ':{}'.format(self._port) if self._port is not None else '')
-        return '{}/{}'.format(url, re.sub(r'^/', '', self._path))
+        return '{}/{}'.format(url, path)
 
 
 class ProxyScraper:
-    def __init__(self, host, *, protocol='http', port=None, timeout=10, retries=10):
+    def __init__(self, host, *, protocol='http', port=None, timeout=10, retries=10, pool_size=settings.HTTP_POOL_SIZE,
+                 hedge=False, hedge_direct=False):
+        """
+        :param bool hedge: Если ответ не получен за время, превышающее заданный перцентиль времени ответа
+            (settings.HEDGE_PERCENTILE), то дублировать запрос через другой прокси и вернуть первый ответ
+        :param bool hedge_direct: Дублировать запрос напрямую без прокси, если в пуле нет другого прокси
+        """
         proxy_scraper = Scraper(settings.PROXY_CATALOG_DOMAIN, protocol=settings.PROXY_CATALOG_PROTOCOL)
-        self._proxy_manager = ProxyManager(proxy_scraper)
+        # При воспроизведении записанных ответов каталог и статистика реальных прокси не используются и не сохраняются
+        self._proxy_manager = ProxyManager(proxy_scraper, cache_prefix=None if settings.REPLAY_URL else 'proxies')
+        # Текущий прокси общий для всех потоков, заменяется только через _swap_proxy
         self._proxy = None
+        self._proxy_lock = threading.Lock()
         self._retries = retries
-        self._scraper = Scraper(host, protocol=protocol, port=port, timeout=timeout)
+        self._scraper = Scraper(host, protocol=protocol, port=port, timeout=timeout, pool_size=pool_size)
+        self._hedge = hedge
+        self._hedge_direct = hedge_direct
+        self._latencies = deque(maxlen=settings.HEDGE_HISTORY_SIZE)
+        # На каждый запрос приходится основной и дублирующий запросы
+        self._hedge_executor = ThreadPoolExecutor(max_workers=2 * pool_size) if hedge else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if self._hedge_executor is not None:
+            # Дожидаемся проигравших дублирующих запросов, чтобы они не использовали закрытое соединение
+            self._hedge_executor.shutdown()
+        self._scraper.close()
+        self._proxy_manager.close()
 
     def scrape(self, uri='', *, params=None, headers=None):
-        if self._proxy is None:
-            self._proxy = self._proxy_manager.get_proxy()
-            if not self._proxy:
+        return self._scrape(self._scraper.scrape, uri, params, headers)
+
+    def scrape_page(self, uri='', *, params=None, headers=None):
+        """Аналог Scraper.scrape_page"""
+        return self._scrape(self._scraper.scrape_page, uri, params, headers)
+
+    def _scrape(self, fetch, uri, params, headers):
+        """
+        :param callable fetch: Метод скрапера, выполняющий запрос через заданный прокси
+        """
+        if self._hedge:
+            return self._hedged_scrape(fetch, uri, params, headers)
+        return self._retry_scrape(fetch, uri, params, headers, self._current_proxy())
+
+    def _retry_scrape(self, fetch, uri, params, headers, proxy):
+        """
+        Выполняет запрос, при ошибках соединения переключаясь на другой прокси
+        :param str proxy: Прокси для первой попытки
+        """
+        # Прокси и количество попыток переподключения свои у каждого запроса, общий текущий прокси только обновляется
+        retries = self._retries
+        while True:
+            if not proxy:
                 raise ProxyScraperException('Proxy not found')
-            self._scraper.proxy = self._proxy
+            started = time.monotonic()
+            try:
+                data = fetch(uri, params=params, headers=headers, proxy=proxy)
+            except HostCircuitOpenException:
+                # Недоступен сайт, а не прокси, поэтому другой прокси не поможет
+                raise
+            except (requests.ConnectionError, requests.ReadTimeout, CircuitOpenException) as e:
+                if retries == 0:
+                    raise ProxyScraperException('Ended attempts to proxy reconnect. Reason `{}`'.format(e))
+                self._proxy_manager.report_failure(proxy)
+                retries -= 1
+                failed, proxy = proxy, self._proxy_manager.get_proxy(exclude=(proxy,))
+                self._swap_proxy(failed, proxy)
+                continue
+            self._report_success(proxy, time.monotonic() - started)
+            return data
+
+    def _hedged_scrape(self, fetch, uri, params, headers):
+        primary_proxy = self._current_proxy()
+        if not primary_proxy:
+            raise ProxyScraperException('Proxy not found')
+        primary = self._hedge_executor.submit(self._scrape_via, fetch, primary_proxy, uri, params, headers)
+        attempts = {primary: primary_proxy}
+        done, _ = wait(attempts, timeout=self._hedge_delay())
+        if done and isinstance(primary.exception(), HostCircuitOpenException):
+            # Недоступен сайт, а не прокси, поэтому дублировать запрос бессмысленно
+            raise primary.exception()
+        if not done or primary.exception() is not None:
+            hedge_proxy = self._proxy_manager.get_proxy(exclude=(primary_proxy,))
+            if hedge_proxy or self._hedge_direct:
+                hedge = self._hedge_executor.submit(self._scrape_via, fetch, hedge_proxy, uri, params, headers)
+                attempts[hedge] = hedge_proxy
+        pending = set(attempts)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                error = future.exception()
+                if error is None or isinstance(error, HostCircuitOpenException):
+                    # Проигравший запрос прервать нельзя, поэтому отменяем его, если он еще не начат,
+                    # а его результат просто игнорируется
+                    for loser in pending:
+                        loser.cancel()
+                    if error is not None:
+                        raise error
+                    if attempts[future] is not None:
+                        self._swap_proxy(primary_proxy, attempts[future])
+                    return future.result()
+        # Оба запроса завершились ошибкой, дальше прокси перебираются так же, как без дублирования
+        proxy = self._proxy_manager.get_proxy(exclude=[proxy for proxy in attempts.values() if proxy is not None])
+        self._swap_proxy(primary_proxy, proxy)
+        return self._retry_scrape(fetch, uri, params, headers, proxy)
+
+    def _current_proxy(self):
+        """Возвращает текущий прокси, если его еще нет, то выбирает новый"""
+        proxy = self._proxy
+        if proxy is None:
+            proxy = self._proxy_manager.get_proxy()
+            self._swap_proxy(None, proxy)
+        return proxy
+
+    def _swap_proxy(self, expected, proxy):
+        """
+        Заменяет текущий прокси, только если его не заменил другой поток: иначе запрос, переключившийся
+        на другой прокси, мог бы вернуть в работу прокси, который другой поток уже признал неработающим
+        :param str expected: Прокси, с которым работал запрос
+        :param str proxy: Новый прокси
+        """
+        with self._proxy_lock:
+            if self._proxy == expected:
+                self._proxy = proxy
+
+    def _scrape_via(self, fetch, proxy, uri, params, headers):
+        started = time.monotonic()
         try:
-            return self._scraper.scrape(uri, params=params, headers=headers)
-        except (requests.ConnectionError, requests.ReadTimeout) as e:
-            if self._retries == 0:
-                raise ProxyScraperException('Ended attempts to proxy reconnect. Reason `{}`'.format(e))
-            self._proxy_manager.forget_proxy(self._proxy)
-            self._retries -= 1
-            self._proxy = None
-            return self.scrape(uri, params=params, headers=headers)
-        except Exception as e:
-            ProxyScraperException(e)
+            data = fetch(uri, params=params, headers=headers, proxy=proxy)
+        except HostCircuitOpenException:
+            raise
+        except (requests.RequestException, CircuitOpenException):
+            if proxy is not None:
+                self._proxy_manager.report_failure(proxy)
+            raise
+        self._report_success(proxy, time.monotonic() - started)
+        return data
+
+    def _report_success(self, proxy, latency):
+        self._latencies.append(latency)
+        if proxy is not None:
+            self._proxy_manager.report_success(proxy, latency)
+
+    def _hedge_delay(self):
+        """Время ожидания ответа (в секундах), после которого запрос дублируется"""
+        latencies = sorted(self._latencies)
+        if len(latencies) < settings.HEDGE_MIN_SAMPLES:
+            return settings.HEDGE_DEFAULT_DELAY
+        return latencies[min(int(len(latencies) * settings.HEDGE_PERCENTILE), len(latencies) - 1)]
@@ -0,0 +1,45 @@
+import pickle
+import unittest
+
+from helpers import cache_format
+
+HTML = '<tr><td>Льюис Хэмилтон</td><td>Mercedes</td><td>1:32.123</td></tr>' * 50
+
+
+class TestCacheFormat(unittest.TestCase):
+    def test_dump_and_load_values(self):
+        for value in (HTML, '', b'\x00\x01', [1, 2, 3], {'test': (1, 2)}, {1, 2}, 1.5, None):
+            self.assertEqual(value, cache_format.loads(cache_format.dumps(value)))
+
+    def test_compress_text(self):
+        data = cache_format.dumps(HTML)
+        self.assertTrue(data.startswith(cache_format.MAGIC))
+        self.assertLess(len(data) * 8, len(HTML.encode('utf-8')))
+        self.assertEqual(len(HTML.encode('utf-8')), cache_format.raw_size(data))
+
+    def test_skip_compression(self):
+        self.assertEqual(cache_format.HEADER.size + 4, len(cache_format.dumps('test')))
+        data = cache_format.dumps(HTML, level=0)
+        self.assertEqual(cache_format.HEADER.size + len(HTML.encode('utf-8')), len(data))
+        self.assertEqual(HTML, cache_format.loads(data))
+
+    def test_load_legacy_values(self):
+        data = pickle.dumps({'test': 1}, cache_format.LEGACY_PICKLE_PROTOCOL)
+        self.assertTrue(cache_format.is_legacy(data))
+        self.assertEqual({'test': 1}, cache_format.loads(data))
+        self.assertEqual(len(data), cache_format.raw_size(data))
+        self.assertFalse(cache_format.is_legacy(cache_format.dumps({'test': 1})))
+
+    def test_raise_exception_if_corrupted(self):
+        data = cache_format.dumps('test', level=0)
+        with self.assertRaises(ValueError) as context:
+            cache_format.loads(data[:-1])
+        self.assertEqual('Corrupted cache value', str(context.exception))
+        data = cache_format.HEADER.pack(cache_format.MAGIC, 3, cache_format.TYPE_TEXT, 0, 0)
+        with self.assertRaises(ValueError) as context:
+            cache_format.loads(data)
+        self.assertEqual('Unsupported cache format version 3', str(context.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import re
+import unittest
+
+from helpers.cache_key import KEY_VERSION, encode, make_key
+
+
+class TestCacheKey(unittest.TestCase):
+    def test_key_format(self):
+        key = make_key('scraped_data', ('f1news.ru', 'Championship/2017/'))
+        self.assertRegex(key, r'^scraped_data-v{}-[0-9a-f]{{32}}$'.format(KEY_VERSION))
+        self.assertEqual(key, make_key('scraped_data', ['f1news.ru', 'Championship/2017/']))
+        self.assertNotEqual(key, make_key('parsed_data', ('f1news.ru', 'Championship/2017/')))
+
+    def test_no_collisions(self):
+        values = [
+            ('ab', 'c'), ('a', 'bc'), ('abc',), (1,), ('1',), (1.0,), (True,), (None,), ((),), ([],), ({},),
+            (('a', 'b'),), (['a', 'b'],), ({'a': 'b'},), ({'a', 'b'},), (b'ab',), ((1, (2, 3)),), ((1, 2, 3),),
+        ]
+        self.assertEqual(len(values), len({encode(value) for value in values}))
+
+    def test_ignore_order_of_unordered_values(self):
+        self.assertEqual(encode({'a': 1, 'b': 2}), encode({'b': 2, 'a': 1}))
+        self.assertEqual(encode({3, 'a', 1}), encode({1, 3, 'a'}))
+        self.assertEqual(encode([2, 1, 'a']), encode(['a', 1, 2]))
+        self.assertNotEqual(encode((2, 1)), encode((1, 2)))
+
+    def test_do_not_change_arguments(self):
+        arg = [3, 1, 2]
+        make_key('test', (arg,))
+        self.assertEqual([3, 1, 2], arg)
+
+    def test_unsupported_type_exception(self):
+        with self.assertRaises(TypeError) as context:
+            make_key('test', (object(),))
+        self.assertEqual('Unsupported cache key argument type `object`', str(context.exception))
+        self.assertTrue(re.match(r'^[\w.-]+$', make_key('test', ('../..',))))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import time
+import unittest
+
+from helpers import cache_format
+from helpers.cache_manager import MISSING, cache_counters, compact, migrate, stats, warmup
+from helpers.cacher import Cacher, cache_prefixes
+from helpers.memory_cache import get_memory_cache
+
+
+class TestMigrate(unittest.TestCase):
+    cache_prefix = 'test'
+
+    def setUp(self):
+        self.c = Cacher(self.cache_prefix)
+        self.test_dir = self.c._directory_path
+        os.makedirs(self.test_dir)
+
+    def tearDown(self):
+        if os.path.isdir(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        get_memory_cache().clear()
+
+    def _read(self, key):
+        with open(os.path.join(self.test_dir, key), mode='rb') as fn:
+            return fn.read()
+
+    def test_migrate_legacy_values(self):
+        with open(os.path.join(self.test_dir, 'legacy'), mode='wb') as fn:
+            pickle.dump('<html>test</html>', fn, cache_format.LEGACY_PICKLE_PROTOCOL)
+        self.c.put('current', [1, 2, 3])
+        current = self._read('current')
+
+        self.assertIn(self.cache_prefix, cache_prefixes())
+        self.assertEqual({self.cache_prefix: 1}, migrate([self.cache_prefix]))
+        self.assertFalse(cache_format.is_legacy(self._read('legacy')))
+        self.assertEqual(current, self._read('current'))
+        self.assertEqual('<html>test</html>', Cacher(self.cache_prefix).get('legacy'))
+        self.assertEqual({self.cache_prefix: 0}, migrate([self.cache_prefix]))
+
+
+class TestStats(unittest.TestCase):
+    cache_prefix = 'test'
+
+    def setUp(self):
+        self.c = Cacher(self.cache_prefix)
+        self.test_dir = self.c._directory_path
+        self._dir = tempfile.mkdtemp()
+        self.trace_path = os.path.join(self._dir, 'trace.jsonl')
+
+    def tearDown(self):
+        if os.path.isdir(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        shutil.rmtree(self._dir)
+        get_memory_cache().clear()
+
+    def _write_summaries(self, *caches):
+        with open(self.trace_path, mode='w', encoding='utf-8') as f:
+            f.write(json.dumps({'event': 'cache', 'prefix': self.cache_prefix, 'hit': True}) + '\n')
+            for cache in caches:
+                f.write(json.dumps({'event': 'summary', 'fetches': 0, 'cache': cache}) + '\n')
+
+    def test_cache_counters(self):
+        self._write_summaries(
+            {self.cache_prefix: {'hits': 100, 'misses': 100}},
+            {self.cache_prefix: {'hits': 1, 'misses': 2, 'evictions': 3}},
+            {self.cache_prefix: {'hits': 10, 'misses': 20, 'evictions': 30}, 'other': {'hits': 5, 'misses': 0}},
+        )
+        counters = cache_counters(self.trace_path, runs=2)
+        self.assertEqual({'hits': 11, 'misses': 22, 'evictions': 33}, counters[self.cache_prefix])
+        self.assertEqual({'hits': 5, 'misses': 0, 'evictions': 0}, counters['other'])
+        self.assertEqual({}, cache_counters(os.path.join(self._dir, 'missing.jsonl')))
+
+    def test_stats(self):
+        self._write_summaries({self.cache_prefix: {'hits': 3, 'misses': 1, 'evictions': 0}})
+        self.c.put('small', 'test')
+        self.c.put('large', 'test' * 1000)
+        day_ago = time.time() - 24 * 3600 - 1
+        os.utime(os.path.join(self.test_dir, 'large'), (day_ago, day_ago))
+        prefix_stats = stats([self.cache_prefix], top=1, trace_path=self.trace_path)[self.cache_prefix]
+        self.assertEqual(2, prefix_stats['entries'])
+        self.assertEqual(4004, prefix_stats['raw_size'])
+        self.assertLess(prefix_stats['size'], prefix_stats['raw_size'])
+        self.assertEqual(
+            {'<1h': 1, '<1d': 0, '<7d': 1, '<30d': 0, '>=30d': 0}, dict(prefix_stats['ages'])
+        )
+        self.assertEqual(['large'], [key for key, _ in prefix_stats['largest']])
+        self.assertEqual((3, 1, 0), (prefix_stats['hits'], prefix_stats['misses'], prefix_stats['evictions']))
+
+    def test_compact(self):
+        self.c.put('f', 'test')
+        with open(os.path.join(self.test_dir, 'corrupted'), mode='wb') as fn:
+            fn.write(b'corrupted')
+        self.assertEqual({self.cache_prefix: {'corrupted': 1, 'temporary': 0, 'evicted': 0}},
+                         compact([self.cache_prefix]))
+        self.assertEqual(['f'], self.c.keys())
+
+    def test_warmup(self):
+        states = {('f1news.ru', 'cached'): 'fresh', ('f1news.ru', 'old'): 'stale'}
+        self.assertEqual(
+            [('cached', 'fresh'), ('old', 'stale'), ('new', MISSING)],
+            list(warmup(lambda *args: states.get(args), ['cached', 'old', 'new'], 'f1news.ru').items())
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
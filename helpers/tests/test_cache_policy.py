@@ -0,0 +1,34 @@
+import unittest
+
+from helpers.cache_policy import (
+    EXPIRED, FRESH, PERMANENT, STALE, CachePolicies, stale_while_revalidate, ttl_policy
+)
+
+
+class TestCachePolicy(unittest.TestCase):
+    def test_permanent(self):
+        self.assertEqual(FRESH, PERMANENT.state(10 ** 9))
+
+    def test_ttl(self):
+        policy = ttl_policy(10)
+        self.assertEqual(FRESH, policy.state(9))
+        self.assertEqual(EXPIRED, policy.state(10))
+
+    def test_stale_while_revalidate(self):
+        policy = stale_while_revalidate(10, 20)
+        self.assertEqual(FRESH, policy.state(9))
+        self.assertEqual(STALE, policy.state(10))
+        self.assertEqual(STALE, policy.state(29))
+        self.assertEqual(EXPIRED, policy.state(30))
+        self.assertEqual(STALE, stale_while_revalidate(10).state(10 ** 9))
+
+    def test_select_policy_by_pattern(self):
+        live = ttl_policy(10)
+        policies = CachePolicies([(r'^Championship/2018/', live)], default=PERMANENT)
+        self.assertIs(live, policies.select(['f1news.ru', 'Championship/2018/']))
+        self.assertIs(PERMANENT, policies.select(['f1news.ru', 'Championship/2017/']))
+        self.assertIs(PERMANENT, policies.select([1, None]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from helpers import cache_format, cache_snapshot
+from helpers.cache_manager import export
+from helpers.cache_snapshot import SnapshotBackend, write_snapshot
+from helpers.cacher import Cacher
+from helpers.memory_cache import get_memory_cache
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self.path = os.path.join(self._dir, 'test.snapshot')
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_write_and_read(self):
+        records = [('key{}'.format(n), cache_format.dumps(n), 1000.0 + n) for n in range(100)]
+        self.assertEqual(100, write_snapshot(self.path, reversed(records)))
+        snapshot = SnapshotBackend(self.path)
+        try:
+            for key, data, stored_at in records:
+                self.assertEqual((data, stored_at), snapshot.get(key))
+            self.assertIsNone(snapshot.get('key100'))
+            self.assertIsNone(snapshot.get(''))
+            self.assertTrue(snapshot.has('key0'))
+            self.assertEqual(sorted(key for key, _, _ in records), snapshot.keys())
+            self.assertEqual(['key1', 'key2'], sorted(snapshot.get_many(['key1', 'key2', 'missing'])))
+            self.assertEqual(('key0', len(records[0][1]), 1000.0, 1000.0), snapshot.entries()[0])
+        finally:
+            snapshot.close()
+        self.assertEqual(['test.snapshot'], os.listdir(self._dir))
+
+    def test_empty_snapshot(self):
+        self.assertEqual(0, write_snapshot(self.path, []))
+        snapshot = SnapshotBackend(self.path)
+        try:
+            self.assertIsNone(snapshot.get('key'))
+            self.assertEqual([], snapshot.keys())
+        finally:
+            snapshot.close()
+
+    def test_incorrect_snapshot_exception(self):
+        with open(self.path, mode='wb') as fn:
+            fn.write(b'\0' * 64)
+        with self.assertRaises(ValueError):
+            SnapshotBackend(self.path)
+
+
+class TestCacherSnapshot(unittest.TestCase):
+    cache_prefix = 'test'
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        patcher = mock.patch('settings.CACHE_SNAPSHOTS_PATH', self._dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.c = Cacher(self.cache_prefix)
+        self.test_dir = self.c._directory_path
+
+    def tearDown(self):
+        for snapshot in cache_snapshot._snapshots.values():
+            snapshot.close()
+        cache_snapshot._snapshots.clear()
+        if os.path.isdir(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        shutil.rmtree(self._dir)
+        get_memory_cache().clear()
+
+    def test_read_values_from_snapshot(self):
+        self.c.put('a', {'test': 1})
+        self.c.put('b', 'test')
+        self.assertEqual({self.cache_prefix: 2}, export([self.cache_prefix]))
+        shutil.rmtree(self.test_dir)
+        get_memory_cache().clear()
+
+        c = Cacher(self.cache_prefix)
+        self.assertEqual({'test': 1}, c.get('a'))
+        self.assertEqual({'a': {'test': 1}, 'b': 'test'}, c.get_many(['a', 'b', 'c']))
+        self.assertTrue(c.has('b'))
+        self.assertFalse(c.put('a', 'new'))
+        self.assertEqual(['a', 'b'], sorted(c.keys()))
+        self.assertFalse(os.path.isdir(self.test_dir))
+
+    def test_write_over_snapshot(self):
+        self.c.put('a', 'old')
+        self.c.put('b', 'old')
+        self.c.export()
+        shutil.rmtree(self.test_dir)
+        get_memory_cache().clear()
+
+        c = Cacher(self.cache_prefix)
+        self.assertTrue(c.put('c', 'new'))
+        self.assertTrue(c.update('a', 'new'))
+        with mock.patch('time.time', return_value=2000000000.0):
+            self.assertTrue(c.touch('b'))
+        get_memory_cache().clear()
+        self.assertEqual('new', c.get('a'))
+        self.assertEqual(['a', 'b', 'c'], sorted(os.listdir(self.test_dir)))
+        self.assertEqual(['a', 'b', 'c'], sorted(c.keys()))
+        self.assertEqual(3, c.export())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,15 @@
+import multiprocessing
 import os
 import shutil
+import sqlite3
+import tempfile
+import threading
 import unittest
+from unittest import mock
 
-from helpers import cacher
+from helpers import cache_format, cacher
+from helpers.cache_backends import SQLiteDatabase
+from helpers.memory_cache import get_memory_cache
 
 
 class TestCacher(unittest.TestCase):
@@ -15,6 +22,7 @@ class TestCacher(unittest.TestCase):
     def tearDown(self):
         if os.path.isdir(self.test_dir):
             shutil.rmtree(self.test_dir)
+        get_memory_cache().clear()
 
     def test_put(self):
         self.c._directory_path = self.test_dir
@@ -128,6 +136,272 @@ class TestCacher(unittest.TestCase):
             cacher.Cacher('../root')
         self.assertEqual('Incorrect cache prefix', str(context.exception))
 
+    def test_put_many_and_get_many(self):
+        self.c.put('f', 'old')
+        self.assertEqual(['f2'], self.c.put_many({'f': 'test', 'f2': 'test2'}))
+        self.assertEqual({'f': 'old', 'f2': 'test2'}, self.c.get_many(['f', 'f2', 'f3']))
+        self.assertEqual(['f', 'f2'], sorted(self.c.keys()))
+
+    def test_serve_repeated_reads_from_memory(self):
+        self.c.put('f', [1, 2, 3])
+        c2 = cacher.Cacher(self.cache_prefix)
+        with mock.patch.object(c2._backend, 'get') as backend_get:
+            self.assertEqual([1, 2, 3], c2.get('f'))
+            self.assertEqual([1, 2, 3], c2.get('f'))
+        backend_get.assert_not_called()
+
+    def test_read_value_from_storage_once(self):
+        self.c.put('f', 'test')
+        get_memory_cache().clear()
+        hits = get_memory_cache().stats()['hits']
+        with mock.patch('helpers.cacher.cache_format.loads', wraps=cache_format.loads) as loads:
+            for _ in range(3):
+                self.assertEqual('test', self.c.get('f'))
+        self.assertEqual(1, loads.call_count)
+        self.assertEqual(hits + 2, get_memory_cache().stats()['hits'])
+
+    def test_forget_deleted_values(self):
+        self.c.put('f', 'test')
+        self.c.delete('f')
+        self.assertIsNone(self.c.get('f'))
+        self.c.put('f', 'test')
+        self.c.flush()
+        self.assertIsNone(self.c.get('f'))
+        self.assertFalse(self.c.has('f'))
+
+    def test_get_entry(self):
+        self.assertIsNone(self.c.get_entry('f'))
+        with mock.patch('time.time', return_value=1000.0):
+            self.c.put('f', 'test')
+        self.assertEqual(('test', 1000.0), self.c.get_entry('f'))
+        get_memory_cache().clear()
+        value, stored_at = self.c.get_entry('f')
+        self.assertEqual('test', value)
+        self.assertAlmostEqual(os.path.getmtime(os.path.join(self.test_dir, 'f')), stored_at)
+
+    def test_write_values_atomically(self):
+        self.c.put('f', 'test')
+        self.c.update('f', 'test2')
+        with open(os.path.join(self.test_dir, '.tmp-crashed'), mode='wb') as fn:
+            fn.write(b'partial')
+        self.assertEqual(['f'], self.c.keys())
+        self.assertEqual(['.tmp-crashed', 'f'], sorted(os.listdir(self.test_dir)))
+
+    def test_concurrent_processes(self):
+        context = multiprocessing.get_context('fork')
+        values = ['{}'.format(n) * 100000 for n in range(4)]
+        processes = [context.Process(target=write_values, args=(self.cache_prefix, value)) for value in values]
+        for process in processes:
+            process.start()
+        reader = cacher.Cacher(self.cache_prefix)
+        while any(process.is_alive() for process in processes):
+            get_memory_cache().clear()
+            self.assertIn(reader.get('f'), values + [None])
+        for process in processes:
+            process.join()
+            self.assertEqual(0, process.exitcode)
+        self.assertEqual(['f'], os.listdir(self.test_dir))
+
+    def test_evict_least_recently_used_values(self):
+        for key in ('a', 'b', 'c'):
+            self.c.put(key, os.urandom(1000))
+            os.utime(os.path.join(self.test_dir, key), (500, 500))
+        self.c.get('a')
+        get_memory_cache().clear()
+        self.assertEqual(1, self.c.evict(2100))
+        self.assertEqual(['a', 'c'], sorted(self.c.keys()))
+        self.assertIsNone(self.c.get('b'))
+        self.assertAlmostEqual(500, os.path.getmtime(os.path.join(self.test_dir, 'a')))
+
+    def test_save_access_times_of_all_cachers(self):
+        self.c.put('a', 'test')
+        os.utime(os.path.join(self.test_dir, 'a'), (500, 500))
+        # Значение читается из памяти, поэтому время обращения пока только накоплено
+        self.c.get('a')
+        self.assertAlmostEqual(500, os.path.getatime(os.path.join(self.test_dir, 'a')))
+        cacher.sync_all()
+        self.assertGreater(os.path.getatime(os.path.join(self.test_dir, 'a')), 500)
+        self.assertAlmostEqual(500, os.path.getmtime(os.path.join(self.test_dir, 'a')))
+
+    def test_evict_values_over_quota(self):
+        with mock.patch('settings.CACHE_QUOTAS', {self.cache_prefix: 3500}):
+            c = cacher.Cacher(self.cache_prefix)
+            for key, accessed_at in (('a', 3000), ('b', 1000), ('c', 2000)):
+                c.put(key, os.urandom(1000))
+                os.utime(os.path.join(self.test_dir, key), (accessed_at, 500))
+            self.assertEqual(['a', 'b', 'c'], sorted(c.keys()))
+            c.put('d', os.urandom(1000))
+            self.assertEqual(['a', 'c', 'd'], sorted(c.keys()))
+            self.assertEqual(0, c.enforce_quota())
+
+    def test_compact(self):
+        self.c.put('f', 'test')
+        for name, data in (('corrupted', cache_format.dumps('test')[:-1]), ('.tmp-old', b''), ('.tmp-new', b'')):
+            with open(os.path.join(self.test_dir, name), mode='wb') as fn:
+                fn.write(data)
+        os.utime(os.path.join(self.test_dir, '.tmp-old'), (500, 500))
+        self.assertEqual({'corrupted': 1, 'temporary': 1, 'evicted': 0}, self.c.compact())
+        self.assertEqual(['.tmp-new', 'f'], sorted(os.listdir(self.test_dir)))
+        self.assertEqual('test', self.c.get('f'))
+
+    def test_unknown_backend_exception(self):
+        with self.assertRaises(ValueError) as context:
+            cacher.Cacher(self.cache_prefix, 'memcached')
+        self.assertEqual('Unknown cache backend `memcached`', str(context.exception))
+
+
+def write_values(prefix, value):
+    c = cacher.Cacher(prefix)
+    for _ in range(20):
+        if not c.put('f', value):
+            c.update('f', value)
+        c.delete('f')
+        c.put('f', value)
+
+
+class TestSQLiteCacher(unittest.TestCase):
+    cache_prefix = 'test'
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self.db = SQLiteDatabase(os.path.join(self._dir, 'cache.sqlite3'))
+        patcher = mock.patch('helpers.cacher.get_sqlite_database', return_value=self.db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.c = cacher.Cacher(self.cache_prefix, cacher.SQLITE_BACKEND)
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self._dir)
+        get_memory_cache().clear()
+
+    def test_put_and_get(self):
+        self.assertTrue(self.c.put('f', {'test1': 1, 'test2': [1, 2]}))
+        self.assertFalse(self.c.put('f', 'test'))
+        c2 = cacher.Cacher(self.cache_prefix, cacher.SQLITE_BACKEND)
+        self.assertEqual({'test1': 1, 'test2': [1, 2]}, c2.get('f'))
+        self.assertIsNone(c2.get('f2'))
+        self.assertEqual(['cache.sqlite3'], [name for name in os.listdir(self._dir) if name.endswith('sqlite3')])
+
+    def test_has_update_delete(self):
+        self.assertFalse(self.c.update('f', 'test'))
+        self.c.put('f', 'test')
+        self.assertTrue(self.c.has('f'))
+        self.assertTrue(self.c.update('f', 'test2'))
+        self.assertEqual('test2', self.c.get('f'))
+        self.assertTrue(self.c.delete('f'))
+        self.assertFalse(self.c.delete('f'))
+        self.assertFalse(self.c.has('f'))
+
+    def test_prefixes_are_isolated(self):
+        other = cacher.Cacher('other', cacher.SQLITE_BACKEND)
+        self.c.put('f', 'test')
+        other.put('f', 'other')
+        self.assertTrue(self.c.flush())
+        self.assertIsNone(self.c.get('f'))
+        self.assertEqual('other', other.get('f'))
+
+    def test_put_many_and_get_many(self):
+        self.c.put('k0', 'old')
+        items = {'k{}'.format(i): i for i in range(1200)}
+        self.assertEqual(1199, len(self.c.put_many(items)))
+        res = self.c.get_many(list(items) + ['missing'])
+        self.assertEqual(1200, len(res))
+        self.assertEqual('old', res['k0'])
+        self.assertEqual(1199, res['k1199'])
+
+    def test_transaction_rollback(self):
+        self.c.put('f', 'test')
+        with self.assertRaises(RuntimeError):
+            with self.c.transaction():
+                self.c.update('f', 'test2')
+                self.c.put('f2', 'test2')
+                raise RuntimeError
+        self.assertEqual('test', self.c.get('f'))
+        self.assertFalse(self.c.has('f2'))
+
+    def test_forget_values_of_rolled_back_transaction(self):
+        with self.assertRaises(RuntimeError):
+            with self.c.transaction():
+                self.c.put('f', 'test')
+                raise RuntimeError
+        self.assertIsNone(self.c.get('f'))
+
+    def test_store_time(self):
+        with mock.patch('time.time', return_value=1000.0):
+            self.c.put('f', 'test')
+            self.c.put_many({'f2': 'test'})
+        with mock.patch('time.time', return_value=2000.0):
+            self.c.update('f2', 'test2')
+        get_memory_cache().clear()
+        self.assertEqual(('test', 1000.0), self.c.get_entry('f'))
+        self.assertEqual(('test2', 2000.0), self.c.get_entry('f2'))
+
+    def test_add_store_time_to_existing_database(self):
+        path = os.path.join(self._dir, 'old.sqlite3')
+        connection = sqlite3.connect(path)
+        connection.execute(
+            'CREATE TABLE cache (prefix TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, '
+            'PRIMARY KEY (prefix, key)) WITHOUT ROWID'
+        )
+        connection.execute("INSERT INTO cache VALUES ('test', 'f', ?)", (cache_format.dumps('test'),))
+        connection.commit()
+        connection.close()
+        db = SQLiteDatabase(path)
+        try:
+            with mock.patch('helpers.cacher.get_sqlite_database', return_value=db):
+                self.assertEqual(('test', 0), cacher.Cacher(self.cache_prefix, cacher.SQLITE_BACKEND).get_entry('f'))
+        finally:
+            db.close()
+
+    def test_concurrent_put(self):
+        def put(n):
+            for i in range(50):
+                self.c.put('{}-{}'.format(n, i), i)
+
+        threads = [threading.Thread(target=put, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(200, len(self.c.keys()))
+
+    def test_evict_values_over_quota(self):
+        with mock.patch('settings.CACHE_QUOTAS', {self.cache_prefix: 3500}):
+            c = cacher.Cacher(self.cache_prefix, cacher.SQLITE_BACKEND)
+            with mock.patch('time.time', return_value=500.0):
+                for key in ('a', 'b', 'c'):
+                    c.put(key, os.urandom(1000))
+            for key, accessed_at in (('a', 3000), ('b', 1000), ('c', 2000)):
+                c._backend.accessed([key], accessed_at)
+            c.put('d', os.urandom(1000))
+            self.assertEqual(['a', 'c', 'd'], sorted(c.keys()))
+            self.assertEqual(('a', 1010, 500.0, 3000.0), sorted(c.entries())[0])
+
+    def test_add_access_time_to_existing_database(self):
+        path = os.path.join(self._dir, 'old.sqlite3')
+        connection = sqlite3.connect(path)
+        connection.execute(
+            'CREATE TABLE cache (prefix TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, '
+            'stored_at REAL NOT NULL DEFAULT 0, PRIMARY KEY (prefix, key)) WITHOUT ROWID'
+        )
+        connection.execute("INSERT INTO cache VALUES ('test', 'f', ?, 1000)", (cache_format.dumps('test'),))
+        connection.commit()
+        connection.close()
+        db = SQLiteDatabase(path)
+        try:
+            with mock.patch('helpers.cacher.get_sqlite_database', return_value=db):
+                c = cacher.Cacher(self.cache_prefix, cacher.SQLITE_BACKEND)
+                self.assertEqual([('f', len(cache_format.dumps('test')), 1000.0, 1000.0)], c.entries())
+        finally:
+            db.close()
+
+    def test_select_backend_by_prefix(self):
+        with mock.patch('settings.CACHE_BACKENDS', {'sqlite_prefix': cacher.SQLITE_BACKEND}):
+            self.assertTrue(cacher.Cacher('sqlite_prefix').put('f', 'test'))
+        self.assertEqual('test', cacher.Cacher('sqlite_prefix', cacher.SQLITE_BACKEND).get('f'))
+        self.assertFalse(os.path.isdir(cacher.Cacher('sqlite_prefix', cacher.FILE_BACKEND)._directory_path))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,54 @@
+import time
+import unittest
+
+from exceptions.exceptions import CircuitOpenException
+from helpers.circuit_breaker import CircuitBreaker, get_circuit_breaker
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self._breaker = CircuitBreaker('test', threshold=2, reset_timeout=0.1)
+
+    def test_open_after_threshold_failures(self):
+        self._breaker.record_failure()
+        self._breaker.allow()
+        self._breaker.record_failure()
+        self.assertEqual(CircuitBreaker.OPEN, self._breaker.state)
+        with self.assertRaises(CircuitOpenException) as context:
+            self._breaker.allow()
+        self.assertEqual('Circuit `test` is open', str(context.exception))
+
+    def test_reset_failures_on_success(self):
+        self._breaker.record_failure()
+        self._breaker.record_success()
+        self._breaker.record_failure()
+        self.assertEqual(CircuitBreaker.CLOSED, self._breaker.state)
+
+    def test_close_after_successful_trial(self):
+        self._breaker.record_failure()
+        self._breaker.record_failure()
+        time.sleep(0.1)
+        self._breaker.allow()
+        self.assertEqual(CircuitBreaker.HALF_OPEN, self._breaker.state)
+        with self.assertRaises(CircuitOpenException):
+            self._breaker.allow()
+        self._breaker.record_success()
+        self.assertEqual(CircuitBreaker.CLOSED, self._breaker.state)
+
+    def test_open_after_failed_trial(self):
+        self._breaker.record_failure()
+        self._breaker.record_failure()
+        time.sleep(0.1)
+        self._breaker.allow()
+        self._breaker.record_failure()
+        self.assertEqual(CircuitBreaker.OPEN, self._breaker.state)
+        with self.assertRaises(CircuitOpenException):
+            self._breaker.allow()
+
+    def test_get_circuit_breaker(self):
+        self.assertIs(get_circuit_breaker('host:test.com'), get_circuit_breaker('host:test.com'))
+        self.assertIsNot(get_circuit_breaker('host:test.com'), get_circuit_breaker('proxy:test.com'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import threading
+import time
+import unittest
+
+from helpers.crawler import Crawler
+
+
+class TestCrawler(unittest.TestCase):
+    def setUp(self):
+        self._lock = threading.Lock()
+        self._active = 0
+        self._max_active = 0
+        self._calls = []
+
+    def _fetch(self, uri):
+        with self._lock:
+            self._calls.append(uri)
+            self._active += 1
+            self._max_active = max(self._max_active, self._active)
+        time.sleep(0.05)
+        with self._lock:
+            self._active -= 1
+        if uri == 'broken':
+            raise RuntimeError('Broken page')
+        return 'content of {}'.format(uri)
+
+    def test_crawl_returns_results_in_order(self):
+        c = Crawler(self._fetch, concurrency=3)
+        res = c.crawl(['a', 'b', 'c'])
+        self.assertEqual(['a', 'b', 'c'], list(res.keys()))
+        self.assertEqual(['content of a', 'content of b', 'content of c'], list(res.values()))
+
+    def test_crawl_respects_concurrency(self):
+        c = Crawler(self._fetch, concurrency=2)
+        c.crawl(['page{}'.format(i) for i in range(6)])
+        self.assertEqual(2, self._max_active)
+
+    def test_crawl_fetches_duplicates_once(self):
+        c = Crawler(self._fetch, concurrency=4)
+        res = c.crawl(['a', 'b', 'a'])
+        self.assertEqual(2, len(res))
+        self.assertEqual(['a', 'b'], sorted(self._calls))
+
+    def test_crawl_returns_none_for_failed_pages(self):
+        c = Crawler(self._fetch, concurrency=2)
+        res = c.crawl(['a', 'broken'])
+        self.assertEqual('content of a', res['a'])
+        self.assertIsNone(res['broken'])
+
+    def test_raise_exception_if_incorrect_concurrency(self):
+        with self.assertRaises(ValueError) as context:
+            Crawler(self._fetch, concurrency=0)
+        self.assertEqual('Concurrency must be a positive integer', str(context.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
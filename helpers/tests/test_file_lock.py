@@ -0,0 +1,56 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from helpers.file_lock import FileLock
+
+
+def hold_lock(path, locked, seconds):
+    with FileLock(path):
+        locked.set()
+        time.sleep(seconds)
+
+
+class TestFileLock(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_lock_between_processes(self):
+        context = multiprocessing.get_context('fork')
+        locked = context.Event()
+        process = context.Process(target=hold_lock, args=(self._dir, locked, 0.3))
+        process.start()
+        try:
+            self.assertTrue(locked.wait(5))
+            started = time.monotonic()
+            with FileLock(self._dir):
+                self.assertGreaterEqual(time.monotonic() - started, 0.1)
+        finally:
+            process.join()
+
+    def test_release_lock_on_exception(self):
+        lock = FileLock(self._dir)
+        with self.assertRaises(RuntimeError):
+            with lock:
+                raise RuntimeError
+        with lock:
+            pass
+
+    def test_raise_exception_if_path_does_not_exist(self):
+        lock = FileLock(os.path.join(self._dir, 'missing'))
+        with self.assertRaises(OSError):
+            with lock:
+                pass
+        # Блокировка потоков освобождена
+        with FileLock(self._dir):
+            pass
+
+
+if __name__ == '__main__':
+    unittest.main()
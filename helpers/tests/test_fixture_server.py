@@ -0,0 +1,55 @@
+import shutil
+import tempfile
+import time
+import unittest
+
+import requests
+
+from helpers.fixture_server import FixtureServer
+from helpers.recorder import Recorder
+from helpers.scraper import Scraper
+from parsers.proxy_catalog_parser import ProxyCatalogParser
+
+
+class TestFixtureServer(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        recorder = Recorder(self._dir)
+        recorder.record('https://f1news.ru/championship/2014', 200, {'Content-Type': 'text/html; charset=utf-8',
+                                                                       'Content-Encoding': 'gzip'},
+                        'Чемпионат 2014'.encode('utf-8'), 0.2)
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def _scraper(self, server, host='f1news.ru'):
+        return Scraper('{}/{}'.format(server.address, host), protocol='http')
+
+    def test_replay_recorded_response(self):
+        with FixtureServer(self._dir) as server:
+            self.assertEqual('Чемпионат 2014', self._scraper(server).scrape('Championship/2014/'))
+
+    def test_return_not_found_for_unknown_pages(self):
+        with FixtureServer(self._dir) as server:
+            with self.assertRaises(requests.HTTPError):
+                self._scraper(server).scrape('championship/2099')
+
+    def test_inject_latency(self):
+        with FixtureServer(self._dir, latency=0.1, recorded_latency=True) as server:
+            started = time.monotonic()
+            self._scraper(server).scrape('championship/2014')
+            self.assertGreaterEqual(time.monotonic() - started, 0.3)
+
+    def test_serve_proxy_list(self):
+        with FixtureServer(self._dir, proxy_list=True, dead_proxies=2) as server:
+            page = self._scraper(server, 'www.ip-adress.com').scrape('proxy-list')
+        self.assertEqual(['127.0.0.1:1', '127.0.0.1:1', server.address], ProxyCatalogParser(page).proxy_ips())
+
+    def test_work_as_proxy(self):
+        with FixtureServer(self._dir) as server:
+            s = Scraper('f1news.ru', protocol='http', proxy=server.url)
+            self.assertEqual('Чемпионат 2014', s.get(s.get_url('championship/2014'), secure=False))
+
+
+if __name__ == '__main__':
+    unittest.main()
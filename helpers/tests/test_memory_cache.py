@@ -0,0 +1,57 @@
+import unittest
+
+from helpers.memory_cache import MemoryCache
+
+
+class TestMemoryCache(unittest.TestCase):
+    def setUp(self):
+        self._cache = MemoryCache(100)
+
+    def test_get_and_put(self):
+        self.assertEqual((False, None), self._cache.get('a'))
+        self._cache.put('a', None, 10)
+        self.assertEqual((True, None), self._cache.get('a'))
+        self._cache.put('a', 'test', 20)
+        self.assertEqual((True, 'test'), self._cache.get('a'))
+        stats = self._cache.stats()
+        self.assertEqual(2, stats['hits'])
+        self.assertEqual(1, stats['misses'])
+        self.assertEqual(1, stats['items'])
+        self.assertEqual(20, stats['size'])
+
+    def test_evict_least_recently_used(self):
+        self._cache.put('a', 1, 40)
+        self._cache.put('b', 2, 40)
+        self._cache.get('a')
+        self._cache.put('c', 3, 40)
+        self.assertTrue(self._cache.contains('a'))
+        self.assertFalse(self._cache.contains('b'))
+        self.assertTrue(self._cache.contains('c'))
+        self.assertEqual(1, self._cache.stats()['evictions'])
+        self.assertEqual(80, self._cache.stats()['size'])
+
+    def test_skip_values_larger_than_cache(self):
+        self._cache.put('a', 1, 10)
+        self._cache.put('a', 2, 101)
+        self.assertFalse(self._cache.contains('a'))
+        self.assertEqual(0, self._cache.stats()['size'])
+
+    def test_disabled_cache(self):
+        cache = MemoryCache(0)
+        cache.put('a', 1, 1)
+        self.assertEqual((False, None), cache.get('a'))
+
+    def test_delete(self):
+        self._cache.put(('ns1', 'a'), 1, 10)
+        self._cache.put(('ns1', 'b'), 2, 10)
+        self._cache.put(('ns2', 'a'), 3, 10)
+        self._cache.delete(('ns1', 'a'))
+        self._cache.delete_many(lambda key: key[0] == 'ns2')
+        self.assertEqual(1, self._cache.stats()['items'])
+        self.assertEqual(10, self._cache.stats()['size'])
+        self._cache.clear()
+        self.assertEqual(0, self._cache.stats()['items'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import threading
+import unittest
+
+from helpers.prefetcher import Prefetcher
+
+
+def predict_next(args, result):
+    return [(args[0] + 1,), (args[0] + 2,)]
+
+
+class TestPrefetcher(unittest.TestCase):
+    def test_prefetch_predicted_arguments(self):
+        calls = []
+        prefetcher = Prefetcher(predict_next, workers=2, queue_size=10)
+
+        @prefetcher
+        def fetch(n):
+            calls.append(n)
+            return n
+
+        self.assertEqual(1, fetch(1))
+        self.assertEqual(2, fetch(2))
+        prefetcher.wait(5)
+        prefetcher.close()
+        # Загрузки из фоновых потоков новых загрузок не порождают, каждый набор аргументов загружается один раз
+        self.assertEqual([1, 2, 2, 3, 4], sorted(calls))
+        self.assertEqual(3, prefetcher.prefetched)
+
+    def test_drop_predictions_if_queue_is_full(self):
+        release = threading.Event()
+        calls = []
+        prefetcher = Prefetcher(lambda args, result: [(n,) for n in range(10)], workers=1, queue_size=3)
+
+        @prefetcher
+        def fetch(n):
+            calls.append(n)
+            if n != 'start':
+                release.wait(5)
+            return n
+
+        fetch('start')
+        release.set()
+        prefetcher.wait(5)
+        prefetcher.close()
+        self.assertEqual(['start', 0, 1, 2], calls)
+        self.assertEqual(7, prefetcher.dropped)
+
+    def test_ignore_failures(self):
+        def predict(args, result):
+            if args[0] == 'broken prediction':
+                raise ValueError(args[0])
+            return [('broken page',)]
+
+        prefetcher = Prefetcher(predict, workers=1, queue_size=10)
+
+        @prefetcher
+        def fetch(page):
+            if page == 'broken page':
+                raise ValueError(page)
+            return page
+
+        self.assertEqual('broken prediction', fetch('broken prediction'))
+        self.assertEqual('page', fetch('page'))
+        prefetcher.wait(5)
+        prefetcher.close()
+        self.assertEqual(0, prefetcher.prefetched)
+
+    def test_disabled_prefetcher(self):
+        calls = []
+        prefetcher = Prefetcher(predict_next, workers=0)
+
+        @prefetcher
+        def fetch(n):
+            calls.append(n)
+            return n
+
+        fetch(1)
+        prefetcher.close()
+        self.assertEqual([1], calls)
+
+
+if __name__ == '__main__':
+    unittest.main()
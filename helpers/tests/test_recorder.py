@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import requests_mock
+
+from helpers.recorder import Recorder, fixture_key
+from helpers.scraper import Scraper
+
+
+class TestRecorder(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._path = os.path.join(self._dir, 'fixtures')
+        self._recorder = Recorder(self._path)
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_fixture_key(self):
+        self.assertEqual('/f1news.ru/championship/2014', fixture_key('https://f1news.ru/championship/2014'))
+        self.assertEqual('/127.0.0.1:8000/path?q=1', fixture_key('http://127.0.0.1:8000/path?q=1'))
+        self.assertEqual('/test.com/', fixture_key('http://test.com'))
+        self.assertEqual('/path', fixture_key('/path'))
+
+    def test_record_and_load(self):
+        self._recorder.record('https://test.com/path?q=1', 200, {'Content-Type': 'text/html'}, b'content', 0.5)
+        self._recorder.record('https://test.com/missing', 404, {}, b'', 0.1)
+        fixtures = Recorder(self._path).load()
+        self.assertEqual(2, len(fixtures))
+        fixture = fixtures['/test.com/path?q=1']
+        self.assertEqual('https://test.com/path?q=1', fixture.url)
+        self.assertEqual(200, fixture.status)
+        self.assertEqual({'Content-Type': 'text/html'}, fixture.headers)
+        self.assertEqual(b'content', fixture.body)
+        self.assertEqual(0.5, fixture.elapsed)
+        self.assertEqual(404, fixtures['/test.com/missing'].status)
+
+    def test_keep_same_paths_of_different_hosts(self):
+        self._recorder.record('https://test.com/', 200, {}, b'site', 0.1)
+        self._recorder.record('https://proxies.com/', 200, {}, b'proxies', 0.1)
+        fixtures = Recorder(self._path).load()
+        self.assertEqual(b'site', fixtures['/test.com/'].body)
+        self.assertEqual(b'proxies', fixtures['/proxies.com/'].body)
+
+    def test_load_empty_directory(self):
+        self.assertEqual({}, self._recorder.load())
+
+    def test_record_scraped_pages(self):
+        s = Scraper(host='recorder-test.com', protocol='http')
+        with mock.patch('helpers.request.get_recorder', return_value=self._recorder):
+            with requests_mock.mock() as m:
+                m.get(s.get_full_url('path', {'q': 1}), text='test content', headers={'X-Test': '1'})
+                s.scrape('path', params={'q': 1})
+        fixture = self._recorder.load()['/recorder-test.com/path?q=1']
+        self.assertEqual(b'test content', fixture.body)
+        self.assertEqual('1', fixture.headers['X-Test'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,12 @@
 import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
 import requests_mock
 
+from exceptions.exceptions import CircuitOpenException, HostCircuitOpenException
+from helpers import circuit_breaker
+from helpers.circuit_breaker import CircuitBreaker
 from helpers.request import Request
 
 
@@ -35,7 +41,8 @@ class TestRequest(unittest.TestCase):
         with requests_mock.mock() as m:
             m.get(fr.get_full_url(), text='test1')
             self.assertEqual('test1', fr.get(headers=headers))
-            self.assertEqual('Hello my name is test bot and I need some data from you:)', fr._headers['User-Agent'])
+            self.assertEqual('Hello my name is test bot and I need some data from you:)',
+                             m.last_request.headers['User-Agent'])
 
     def test_can_correctly_do_request_with_custom_proxy(self):
         proxy = 'http://127.0.0.1/'
@@ -47,8 +54,124 @@ class TestRequest(unittest.TestCase):
         with requests_mock.mock() as m:
             m.get(fr.get_full_url(), text='test1')
             self.assertEqual('test1', fr.get(headers=headers))
-            self.assertEqual('Hello my name is test bot and I need some data from you:)', fr._headers['User-Agent'])
+            self.assertEqual('Hello my name is test bot and I need some data from you:)',
+                             m.last_request.headers['User-Agent'])
             self.assertEqual('http://127.0.0.1/', fr.proxy)
+            self.assertEqual('http://127.0.0.1/', m.last_request.proxies['https'])
+
+    def test_request_arguments_do_not_leak_between_requests(self):
+        fr = FakeRequest()
+
+        with requests_mock.mock() as m:
+            m.get(fr.get_full_url(), text='test1')
+            fr.get(headers={'X-Test': '1'}, proxy='http://127.0.0.1/')
+            self.assertEqual('1', m.last_request.headers['X-Test'])
+            fr.get()
+            self.assertNotIn('X-Test', m.last_request.headers)
+            self.assertEqual({'test': 1}, fr._params)
+            self.assertIsNone(fr._headers)
+            self.assertIsNone(fr.proxy)
+
+    def test_can_do_concurrent_requests(self):
+        fr = FakeRequest()
+        urls = ['http://test{}.com'.format(i) for i in range(10)]
+
+        with requests_mock.mock() as m:
+            for url in urls:
+                m.get(fr.get_full_url(url), text=url)
+            with ThreadPoolExecutor(max_workers=5) as executor:
+                results = list(executor.map(lambda url: fr.get(url), urls))
+        self.assertEqual(urls, results)
+
+    def test_reuse_session_between_requests(self):
+        fr = FakeRequest()
+        session = fr._session
+
+        with requests_mock.mock() as m:
+            m.get(fr.get_full_url(), text='test1')
+            fr.get()
+            fr.get()
+            self.assertEqual(2, m.call_count)
+        self.assertIs(session, fr._session)
+
+    def test_can_set_pool_size(self):
+        fr = FakeRequest()
+        fr._session = fr._create_session(pool_size=3)
+        self.assertEqual(3, fr._session.get_adapter('https://test1.com')._pool_maxsize)
+        self.assertEqual(3, fr._session.get_adapter('http://test1.com')._pool_maxsize)
+
+    def test_close_session_on_exit(self):
+        with FakeRequest() as fr:
+            adapter = fr._session.get_adapter('http://test1.com')
+            adapter.poolmanager.connection_from_url('http://test1.com')
+            self.assertEqual(1, len(adapter.poolmanager.pools))
+        self.assertEqual(0, len(adapter.poolmanager.pools))
+
+    def test_fail_fast_if_host_circuit_is_open(self):
+        fr = FakeRequest()
+        url = 'http://circuit-test.com'
+        circuit_breaker._breakers['host:circuit-test.com'] = CircuitBreaker('host:circuit-test.com', threshold=1)
+
+        with requests_mock.mock() as m:
+            m.get(url, exc=requests.ConnectionError)
+            with self.assertRaises(CircuitOpenException):
+                fr.get(url)
+            self.assertEqual(1, m.call_count)
+
+    def test_server_errors_open_host_circuit_without_proxy(self):
+        fr = FakeRequest()
+        url = 'http://circuit-test3.com'
+        circuit_breaker._breakers['host:circuit-test3.com'] = CircuitBreaker('host:circuit-test3.com', threshold=2)
+
+        with requests_mock.mock() as m:
+            m.get(url, status_code=503)
+            with self.assertRaises(HostCircuitOpenException):
+                fr.get(url)
+            self.assertEqual(2, m.call_count)
+        self.assertEqual(CircuitBreaker.OPEN, circuit_breaker.get_circuit_breaker('host:circuit-test3.com').state)
+
+    def test_let_trial_request_through_open_host_circuit_without_proxy(self):
+        fr = FakeRequest()
+        url = 'http://circuit-test4.com'
+        breaker = circuit_breaker._breakers['host:circuit-test4.com'] = CircuitBreaker(
+            'host:circuit-test4.com', threshold=1, reset_timeout=0
+        )
+        breaker.record_failure()
+
+        with requests_mock.mock() as m:
+            m.get(url, text='resp')
+            self.assertEqual('resp', fr.get(url))
+        self.assertEqual(CircuitBreaker.CLOSED, breaker.state)
+
+    def test_server_errors_open_host_circuit_behind_proxy(self):
+        fr = FakeRequest(proxy='http://127.0.0.1/')
+        url = 'http://circuit-test2.com'
+        circuit_breaker._breakers['host:circuit-test2.com'] = CircuitBreaker('host:circuit-test2.com', threshold=1)
+
+        with requests_mock.mock() as m:
+            m.get(url, status_code=503)
+            with self.assertRaises(CircuitOpenException):
+                fr.get(url)
+            self.assertEqual(1, m.call_count)
+        self.assertEqual(CircuitBreaker.CLOSED, circuit_breaker.get_circuit_breaker('proxy:http://127.0.0.1/').state)
+
+    def test_return_page_validators(self):
+        fr = FakeRequest()
+        with requests_mock.mock() as m:
+            m.get(fr.get_full_url(), text='test1', headers={
+                'ETag': '"v1"', 'Last-Modified': 'Wed, 21 Oct 2015 07:28:00 GMT'
+            })
+            page = fr.get_page()
+        self.assertEqual(('test1', 200, '"v1"', 'Wed, 21 Oct 2015 07:28:00 GMT'), tuple(page))
+
+    def test_do_conditional_request(self):
+        fr = FakeRequest()
+        with requests_mock.mock() as m:
+            m.get(fr.get_full_url(), status_code=304, headers={'ETag': '"v1"'})
+            page = fr.get_page(headers={'If-None-Match': '"v1"'})
+            self.assertEqual('"v1"', m.last_request.headers['If-None-Match'])
+        self.assertEqual(304, page.status)
+        self.assertEqual('', page.text)
 
     def test_raise_value_error_if_url_is_empty(self):
         fr = FakeRequestWithEmptyUrl()
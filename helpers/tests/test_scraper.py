@@ -1,9 +1,12 @@
+import time
 import unittest
+from unittest import mock
 
 import requests
 import requests_mock
 
-from exceptions.exceptions import ProxyScraperException
+import settings
+from exceptions.exceptions import HostCircuitOpenException, ProxyScraperException
 from helpers.scraper import Scraper, ProxyScraper
 
 
@@ -16,9 +19,9 @@ class TestScraper(unittest.TestCase):
                 s.scrape(uri='path')
             except requests_mock.exceptions.NoMockAddress:
                 pass
-            m.get(s.get_full_url(), text='test content')
+            m.get(s.get_full_url('path'), text='test content')
             self.assertEqual('test content', s.scrape(uri='path'))
-            self.assertEqual('http://test.com:8080/path', s.get_full_url())
+            self.assertEqual('http://test.com:8080/path', s.get_full_url('path'))
 
     def test_can_correctly_do_scrape_with_params(self):
         s = Scraper(host='test.com', protocol='http', port=8080)
@@ -29,9 +32,10 @@ class TestScraper(unittest.TestCase):
                 s.scrape(uri='path', params=params)
             except requests_mock.exceptions.NoMockAddress:
                 pass
-            m.get(s.get_full_url(), text='test content')
+            m.get(s.get_full_url('path', params), text='test content')
             self.assertEqual('test content', s.scrape(uri='path', params=params))
-            self.assertRegex(s.get_full_url(), r'http://test.com:8080/path\?(?:q=query&page=1|page=1&q=query)')
+            full_url = s.get_full_url('path', params)
+            self.assertRegex(full_url, r'http://test.com:8080/path\?(?:q=query&page=1|page=1&q=query)')
 
     def test_can_correctly_do_scrape_with_incorrect_host(self):
         s = Scraper(host='http://test.com', protocol='https')
@@ -42,9 +46,10 @@ class TestScraper(unittest.TestCase):
                 s.scrape(uri='path', params=params)
             except requests_mock.exceptions.NoMockAddress:
                 pass
-            m.get(s.get_full_url(), text='test content')
+            m.get(s.get_full_url('path', params), text='test content')
             self.assertEqual('test content', s.scrape(uri='path', params=params))
-            self.assertRegex(s.get_full_url(), r'https://test.com/path\?(?:q=query&page=1|page=1&q=query)')
+            full_url = s.get_full_url('path', params)
+            self.assertRegex(full_url, r'https://test.com/path\?(?:q=query&page=1|page=1&q=query)')
 
     def test_can_correctly_do_scrape_with_extra_slashes(self):
         s = Scraper(host='http://test.com/', protocol='https')
@@ -55,9 +60,19 @@ class TestScraper(unittest.TestCase):
                 s.scrape(uri='/path/', params=params)
             except requests_mock.exceptions.NoMockAddress:
                 pass
-            m.get(s.get_full_url(), text='test content')
+            m.get(s.get_full_url('/path/', params), text='test content')
             self.assertEqual('test content', s.scrape(uri='/path/', params=params))
-            self.assertRegex(s.get_full_url(), r'https://test.com/path\?(?:q=query&page=1|page=1&q=query)')
+            full_url = s.get_full_url('/path/', params)
+            self.assertRegex(full_url, r'https://test.com/path\?(?:q=query&page=1|page=1&q=query)')
+
+    def test_scrape_page(self):
+        s = Scraper(host='test.com', protocol='http')
+        with requests_mock.mock() as m:
+            m.get(s.get_full_url('path'), text='test content', headers={'ETag': '"v1"'})
+            page = s.scrape_page('path')
+        self.assertEqual('test content', page.text)
+        self.assertEqual(200, page.status)
+        self.assertEqual('"v1"', page.etag)
 
     def test_raise_exception_if_incorrect_protocol(self):
         with self.assertRaises(ValueError) as context:
@@ -70,35 +85,37 @@ class MockProxyManager:
         self._excluded_proxies = []
         self._proxies = ('185.82.212.95:8080', '190.7.112.18:3128', '195.128.115.30:53281')
 
-    def get_proxy(self):
+    def get_proxy(self, exclude=()):
         for ip in self._proxies:
             url = 'http://{}'.format(ip)
-            if url in self._excluded_proxies:
+            if url in self._excluded_proxies or url in exclude:
                 continue
             return url
         return None
 
-    def forget_proxy(self, url):
+    def report_success(self, url, latency):
+        pass
+
+    def report_failure(self, url):
         self._excluded_proxies.append(url)
 
 
 class MockScraper:
     def __init__(self):
-        self.proxy = None
         self.counter = 0
 
-    def scrape(self, path, *, params=None, headers=None):
-        if self.proxy == 'http://185.82.212.95:8080' and self.counter == 0:
+    def scrape(self, path, *, params=None, headers=None, proxy=None):
+        if proxy == 'http://185.82.212.95:8080' and self.counter == 0:
             return 'test1'
-        elif self.proxy == 'http://185.82.212.95:8080' and self.counter == 1:
+        elif proxy == 'http://185.82.212.95:8080' and self.counter == 1:
             raise requests.ConnectionError
-        elif self.proxy == 'http://190.7.112.18:3128' and self.counter == 1:
+        elif proxy == 'http://190.7.112.18:3128' and self.counter == 1:
             return 'test2'
-        elif self.proxy == 'http://190.7.112.18:3128' and self.counter == 2:
+        elif proxy == 'http://190.7.112.18:3128' and self.counter == 2:
             raise requests.ReadTimeout
-        elif self.proxy == 'http://195.128.115.30:53281' and self.counter == 2:
+        elif proxy == 'http://195.128.115.30:53281' and self.counter == 2:
             return 'test3'
-        elif self.proxy == 'http://195.128.115.30:53281' and self.counter == 3:
+        elif proxy == 'http://195.128.115.30:53281' and self.counter == 3:
             return 'test4'
         else:
             raise requests.ConnectionError
@@ -126,8 +143,145 @@ class TestProxyScraper(unittest.TestCase):
 
         with self.assertRaises(ProxyScraperException) as context:
             self.assertIsNone(self._scraper.scrape())
+        self.assertEqual('Proxy not found', str(context.exception))
+
+    def test_reconnect_attempts_are_counted_per_request(self):
+        self._scraper._scraper.counter = 1
+        self.assertEqual('test2', self._scraper.scrape())
+        self._scraper._scraper.counter = 2
+        self.assertEqual('test3', self._scraper.scrape())
+
+    def test_raise_exception_if_reconnect_attempts_ended(self):
+        self._scraper._retries = 0
+        self._scraper._scraper.counter = 1
+        with self.assertRaises(ProxyScraperException) as context:
+            self._scraper.scrape()
         self.assertEqual('Ended attempts to proxy reconnect. Reason ``', str(context.exception))
 
+    def test_keep_proxy_replaced_by_another_thread(self):
+        self._scraper._proxy = 'http://185.82.212.95:8080'
+
+        def scrape(path, *, params=None, headers=None, proxy=None):
+            if proxy == 'http://185.82.212.95:8080':
+                # Пока запрос выполнялся, другой поток уже переключился на другой прокси
+                self._scraper._swap_proxy(proxy, 'http://195.128.115.30:53281')
+                raise requests.ConnectionError
+            return 'response from {}'.format(proxy)
+
+        self._scraper._scraper = mock.Mock(scrape=scrape)
+        self.assertEqual('response from http://190.7.112.18:3128', self._scraper.scrape())
+        self.assertEqual('http://195.128.115.30:53281', self._scraper._proxy)
+
+    def test_scrape_page_via_proxy(self):
+        scraper = ProxyScraper('test.com', retries=0)
+        scraper._proxy_manager = MockProxyManager()
+        with requests_mock.mock() as m:
+            m.get('http://test.com/path', status_code=304)
+            page = scraper.scrape_page('path', headers={'If-None-Match': '"v1"'})
+            self.assertEqual('http://185.82.212.95:8080', m.last_request.proxies['http'])
+        self.assertEqual(304, page.status)
+
+    def test_raise_http_errors_without_proxy_failover(self):
+        scraper = ProxyScraper('test.com', retries=2)
+        scraper._proxy_manager = MockProxyManager()
+        with requests_mock.mock() as m:
+            m.get('http://test.com/missing', status_code=404)
+            with self.assertRaises(requests.HTTPError):
+                scraper.scrape('missing')
+        self.assertEqual('http://185.82.212.95:8080', scraper._proxy)
+
+    def test_raise_host_circuit_errors_without_proxy_failover(self):
+        scraper = ProxyScraper('test.com', retries=2)
+        scraper._proxy_manager = MockProxyManager()
+        scraper._scraper = mock.Mock()
+        scraper._scraper.scrape.side_effect = HostCircuitOpenException('Circuit `host:test.com` is open')
+        with self.assertRaises(HostCircuitOpenException):
+            scraper.scrape()
+        self.assertEqual(1, scraper._scraper.scrape.call_count)
+        self.assertEqual([], scraper._proxy_manager._excluded_proxies)
+
+
+class MockSlowScraper:
+    delays = {
+        'http://185.82.212.95:8080': 0.5,
+        'http://190.7.112.18:3128': 0.01,
+        None: 0.02,
+    }
+
+    def scrape(self, path, *, params=None, headers=None, proxy=None):
+        if proxy not in self.delays:
+            raise requests.ConnectionError
+        time.sleep(self.delays[proxy])
+        return 'response from {}'.format(proxy)
+
+
+class TestHedgedProxyScraper(unittest.TestCase):
+    def setUp(self):
+        self._scraper = ProxyScraper('test.com', hedge=True)
+        self._scraper._proxy_manager = MockProxyManager()
+        self._scraper._scraper = MockSlowScraper()
+        self._scraper._latencies.extend([0.05] * 20)
+        self.addCleanup(self._scraper._hedge_executor.shutdown)
+
+    def test_do_not_hedge_fast_requests(self):
+        self._scraper._scraper.delays = {'http://185.82.212.95:8080': 0.01}
+        self.assertEqual('response from http://185.82.212.95:8080', self._scraper.scrape())
+        self.assertEqual('http://185.82.212.95:8080', self._scraper._proxy)
+
+    def test_hedge_slow_request_with_another_proxy(self):
+        started = time.monotonic()
+        self.assertEqual('response from http://190.7.112.18:3128', self._scraper.scrape())
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual('http://190.7.112.18:3128', self._scraper._proxy)
+
+    def test_hedge_slow_request_directly(self):
+        self._scraper._hedge_direct = True
+        self._scraper._proxy_manager._proxies = ('185.82.212.95:8080',)
+        self.assertEqual('response from None', self._scraper.scrape())
+
+    def test_hedge_failed_request(self):
+        self._scraper._proxy = 'http://195.128.115.30:53281'
+        self.assertEqual('response from http://185.82.212.95:8080', self._scraper.scrape())
+
+    def test_reconnect_if_both_hedged_requests_failed(self):
+        self._scraper._scraper.delays = {'http://195.128.115.30:53281': 0.01}
+        self.assertEqual('response from http://195.128.115.30:53281', self._scraper.scrape())
+        self.assertEqual('http://195.128.115.30:53281', self._scraper._proxy)
+
+    def test_raise_exception_if_all_proxies_failed(self):
+        self._scraper._scraper.delays = {}
+        with self.assertRaises(ProxyScraperException) as context:
+            self._scraper.scrape()
+        self.assertEqual('Proxy not found', str(context.exception))
+        self.assertEqual(3, len(self._scraper._proxy_manager._excluded_proxies))
+        self.assertIsNone(self._scraper._proxy)
+
+    def test_do_not_hedge_if_host_circuit_is_open(self):
+        self._scraper._scraper = mock.Mock()
+        self._scraper._scraper.scrape.side_effect = HostCircuitOpenException('Circuit `host:test.com` is open')
+        with self.assertRaises(HostCircuitOpenException):
+            self._scraper.scrape()
+        self.assertEqual(1, self._scraper._scraper.scrape.call_count)
+        self.assertEqual([], self._scraper._proxy_manager._excluded_proxies)
+
+    def test_shut_down_hedge_executor_on_close(self):
+        scraper = ProxyScraper('test.com', hedge=True)
+        # Менеджер прокси при закрытии сохраняет статистику, поэтому он заменяется, чтобы не затронуть настоящий кеш
+        scraper._proxy_manager = MockProxyManager()
+        scraper._proxy_manager.close = mock.Mock()
+        scraper.close()
+        scraper._proxy_manager.close.assert_called_once_with()
+        with self.assertRaises(RuntimeError):
+            scraper._hedge_executor.submit(time.sleep, 0)
+
+    def test_hedge_delay_depends_on_latency_percentile(self):
+        self._scraper._latencies.clear()
+        self.assertEqual(settings.HEDGE_DEFAULT_DELAY, self._scraper._hedge_delay())
+        self._scraper._latencies.extend([i / 100 for i in range(1, 101)])
+        self.assertEqual(0.96, self._scraper._hedge_delay())
+        self._scraper._latencies.extend([0.1] * 100)
+        self.assertEqual(0.91, self._scraper._hedge_delay())
+
 
 if __name__ == '__main__':
     unittest.main()
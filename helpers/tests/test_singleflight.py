@@ -0,0 +1,60 @@
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from helpers.singleflight import SingleFlight
+
+
+class TestSingleFlight(unittest.TestCase):
+    def setUp(self):
+        self._flight = SingleFlight()
+
+    def test_coalesce_concurrent_calls(self):
+        calls = []
+
+        def func():
+            calls.append(1)
+            time.sleep(0.1)
+            return 'result'
+
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            results = list(executor.map(lambda _: self._flight.do('key', func), range(5)))
+        self.assertEqual(['result'] * 5, results)
+        self.assertEqual(1, len(calls))
+        self.assertEqual(0, self._flight.in_flight())
+
+    def test_do_not_coalesce_different_keys(self):
+        barrier = threading.Barrier(2, timeout=5)
+
+        def func(key):
+            barrier.wait()
+            return key
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            results = list(executor.map(lambda key: self._flight.do(key, lambda: func(key)), ['a', 'b']))
+        self.assertEqual(['a', 'b'], results)
+
+    def test_share_exception(self):
+        started = threading.Event()
+
+        def func():
+            started.set()
+            time.sleep(0.1)
+            raise ValueError('test')
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            leader = executor.submit(self._flight.do, 'key', func)
+            started.wait(5)
+            follower = executor.submit(self._flight.do, 'key', func)
+            for future in (leader, follower):
+                with self.assertRaises(ValueError):
+                    future.result()
+
+    def test_call_again_after_completion(self):
+        self.assertEqual(1, self._flight.do('key', lambda: 1))
+        self.assertEqual(2, self._flight.do('key', lambda: 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
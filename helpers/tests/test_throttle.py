@@ -0,0 +1,124 @@
+import threading
+import time
+import unittest
+from email.utils import formatdate
+from unittest import mock
+
+from helpers.throttle import HostThrottle, ThrottleSlot, TokenBucket, get_throttle, parse_retry_after
+
+
+class MockResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_allow_burst(self):
+        bucket = TokenBucket(rate=1, capacity=3)
+        started = time.monotonic()
+        for _ in range(3):
+            bucket.acquire()
+        self.assertLess(time.monotonic() - started, 0.1)
+
+    def test_limit_rate(self):
+        bucket = TokenBucket(rate=20, capacity=1)
+        started = time.monotonic()
+        for _ in range(4):
+            bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.14)
+
+    def test_raise_exception_if_incorrect_rate(self):
+        with self.assertRaises(ValueError):
+            TokenBucket(rate=0, capacity=1)
+
+
+class TestHostThrottle(unittest.TestCase):
+    def setUp(self):
+        self._throttle = HostThrottle(1000, 1000, min_concurrency=1, max_concurrency=4)
+
+    def _request(self, status, headers=None):
+        # Время ответа фиксируется, чтобы случайные задержки потоков не уменьшали лимит
+        with mock.patch.object(ThrottleSlot, 'latency', return_value=0.01):
+            with self._throttle.slot() as slot:
+                slot.record(MockResponse(status, headers))
+
+    def test_increase_limit_on_success(self):
+        self.assertEqual(1, self._throttle.limit)
+        for _ in range(10):
+            self._request(200)
+        self.assertEqual(4, self._throttle.limit)
+
+    def test_decrease_limit_on_server_errors(self):
+        for _ in range(10):
+            self._request(200)
+        self._request(503)
+        self.assertEqual(2, self._throttle.limit)
+
+    def test_decrease_limit_on_too_many_requests(self):
+        for _ in range(10):
+            self._request(200)
+        self._request(429)
+        self.assertEqual(2, self._throttle.limit)
+
+    def test_decrease_limit_on_connection_errors(self):
+        for _ in range(10):
+            self._request(200)
+        with self.assertRaises(RuntimeError):
+            with self._throttle.slot():
+                raise RuntimeError
+        self.assertEqual(2, self._throttle.limit)
+
+    def test_decrease_limit_on_rising_latency(self):
+        for _ in range(10):
+            self._request(200)
+        self._throttle.acquire()
+        self._throttle.release(200, 1.0)
+        self.assertEqual(2, self._throttle.limit)
+
+    def test_honour_retry_after(self):
+        self._request(429, {'Retry-After': '0.2'})
+        started = time.monotonic()
+        self._request(200)
+        self.assertGreaterEqual(time.monotonic() - started, 0.15)
+
+    def test_limit_concurrent_requests(self):
+        lock = threading.Lock()
+        state = {'active': 0, 'max': 0}
+
+        def request():
+            with self._throttle.slot() as slot:
+                with lock:
+                    state['active'] += 1
+                    state['max'] = max(state['max'], state['active'])
+                time.sleep(0.02)
+                with lock:
+                    state['active'] -= 1
+                slot.record(MockResponse(200))
+
+        threads = [threading.Thread(target=request) for _ in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertLessEqual(state['max'], 4)
+
+    def test_get_throttle_for_host(self):
+        self.assertIs(get_throttle('test.com'), get_throttle('test.com'))
+        self.assertIsNot(get_throttle('test.com'), get_throttle('test2.com'))
+
+
+class TestParseRetryAfter(unittest.TestCase):
+    def test_parse_seconds(self):
+        self.assertEqual(120.0, parse_retry_after('120'))
+
+    def test_parse_http_date(self):
+        self.assertAlmostEqual(60, parse_retry_after(formatdate(time.time() + 60, usegmt=True)), delta=2)
+
+    def test_parse_incorrect_value(self):
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after('soon'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import requests
+import requests_mock
+
+from decorators import decorators
+from helpers.cacher import Cacher
+from helpers.request import Request
+from helpers.tracer import Tracer, read_summaries
+
+
+class FakeRequest(Request):
+    def get_url(self):
+        return 'http://tracer-test.com'
+
+
+class TestTracer(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._path = os.path.join(self._dir, 'logs', 'trace.jsonl')
+        self._tracer = Tracer(self._path, slowest_count=2)
+
+    def tearDown(self):
+        self._tracer.close()
+        shutil.rmtree(self._dir)
+
+    def _events(self):
+        with open(self._path, encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+
+    def test_write_events_as_json_lines(self):
+        self._tracer.trace_fetch('http://test.com/1', proxy='http://1.1.1.1:80', status=200, ttfb=0.1,
+                                 download=0.2, total=0.3, size=100)
+        self._tracer.trace_cache('test', 'key', False, ['f1news.ru', 'uri'])
+        events = self._events()
+        self.assertEqual(2, len(events))
+        self.assertEqual('fetch', events[0]['event'])
+        self.assertEqual('http://1.1.1.1:80', events[0]['proxy'])
+        self.assertEqual(0, events[0]['retry'])
+        self.assertEqual(100, events[0]['bytes'])
+        self.assertEqual({'event': 'cache', 'prefix': 'test', 'key': 'key', 'hit': False,
+                          'args': ['f1news.ru', 'uri']}, {k: v for k, v in events[1].items() if k != 'time'})
+
+    def test_summary(self):
+        self._tracer.trace_fetch('http://test.com/1', status=200, total=0.1, size=10)
+        self._tracer.trace_fetch('http://test.com/2', attempt=2, status=200, total=0.5, size=20)
+        self._tracer.trace_fetch('http://test.com/3', proxy='http://1.1.1.1:80', total=0.3, error='ConnectTimeout')
+        self._tracer.trace_cache('test', 'key', True)
+        self._tracer.trace_cache('test', 'key2', False)
+        summary = self._tracer.summary()
+        self.assertEqual(3, summary['fetches'])
+        self.assertEqual(1, summary['errors'])
+        self.assertEqual(1, summary['retries'])
+        self.assertEqual(30, summary['bytes'])
+        self.assertEqual({'test': {'hits': 1, 'misses': 1, 'evictions': 0}}, summary['cache'])
+        self.assertEqual({'fetches': 1, 'errors': 1, 'average_time': 0.3}, summary['proxies']['http://1.1.1.1:80'])
+        self.assertEqual(['http://test.com/2', 'http://test.com/3'], [item['url'] for item in summary['slowest']])
+
+    def test_report(self):
+        self._tracer.trace_fetch('http://test.com/1', status=200, total=0.1, size=10)
+        with self.assertLogs('test', level=logging.INFO) as logs:
+            self._tracer.report(logging.getLogger('test'))
+        self.assertIn('Requests: 1, errors: 0', logs.output[0])
+        self.assertEqual('summary', self._events()[-1]['event'])
+
+    def test_rotate_large_trace_file(self):
+        self._tracer.trace_to(self._path, max_size=10)
+        self._tracer.trace_fetch('http://test.com/1', status=200, total=0.1, size=10)
+        self._tracer.report(logging.getLogger('test'))
+        self._tracer.close()
+        self._tracer.trace_fetch('http://test.com/2', status=200, total=0.1, size=20)
+        self._tracer.report(logging.getLogger('test'))
+        self._tracer.close()
+        self.assertEqual(['http://test.com/2'], [event['url'] for event in self._events() if event['event'] == 'fetch'])
+        self.assertEqual([10, 30], [summary['bytes'] for summary in read_summaries(self._path)])
+
+    def test_read_last_summaries(self):
+        for size in (10, 20, 30):
+            self._tracer.trace_fetch('http://test.com/1', status=200, total=0.1, size=size)
+            self._tracer.report(logging.getLogger('test'))
+        self._tracer.close()
+        self.assertEqual([30, 60], [summary['bytes'] for summary in read_summaries(self._path, runs=2)])
+        self.assertEqual([], read_summaries(os.path.join(self._dir, 'missing.jsonl')))
+
+    def test_trace_requests(self):
+        fr = FakeRequest()
+        with mock.patch('helpers.request.get_tracer', return_value=self._tracer):
+            with requests_mock.mock() as m:
+                m.register_uri('GET', fr.get_url(), [{'exc': requests.ConnectionError}, {'text': 'test1'}])
+                with mock.patch('time.sleep'):
+                    self.assertEqual('test1', fr.get())
+        events = self._events()
+        self.assertEqual(['ConnectionError', None], [e['error'] for e in events])
+        self.assertEqual([0, 1], [e['retry'] for e in events])
+        self.assertEqual(200, events[1]['status'])
+        self.assertEqual(5, events[1]['bytes'])
+
+    def test_trace_cache_hits(self):
+        cacher = Cacher('test')
+
+        @decorators.save_to_cache('test')
+        def test(data):
+            return data
+
+        try:
+            with mock.patch('decorators.decorators.get_tracer', return_value=self._tracer):
+                test('uri')
+                test('uri')
+        finally:
+            cacher.flush()
+        self.assertEqual([False, True], [e['hit'] for e in self._events()])
+        self.assertEqual(['uri'], self._events()[0]['args'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+import settings
+
+
+class TokenBucket:
+    """Ограничивает среднюю частоту запросов значением rate в секунду, допуская всплески до capacity запросов"""
+
+    def __init__(self, rate, capacity):
+        if rate <= 0 or capacity < 1:
+            raise ValueError('Rate and capacity must be positive')
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = float(capacity)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Блокирует поток до появления свободного токена и возвращает время ожидания в секундах"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self._capacity, self._tokens + (now - self._updated_at) * self._rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self._rate
+            time.sleep(delay)
+            waited += delay
+
+
+class HostThrottle:
+    """
+    Планировщик запросов к одному хосту: частота ограничивается токен-бакетом, а количество одновременных
+    запросов подбирается по схеме AIMD - растет на единицу за окно быстрых ответов и уменьшается вдвое
+    при ответах 429/5xx, ошибках соединения или росте времени ответа
+    """
+    _smoothing = 0.2
+
+    def __init__(self, rate, burst, *, min_concurrency=1, max_concurrency=8, latency_factor=2.0):
+        self._bucket = TokenBucket(rate, burst)
+        self._min_concurrency = min_concurrency
+        self._max_concurrency = max_concurrency
+        self._latency_factor = latency_factor
+        self._limit = float(min_concurrency)
+        self._active = 0
+        self._latency = None
+        self._blocked_until = 0.0
+        self._decreased_at = 0.0
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self):
+        return int(self._limit)
+
+    @contextmanager
+    def slot(self):
+        """
+        Занимает место для одного запроса, по выходу из контекста обновляет лимит по результату,
+        переданному в ThrottleSlot.record (исключение внутри контекста считается неудачным запросом)
+        """
+        self.acquire()
+        slot = ThrottleSlot()
+        try:
+            yield slot
+        except Exception:
+            self.release(None, slot.latency())
+            raise
+        self.release(slot.status, slot.latency(), slot.retry_after)
+
+    def acquire(self):
+        with self._condition:
+            while True:
+                delay = self._blocked_until - time.monotonic()
+                if delay <= 0 and self._active < self.limit:
+                    break
+                self._condition.wait(delay if delay > 0 else None)
+            self._active += 1
+        self._bucket.acquire()
+
+    def release(self, status, latency, retry_after=None):
+        """
+        :param int status: Код ответа, None если запрос завершился ошибкой
+        :param float latency: Время выполнения запроса в секундах
+        :param float retry_after: Время в секундах, в течение которого нельзя делать запросы
+        """
+        with self._condition:
+            self._active -= 1
+            now = time.monotonic()
+            if retry_after:
+                self._blocked_until = max(self._blocked_until, now + retry_after)
+            if status is None or status == 429 or status >= 500:
+                self._decrease(now)
+            elif self._latency is not None and latency > self._latency * self._latency_factor:
+                self._decrease(now)
+            else:
+                self._limit = min(self._max_concurrency, self._limit + 1 / self._limit)
+            if status is not None and status < 400:
+                self._latency = latency if self._latency is None else (
+                    self._latency + self._smoothing * (latency - self._latency)
+                )
+            self._condition.notify_all()
+
+    def _decrease(self, now):
+        # Не уменьшаем лимит чаще одного раза за время ответа, иначе одна волна ошибок обнулит его
+        if now - self._decreased_at < (self._latency or 0):
+            return
+        self._decreased_at = now
+        self._limit = max(self._min_concurrency, self._limit / 2)
+
+
+class ThrottleSlot:
+    def __init__(self):
+        self.status = None
+        self.retry_after = None
+        self._started_at = time.monotonic()
+
+    def record(self, response):
+        self.status = response.status_code
+        self.retry_after = parse_retry_after(response.headers.get('Retry-After'))
+
+    def latency(self):
+        return time.monotonic() - self._started_at
+
+
+def parse_retry_after(value):
+    """
+    Возвращает значение заголовка Retry-After в секундах
+    :param str value: Количество секунд или дата в формате HTTP
+    :return: float|None
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+_throttles = {}
+_throttles_lock = threading.Lock()
+
+
+def get_throttle(host):
+    """Возвращает общий для всех запросов планировщик для заданного хоста"""
+    with _throttles_lock:
+        if host not in _throttles:
+            _throttles[host] = HostThrottle(
+                settings.THROTTLE_RATE,
+                settings.THROTTLE_BURST,
+                min_concurrency=settings.THROTTLE_MIN_CONCURRENCY,
+                max_concurrency=settings.THROTTLE_MAX_CONCURRENCY,
+                latency_factor=settings.THROTTLE_LATENCY_FACTOR,
+            )
+        return _throttles[host]
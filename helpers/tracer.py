@@ -0,0 +1,196 @@
+import atexit
+import errno
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+
+class Tracer:
+    """Записывает события загрузки страниц и обращений к кешу в файл в формате JSON lines и собирает сводку"""
+
+    def __init__(self, path=None, slowest_count=10):
+        """
+        :param str path: Путь к файлу трассировки, если не задан, то события только учитываются в сводке
+        :param int slowest_count: Количество самых медленных запросов в сводке
+        """
+        self._path = path
+        self._max_size = None
+        self._file = None
+        self._lock = threading.Lock()
+        self._slowest_count = slowest_count
+        self._fetches = 0
+        self._errors = 0
+        self._retries = 0
+        self._bytes = 0
+        self._fetch_time = 0.0
+        self._cache = defaultdict(lambda: {'hits': 0, 'misses': 0, 'evictions': 0})
+        self._proxies = defaultdict(lambda: {'fetches': 0, 'errors': 0, 'time': 0.0})
+        self._slowest = []
+
+    def trace_fetch(self, url, *, proxy=None, attempt=1, status=None, wait=0.0, ttfb=None, download=None,
+                    total=0.0, size=None, error=None):
+        """
+        :param str url: Адрес запроса
+        :param str proxy: Адрес прокси
+        :param int attempt: Номер попытки (повторы выполняются декоратором retry)
+        :param int status: Код ответа
+        :param float wait: Время ожидания разрешения планировщика запросов к хосту
+        :param float ttfb: Время до получения заголовков ответа, включая установку соединения
+        :param float download: Время загрузки тела ответа
+        :param float total: Общее время запроса
+        :param int size: Размер тела ответа в байтах
+        :param str error: Имя исключения, если запрос завершился ошибкой
+        """
+        event = {
+            'event': 'fetch',
+            'url': url,
+            'proxy': proxy,
+            'retry': attempt - 1,
+            'status': status,
+            'wait': round(wait, 4),
+            'ttfb': round(ttfb, 4) if ttfb is not None else None,
+            'download': round(download, 4) if download is not None else None,
+            'total': round(total, 4),
+            'bytes': size,
+            'error': error,
+        }
+        with self._lock:
+            self._fetches += 1
+            self._retries += 1 if attempt > 1 else 0
+            self._errors += 1 if error is not None else 0
+            self._bytes += size or 0
+            self._fetch_time += total
+            proxy_stats = self._proxies[proxy or 'direct']
+            proxy_stats['fetches'] += 1
+            proxy_stats['errors'] += 1 if error is not None else 0
+            proxy_stats['time'] += total
+            self._slowest.append((total, url))
+            self._slowest = sorted(self._slowest, reverse=True)[:self._slowest_count]
+        self._write(event)
+
+    def trace_cache(self, prefix, key, hit, args=None):
+        """
+        :param str prefix: Префикс кеша
+        :param str key: Ключ
+        :param bool hit: Значение найдено в кеше
+        :param list args: Аргументы, из которых получен ключ
+        """
+        with self._lock:
+            self._cache[prefix]['hits' if hit else 'misses'] += 1
+        self._write({'event': 'cache', 'prefix': prefix, 'key': key, 'hit': hit, 'args': args})
+
+    def trace_eviction(self, prefix, count):
+        """
+        :param str prefix: Префикс кеша
+        :param int count: Количество значений, вытесненных из хранилища при превышении ограничения размера
+        """
+        with self._lock:
+            self._cache[prefix]['evictions'] += count
+        self._write({'event': 'eviction', 'prefix': prefix, 'count': count})
+
+    def summary(self):
+        with self._lock:
+            return {
+                'fetches': self._fetches,
+                'errors': self._errors,
+                'retries': self._retries,
+                'bytes': self._bytes,
+                'fetch_time': round(self._fetch_time, 4),
+                'cache': {prefix: dict(stats) for prefix, stats in self._cache.items()},
+                'proxies': {
+                    proxy: {
+                        'fetches': stats['fetches'],
+                        'errors': stats['errors'],
+                        'average_time': round(stats['time'] / stats['fetches'], 4),
+                    } for proxy, stats in self._proxies.items()
+                },
+                'slowest': [{'url': url, 'total': round(total, 4)} for total, url in self._slowest],
+            }
+
+    def report(self, logger):
+        """Записывает сводку в лог и в файл трассировки"""
+        summary = self.summary()
+        self._write(dict(summary, event='summary'))
+        logger.info('Requests: {fetches}, errors: {errors}, retries: {retries}, downloaded: {bytes} bytes '
+                    'in {fetch_time} s'.format(**summary))
+        for prefix, stats in summary['cache'].items():
+            logger.info('Cache `{}`: {} hits, {} misses, {} evictions'.format(
+                prefix, stats['hits'], stats['misses'], stats['evictions']
+            ))
+        for proxy, stats in sorted(summary['proxies'].items(), key=lambda x: -x[1]['average_time']):
+            logger.info('Proxy {}: {} requests, {} errors, {} s on average'.format(
+                proxy, stats['fetches'], stats['errors'], stats['average_time']
+            ))
+        for item in summary['slowest']:
+            logger.info('Slow request {}: {} s'.format(item['url'], item['total']))
+
+    def trace_to(self, path, max_size=None):
+        """
+        Начинает запись событий в файл, файл открывается при первом событии
+        :param str path: Путь к файлу трассировки, None - только учитывать события в сводке
+        :param int max_size: Если файл больше max_size байт, то он переименовывается в <path>.1,
+            заменяя предыдущий, и запись начинается в новый файл. None - не ограничивать размер
+        """
+        self.close()
+        with self._lock:
+            self._path = path
+            self._max_size = max_size
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _write(self, event):
+        if self._path is None:
+            return
+        event['time'] = time.time()
+        line = json.dumps(event, ensure_ascii=False)
+        with self._lock:
+            if self._file is None:
+                try:
+                    os.makedirs(os.path.dirname(self._path))
+                except OSError as e:
+                    if e.errno != errno.EEXIST:
+                        raise
+                if self._max_size is not None and os.path.isfile(self._path) and \
+                        os.path.getsize(self._path) > self._max_size:
+                    os.replace(self._path, '{}.1'.format(self._path))
+                self._file = open(self._path, mode='a', encoding='utf-8')
+            self._file.write(line + '\n')
+            self._file.flush()
+
+
+def read_summaries(path, runs=5):
+    """
+    Читает сводки последних запусков из файла трассировки и его предыдущей части
+    :param str path: Путь к файлу трассировки
+    :param int runs: Количество последних запусков
+    :return: list
+    """
+    summaries = deque(maxlen=runs)
+    for part_path in ('{}.1'.format(path), path) if path else ():
+        if not os.path.isfile(part_path):
+            continue
+        with open(part_path, encoding='utf-8') as f:
+            for line in f:
+                # Разбираем только строки сводок, остальных событий в файле намного больше
+                if '"summary"' not in line:
+                    continue
+                event = json.loads(line)
+                if event.get('event') == 'summary':
+                    summaries.append(event)
+    return list(summaries)
+
+
+# Общий трассировщик только учитывает события в сводке, пока запись в файл не включена через trace_to
+_tracer = Tracer()
+
+atexit.register(_tracer.close)
+
+
+def get_tracer():
+    return _tracer
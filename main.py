@@ -1,14 +1,28 @@
+import argparse
+import functools
+import hashlib
 import logging
 import os
 import sys
-from collections import defaultdict, namedtuple
+import time
+from collections import OrderedDict, defaultdict, namedtuple
+from urllib.parse import urlparse
 
 import pandas as pd
+import requests
 
 import settings
 from decorators import decorators
 from exceptions.exceptions import RaceCatalogException
+from helpers.cache_key import encode, make_key
+from helpers.cache_policy import EXPIRED, CachePolicies, stale_while_revalidate
+from helpers.cacher import Cacher, sync_all
+from helpers.crawler import Crawler
+from helpers.memory_cache import get_memory_cache
+from helpers.prefetcher import Prefetcher
 from helpers.scraper import ProxyScraper, Scraper
+from helpers.tracer import get_tracer, read_summaries
+from parsers.cached_parser import cached_parser, parser_version
 from parsers.f1_news_race_calatog_parser import F1NewsRaceCatalogParser
 from parsers.f1_news_race_result_parser import F1NewsRaceResultParser
 from parsers.f1_news_race_starting_positions_parser import F1NewsRaceStartingPositionsParser
@@ -22,21 +36,38 @@ logger = logging.getLogger(__name__)
 # ------------------------------------------------- Constants Block -------------------------------------------------- #
 
 
+def source_address(host, protocol):
+    """
+    Возвращает хост и протокол источника данных, при воспроизведении записанных ответов (settings.REPLAY_URL)
+    все источники подменяются локальным сервером, а хост источника становится началом пути
+    :param str host: Хост
+    :param str protocol: Протокол
+    :return: tuple
+    """
+    if settings.REPLAY_URL:
+        url = urlparse(settings.REPLAY_URL)
+        return '{}/{}'.format(url.netloc, host), url.scheme
+    return host, protocol
+
+
+F1NEWS_HOST, F1NEWS_PROTOCOL = source_address('f1news.ru', 'https')
+
 SCRAPERS = {
-    'f1news.ru': Scraper('f1news.ru', protocol='https'),
+    'f1news.ru': Scraper(F1NEWS_HOST, protocol=F1NEWS_PROTOCOL),
 }
 
 PROXY_SCRAPERS = {
-    'f1news.ru': ProxyScraper('f1news.ru', protocol='https'),
+    'f1news.ru': ProxyScraper(F1NEWS_HOST, protocol=F1NEWS_PROTOCOL, hedge=settings.USE_HEDGED_REQUESTS),
 }
 
+# Результаты разбора страниц кешируются, поэтому при заполненном кеше HTML не разбирается
 PARSERS = {
     'f1news.ru': {
-        'race_catalog': F1NewsRaceCatalogParser,
-        'race_results': F1NewsRaceResultParser,
-        'race_starting_positions': F1NewsRaceStartingPositionsParser,
-        'team_points': F1NewsTeamPointsParser,
-        'testing': F1NewsTestingParser,
+        'race_catalog': cached_parser(F1NewsRaceCatalogParser),
+        'race_results': cached_parser(F1NewsRaceResultParser),
+        'race_starting_positions': cached_parser(F1NewsRaceStartingPositionsParser),
+        'team_points': cached_parser(F1NewsTeamPointsParser),
+        'testing': cached_parser(F1NewsTestingParser),
     }
 }
 
@@ -212,15 +243,9 @@ TESTING_URI = {
     }
 }
 
-RACING_CATALOGS_URI = {
-    'f1news.ru': {
-        2013: 'Championship/2013/',
-        2014: 'Championship/2014/',
-        2015: 'Championship/2015/',
-        2016: 'Championship/2016/',
-        2017: 'Championship/2017/',
-        2018: 'Championship/2018/',
-    }
+# Шаблоны uri каталогов сезонов, {} - год
+RACING_CATALOG_URI_TEMPLATES = {
+    'f1news.ru': 'Championship/{}/',
 }
 
 TEAM_POINTS_URI = {
@@ -232,6 +257,29 @@ TEAM_POINTS_URI = {
     }
 }
 
+
+def current_season():
+    """
+    Год сезона, который проводится сейчас
+    :return: int
+    """
+    return time.localtime().tm_year
+
+
+# Каталог и командный зачет текущего сезона меняются после каждой гонки, страницы прошлых сезонов не меняются
+SCRAPED_DATA_POLICIES = CachePolicies([
+    (
+        r'^Championship/{}/(teampoints\.shtml)?$'.format(current_season()),
+        stale_while_revalidate(settings.LIVE_PAGES_TTL, settings.LIVE_PAGES_STALE_TTL),
+    ),
+])
+
+# Валидаторы загруженных страниц для условных запросов
+PAGE_VALIDATORS = Cacher('page_validators')
+
+# Контрольные точки сбора результатов гонок: результаты обработанных гонок и собранных сезонов
+RACE_CHECKPOINTS = Cacher('race_checkpoints')
+
 RACING_RESULTS_HEADERS = (
     'number',
     'year',
@@ -339,9 +387,107 @@ RaceDataFull = namedtuple(
 
 # -------------------------------------------------- Helpers Block --------------------------------------------------- #
 
-# TODO: С этой логикой есть определенные проблемы, так как для некоторых страниц кеширование нежелательно
-# TODO: Подумать как лучше сделать отключение кеширования по требованию
-@decorators.save_to_cache('scraped_data')
+def racing_catalog_uri(year, source='f1news.ru'):
+    """
+    Возвращает uri каталога гонок сезона
+    :param int year: Год проведения чемпионата
+    :param str source: Источник данных
+    :return: str
+    """
+    return RACING_CATALOG_URI_TEMPLATES[source].format(year)
+
+
+def racing_catalog_year(uri, source='f1news.ru'):
+    """
+    Определяет год сезона по uri каталога гонок
+    :param str uri: Uri
+    :param str source: Источник данных
+    :return: int|None Год или None, если uri не является каталогом сезона
+    """
+    template = RACING_CATALOG_URI_TEMPLATES.get(source)
+    if template is None:
+        return None
+    prefix, suffix = template.split('{}')
+    year = uri[len(prefix):len(uri) - len(suffix)]
+    if not uri.startswith(prefix) or not uri.endswith(suffix) or len(year) != 4 or not year.isdigit():
+        return None
+    return int(year)
+
+
+def fetch_page(scraper_code, uri, params=None, headers=None, cached=None):
+    """
+    Загружает заданную страницу сайта и сохраняет ее валидаторы (ETag и Last-Modified). Если передана сохраненная
+    копия страницы, то запрос выполняется с условием и при ответе 304 (страница не изменилась) возвращается копия
+    :param str scraper_code: Источник данных
+    :param str uri: Uri
+    :param dict params: Дополнительные параметры запроса
+    :param dict headers: Дополнительные заголовки запроса
+    :param str cached: Сохраненная копия страницы
+    :return: str
+    """
+    scraper = get_scraper(scraper_code)
+    if not scraper:
+        raise ValueError('Scraper for site `{}` does not exist'.format(scraper_code))
+    validators_key = make_key('page_validators', (scraper_code, uri, params or {}))
+    validators = PAGE_VALIDATORS.get(validators_key) if cached is not None else None
+    if validators:
+        headers = dict(headers or {})
+        if validators['etag']:
+            headers['If-None-Match'] = validators['etag']
+        if validators['last_modified']:
+            headers['If-Modified-Since'] = validators['last_modified']
+    page = scraper.scrape_page(uri, params=params, headers=headers)
+    if page is None:
+        return None
+    if page.status == 304:
+        return cached
+    if page.etag or page.last_modified:
+        validators = {'etag': page.etag, 'last_modified': page.last_modified}
+        if not PAGE_VALIDATORS.update(validators_key, validators):
+            PAGE_VALIDATORS.put(validators_key, validators)
+    return page.text
+
+
+def revalidate_scraped_data(cached, scraper_code, uri, params=None, headers=None):
+    """Обновляет устаревшую копию страницы условным запросом"""
+    return fetch_page(scraper_code, uri, params, headers, cached)
+
+
+def predict_sibling_pages(args, data):
+    """
+    Предсказывает страницы, которые понадобятся следом за загруженной: после каталога сезона - результаты
+    и стартовые позиции всех гонок сезона, после результатов гонки - ее стартовые позиции
+    :param tuple args: Аргументы scrape_data
+    :param str data: Страница
+    :return: list Аргументы scrape_data для предсказанных страниц
+    """
+    source, uri = args[:2]
+    if data is None or any(args[2:]):
+        return []
+    if racing_catalog_year(uri, source) is not None:
+        links = PARSERS[source]['race_catalog'](data).links()
+        return [(source, page_uri) for link in links for page_uri in (link, link.replace('race.shtml', 'grid.shtml'))]
+    if uri.endswith('race.shtml'):
+        return [(source, uri.replace('race.shtml', 'grid.shtml'))]
+    return []
+
+
+PREFETCHER = Prefetcher(predict_sibling_pages)
+
+
+def is_missing_page(error):
+    """
+    Проверяет, что страницы нет на сайте. Ошибки прокси и сервера временные, поэтому в кеше не сохраняются
+    :param Exception error: Ошибка загрузки страницы
+    :return: bool
+    """
+    response = getattr(error, 'response', None)
+    return isinstance(error, requests.HTTPError) and response is not None and response.status_code in (404, 410)
+
+
+@PREFETCHER
+@decorators.save_to_cache('scraped_data', policy=SCRAPED_DATA_POLICIES, revalidate=revalidate_scraped_data,
+                          negative=is_missing_page)
 def scrape_data(scraper_code, uri, params=None, headers=None):
     """
     Загружает заданную станицу сайта и кеширует ее для повторных запросов
@@ -351,11 +497,266 @@ def scrape_data(scraper_code, uri, params=None, headers=None):
     :param dict headers: Дополнительные заголовки запроса
     :return: str
     """
+    return fetch_page(scraper_code, uri, params, headers)
+
+
+def get_scraper(scraper_code):
+    """
+    Возвращает скрапер для заданного источника данных
+    :param str scraper_code: Источник данных
+    :return: Scraper|ProxyScraper|None
+    """
     scrapers_source = PROXY_SCRAPERS if settings.USE_PROXY else SCRAPERS
-    scraper = scrapers_source.get(scraper_code)
-    if not scraper:
-        raise ValueError('Scraper for site `{}` does not exist'.format(scraper))
-    return scraper.scrape(uri, params=params, headers=headers)
+    return scrapers_source.get(scraper_code)
+
+
+def close_scrapers():
+    """Закрывает пулы соединений всех скраперов"""
+    for scraper in list(SCRAPERS.values()) + list(PROXY_SCRAPERS.values()):
+        scraper.close()
+
+
+def checkpoint_key(kind, year, source='f1news.ru'):
+    """
+    Ключ контрольной точки. В ключ входит версия парсеров страниц гонок и справочников, по которым строятся
+    результаты, поэтому после их изменения результаты собираются заново
+    :param str kind: races - результаты обработанных гонок сезона, season - результаты собранного сезона
+    :param int year: Год проведения чемпионата
+    :param str source: Источник данных
+    :return: str
+    """
+    versions = tuple(
+        parser_version(PARSERS[source][name].parser_class)
+        for name in ('race_catalog', 'race_results', 'race_starting_positions')
+    )
+    version = hashlib.blake2b(encode(versions + (TEAMS_MAPPING, TRACKS_MAPPING, WEATHER_MAPPING)), digest_size=8)
+    return '{}-{}-{}-{}'.format(source, year, kind, version.hexdigest())
+
+
+def is_season_finished(year):
+    """
+    Сезон считается завершенным после окончания года, в котором он проводился
+    :param int year: Год проведения чемпионата
+    :return: bool
+    """
+    return year < current_season()
+
+
+def save_checkpoint(key, value):
+    """
+    Сохраняет контрольную точку, заменяя предыдущую
+    :param str key: Ключ
+    :param value: Значение
+    """
+    if not RACE_CHECKPOINTS.update(key, value):
+        RACE_CHECKPOINTS.put(key, value)
+
+
+def scrape_data_many(scraper_code, uris):
+    """
+    Параллельно загружает набор страниц сайта через scrape_data, заполняя кеш для последующих запросов
+    :param str scraper_code: Источник данных
+    :param iterable uris: Список uri
+    :return: OrderedDict
+    """
+    crawler = Crawler(
+        functools.partial(scrape_data, scraper_code),
+        concurrency=settings.CRAWLER_CONCURRENCY,
+        tries=settings.CRAWLER_TRIES,
+    )
+    return crawler.crawl(uris)
+
+
+def prefetch_race_results(year, source='f1news.ru'):
+    """
+    Параллельно загружает недостающие в кеше каталоги текущего и предыдущего сезона, а затем страницы
+    результатов и стартовых позиций всех гонок сезона и последней гонки предыдущего сезона
+    :param year: Год проведения чемпионата
+    :param source: Источник данных
+    """
+    crawl_missing(('racing',), (year,), source)
+
+
+def prefetch_testing_results(year, source='f1news.ru'):
+    """
+    Параллельно загружает недостающие в кеше страницы зимних тестов и итоговых очков команд за сезон
+    :param year: Год проведения чемпионата
+    :param source: Источник данных
+    """
+    crawl_missing(('testing',), (year,), source)
+
+
+# ------------------------------------------------ Crawl Planner Block ----------------------------------------------- #
+
+
+CrawlPlan = namedtuple('CrawlPlan', ['pages', 'missing', 'unexpanded'])
+
+
+def plan_crawl(modes, period, source='f1news.ru'):
+    """
+    Составляет манифест страниц, необходимых для построения датасетов, и сверяет его с кешем без обращения к сети.
+    Страницы гонок берутся из каталогов сезонов, поэтому гонки сезонов, каталогов которых нет в кеше,
+    в манифест не попадают
+    :param iterable modes: Типы датасетов: testing, racing
+    :param iterable period: Годы
+    :param str source: Источник данных
+    :return: CrawlPlan Все страницы, страницы, которые нужно загрузить, и каталоги, которых нет в кеше
+    """
+    pages = OrderedDict()
+    unexpanded = OrderedDict()
+    for year in period:
+        if 'testing' in modes:
+            pages.update((uri, None) for uri in TESTING_URI[source].get(year, ()))
+            if year in TEAM_POINTS_URI[source]:
+                pages[TEAM_POINTS_URI[source][year]] = None
+        if 'racing' not in modes:
+            continue
+        for catalog_year in (year, year - 1):
+            catalog_uri = racing_catalog_uri(catalog_year, source)
+            pages[catalog_uri] = None
+            found = scrape_data.cache_lookup(source, catalog_uri)
+            if found is None or found[0] is None:
+                unexpanded[catalog_uri] = None
+                continue
+            links = PARSERS[source]['race_catalog'](found[0]).links()
+            if catalog_year != year:
+                links = links[-1:]
+            for uri in links:
+                pages[uri] = None
+                pages[uri.replace('race.shtml', 'grid.shtml')] = None
+    missing = [uri for uri in pages if scrape_data.cache_state(source, uri) in (None, EXPIRED)]
+    return CrawlPlan(list(pages), missing, list(unexpanded))
+
+
+def crawl_missing(modes, period, source='f1news.ru'):
+    """
+    Загружает страницы, которых нет в кеше: сначала каталоги сезонов, чтобы раскрыть ссылки на гонки,
+    затем все остальные страницы одним параллельным проходом
+    :param iterable modes: Типы датасетов: testing, racing
+    :param iterable period: Годы
+    :param str source: Источник данных
+    :return: CrawlPlan План, по которому загружались страницы
+    """
+    plan = plan_crawl(modes, period, source)
+    missing_catalogs = [uri for uri in plan.missing if racing_catalog_year(uri, source) is not None]
+    if missing_catalogs:
+        scrape_data_many(source, missing_catalogs)
+        plan = plan_crawl(modes, period, source)
+    scrape_data_many(source, [uri for uri in plan.missing if uri not in missing_catalogs])
+    return plan
+
+
+def estimate_crawl_cost(count, runs=5):
+    """
+    Оценивает объем и время загрузки страниц по сводкам последних запусков в файле трассировки
+    :param int count: Количество страниц
+    :param int runs: Количество последних запусков
+    :return: tuple|None (байты, секунды) или None, если в сводках нет запросов
+    """
+    fetches, size, fetch_time = 0, 0, 0.0
+    for summary in read_summaries(settings.TRACE_PATH, runs):
+        fetches += summary.get('fetches', 0)
+        size += summary.get('bytes', 0)
+        fetch_time += summary.get('fetch_time', 0.0)
+    if not fetches:
+        return None
+    return int(count * size / fetches), round(count * fetch_time / fetches / settings.CRAWLER_CONCURRENCY, 1)
+
+
+def plan_data_sets(argv):
+    """
+    Выводит план загрузки страниц для датасетов и загружает недостающие страницы
+    :param list argv: Аргументы командной строки после plan
+    """
+    parser = argparse.ArgumentParser(prog='main.py plan', description='Plans and fetches pages missing in the cache')
+    parser.add_argument('mode', choices=('testing', 'racing', 'all'))
+    parser.add_argument('year_from', type=int, nargs='?')
+    parser.add_argument('year_to', type=int, nargs='?')
+    parser.add_argument('--dry-run', action='store_true', help='only show pages missing in the cache')
+    args = parser.parse_args(argv)
+    modes = ('testing', 'racing') if args.mode == 'all' else (args.mode,)
+    if args.year_from is None:
+        period = YEARS_PERIOD[:-1]
+    else:
+        period = range(args.year_from, (args.year_to or args.year_from) + 1)
+    if not period:
+        raise ValueError('Year {} is after year {}'.format(args.year_from, args.year_to))
+    if period[0] < YEARS_PERIOD[0] or period[-1] > YEARS_PERIOD[-1]:
+        raise ValueError('Year should be between {} and {}'.format(YEARS_PERIOD[0], YEARS_PERIOD[-1]))
+
+    plan = plan_crawl(modes, period)
+    logger.info('Pages needed: {}, cached: {}, missing: {}'.format(
+        len(plan.pages), len(plan.pages) - len(plan.missing), len(plan.missing)
+    ))
+    for uri in plan.unexpanded:
+        logger.info('Catalog `{}` is not cached, its races will be planned after it is fetched'.format(uri))
+    cost = estimate_crawl_cost(len(plan.missing))
+    if cost is None:
+        logger.info('Expected network cost is unknown: there are no requests in the trace file yet')
+    else:
+        logger.info('Expected network cost: {} requests, ~{} bytes, ~{} s'.format(len(plan.missing), *cost))
+    if args.dry_run:
+        for uri in plan.missing:
+            print(uri)
+        return
+    crawl_missing(modes, period)
+    plan = plan_crawl(modes, period)
+    logger.info('Pages still missing after crawling: {}'.format(len(plan.missing)))
+
+
+# -------------------------------------------------- Backfill Block -------------------------------------------------- #
+
+
+def backfill_race_results(period, source='f1news.ru', restart=False):
+    """
+    Собирает результаты гонок за произвольный период с контрольными точками: результаты каждой гонки и каждого
+    собранного сезона сохраняются на диск, поэтому после ошибки или прерывания повторный запуск пропускает
+    собранные сезоны и продолжает сезон с первой необработанной гонки. Текущий сезон еще продолжается, поэтому
+    для него сохраняются только результаты гонок
+    :param iterable period: Годы
+    :param str source: Источник данных
+    :param bool restart: Удалить контрольные точки периода и собрать результаты заново
+    :return: list
+    """
+    results = []
+    for year in period:
+        season_key = checkpoint_key('season', year, source)
+        races_key = checkpoint_key('races', year, source)
+        if restart:
+            RACE_CHECKPOINTS.delete(season_key)
+            RACE_CHECKPOINTS.delete(races_key)
+        season_results = RACE_CHECKPOINTS.get(season_key)
+        if season_results is not None:
+            logger.info('Season {} is restored from the checkpoint'.format(year))
+        else:
+            logger.info('Backfilling season {}...'.format(year))
+            prefetch_race_results(year, source)
+            season_results = get_all_race_results(year, source, resume=True)
+            if is_season_finished(year):
+                save_checkpoint(season_key, season_results)
+                RACE_CHECKPOINTS.delete(races_key)
+        results.extend(season_results)
+    return results
+
+
+def backfill_data_sets(argv):
+    """
+    Строит датасет результатов гонок за произвольный период с возобновлением после сбоя
+    :param list argv: Аргументы командной строки после backfill
+    """
+    parser = argparse.ArgumentParser(
+        prog='main.py backfill', description='Builds the racing data set for any seasons and resumes after failures'
+    )
+    parser.add_argument('year_from', type=int)
+    parser.add_argument('year_to', type=int, nargs='?')
+    parser.add_argument('--source', default='f1news.ru', choices=sorted(RACING_CATALOG_URI_TEMPLATES))
+    parser.add_argument('--restart', action='store_true', help='drop checkpoints of the period and start over')
+    args = parser.parse_args(argv)
+    period = range(args.year_from, (args.year_to or args.year_from) + 1)
+    if not period:
+        raise ValueError('Year {} is after year {}'.format(args.year_from, args.year_to))
+    df = pd.DataFrame(backfill_race_results(period, args.source, args.restart), columns=RACING_RESULTS_HEADERS)
+    save_data_frame_as_csv(df, period, 'racing')
 
 
 # ------------------------------------------------ Test Results Block ------------------------------------------------ #
@@ -364,10 +765,12 @@ def scrape_data(scraper_code, uri, params=None, headers=None):
 def join_team_results(results):
     """
     Объединяет результаты всех гонщиков одной команды за тестовый день, 
-    оставляет в списке лучший результат, а также общую сумму пройденных кругов
+    оставляет в списке лучший результат, а также общую сумму пройденных кругов.
+    Переданный список не изменяется: результаты парсеров берутся из кеша и общие для всех вызовов
     :param results: Список результатов тестов за день
     :return: list
     """
+    results = [list(result) for result in results]
     extra_rows = []
     for idx1, r1 in enumerate(results):
         for idx2, r2 in enumerate(results):
@@ -529,7 +932,7 @@ def get_race_results_by_num(year, num, source='f1news.ru'):
     :param source: Источник данных
     :return: list
     """
-    catalog_data = scrape_data(source, RACING_CATALOGS_URI[source][year])
+    catalog_data = scrape_data(source, racing_catalog_uri(year, source))
     parser = PARSERS[source]['race_catalog'](catalog_data)
     race_data = []
     try:
@@ -566,12 +969,12 @@ def get_blank_race_results(year, num, source='f1news.ru'):
     :param source: Источник данных
     :return: list
     """
-    catalog_data = scrape_data(source, RACING_CATALOGS_URI[source][year])
+    catalog_data = scrape_data(source, racing_catalog_uri(year, source))
     parser = PARSERS[source]['race_catalog'](catalog_data)
     track = parser.tracks()[num-1]
     track = track if track not in TRACKS_MAPPING else TRACKS_MAPPING[track]
     if num == 1:
-        prev_catalog_data = scrape_data(source, RACING_CATALOGS_URI[source][year-1])
+        prev_catalog_data = scrape_data(source, racing_catalog_uri(year - 1, source))
         prev_parser = PARSERS[source]['race_catalog'](prev_catalog_data)
         uri = prev_parser.links()[-1]
     else:
@@ -597,21 +1000,31 @@ def get_blank_race_results(year, num, source='f1news.ru'):
     return race_data
 
 
-def get_all_race_results(year, source='f1news.ru'):
+def get_all_race_results(year, source='f1news.ru', resume=False):
     """
     Собирает результаты всех гонок за сезон, считает дополнительные статистики
     :param year: Год проведения чемпионата
     :param source: Источник данных
+    :param resume: Сохранять результаты каждой обработанной гонки в контрольную точку и после прерванного
+        запуска продолжать с первой необработанной гонки
     :return: list
     """
     all_race_results = []
-    catalog_data = scrape_data(source, RACING_CATALOGS_URI[source][year])
+    catalog_data = scrape_data(source, racing_catalog_uri(year, source))
     parser = PARSERS[source]['race_catalog'](catalog_data)
     uris = parser.links()
     tracks = parser.tracks()
     laps = parser.laps()
     positions = defaultdict(list)
+    races_key = checkpoint_key('races', year, source)
+    finished = OrderedDict(RACE_CHECKPOINTS.get(races_key) or ()) if resume else OrderedDict()
     for i, uri in enumerate(uris):
+        if uri in finished:
+            total_result = [RaceDataFull(*row) for row in finished[uri]]
+            for result in total_result:
+                positions[result.driver].append(result.finish_position)
+            all_race_results.append(total_result)
+            continue
         total_result = []
         race_result = get_race_results_by_uri(uri, source)
         for result in race_result:
@@ -641,6 +1054,9 @@ def get_all_race_results(year, source='f1news.ru'):
                 result.retire_lap if result.retire_lap else laps[i],
             ]))
         all_race_results.append(total_result)
+        if resume:
+            finished[uri] = [tuple(result) for result in total_result]
+            save_checkpoint(races_key, finished)
     return merge_race_results_with_prev(all_race_results, year, source=source)
 
 
@@ -718,7 +1134,7 @@ def merge_race_results_with_prev(all_race_results, year, source='f1news.ru'):
     merged_all_race_results = []
     for idx, result in enumerate(all_race_results):
         if idx == 0:
-            catalog_data = scrape_data(source, RACING_CATALOGS_URI[source][year-1])
+            catalog_data = scrape_data(source, racing_catalog_uri(year - 1, source))
             uris = PARSERS[source]['race_catalog'](catalog_data).links()
             prev_res = get_race_results_by_uri(uris[-1], source=source)
         else:
@@ -783,6 +1199,7 @@ def build_testing_data_sets(year):
     :param year: Год проведения чемпионата
     :return: pandas.DataFrame
     """
+    prefetch_testing_results(year)
     df = pd.DataFrame(get_testing_results(year), columns=TESTING_RESULTS_HEADERS)
     if year != 2018:
         points_df = pd.DataFrame(get_team_points(year), columns=TEAM_POINTS_HEADERS)[['team', 'points']]
@@ -797,6 +1214,7 @@ def build_racing_data_sets(year):
     :param year: Год проведения чемпионата
     :return: pandas.DataFrame
     """
+    prefetch_race_results(year)
     return pd.DataFrame(get_all_race_results(year), columns=RACING_RESULTS_HEADERS)
 
 
@@ -850,13 +1268,35 @@ def save_data_frame_as_csv(df, period, prefix):
 
 
 def main():
+    get_tracer().trace_to(settings.TRACE_PATH, settings.TRACE_MAX_SIZE)
     logger.info('Start building data set...')
+    try:
+        build_data_sets()
+    finally:
+        PREFETCHER.close()
+        close_scrapers()
+        sync_all()
+        get_tracer().report(logger)
+        get_tracer().close()
+        logger.info('Memory cache: {hits} hits, {misses} misses, {evictions} evictions, '
+                    '{items} items, {size} bytes'.format(**get_memory_cache().stats()))
+        logger.info('Prefetched pages: {}, skipped: {}'.format(PREFETCHER.prefetched, PREFETCHER.dropped))
+    logger.info('Finish building data set')
+
 
+def build_data_sets():
     try:
         modes = [sys.argv[1]]
     except IndexError:
         modes = ('testing', 'racing', 'team',)
 
+    if modes[0] == 'plan':
+        plan_data_sets(sys.argv[2:])
+        return
+    if modes[0] == 'backfill':
+        backfill_data_sets(sys.argv[2:])
+        return
+
     if {'race-result', 'race-blank'} & set(modes):
         mode = modes[0]
         year = int(sys.argv[2])
@@ -917,8 +1357,6 @@ def main():
             else:
                 raise ValueError('Unsupported data set type `{}`'.format(mode))
 
-    logger.info('Finish building data set')
-
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,95 @@
+import functools
+import hashlib
+import inspect
+
+import bs4
+
+from helpers.cache_key import make_key
+from helpers.cacher import Cacher
+from helpers.tracer import get_tracer
+
+CACHE_PREFIX = 'parsed_data'
+
+
+@functools.lru_cache(maxsize=None)
+def parser_version(parser_class):
+    """
+    Версия парсера - хеш исходного кода его класса и базовых классов и версии BeautifulSoup,
+    поэтому любое изменение кода парсера делает недействительными сохраненные результаты
+    :param type parser_class: Класс парсера
+    :return: str
+    """
+    sources = [bs4.__version__]
+    for cls in parser_class.__mro__:
+        if cls is object:
+            continue
+        try:
+            sources.append(inspect.getsource(cls))
+        except (OSError, TypeError):
+            sources.append('{}.{}'.format(cls.__module__, cls.__qualname__))
+    return hashlib.md5(''.join(sources).encode('utf-8')).hexdigest()
+
+
+class CachedParser:
+    """
+    Заменяет парсер страницы: результаты публичных методов сохраняются в кеше по хешу страницы, классу и версии
+    парсера, а сам парсер (и разбор HTML) создается только при первом промахе. Полученные из кеша значения
+    общие для всех вызовов, изменять их нельзя
+    """
+
+    def __init__(self, parser_class, data, cacher=None):
+        """
+        :param type parser_class: Класс парсера
+        :param str data: Страница
+        :param Cacher cacher: Кеш результатов
+        """
+        self._parser_class = parser_class
+        self._data = data
+        self._parser = None
+        self._cacher = cacher if cacher is not None else Cacher(CACHE_PREFIX)
+        self._key = None
+        if isinstance(data, str):
+            self._key = '{}:{}.{}:{}'.format(
+                hashlib.sha1(data.encode('utf-8')).hexdigest(),
+                parser_class.__module__,
+                parser_class.__qualname__,
+                parser_version(parser_class),
+            )
+
+    def __getattr__(self, name):
+        attr = getattr(self._parser_class, name)
+        if self._key is None or name.startswith('_') or not inspect.isfunction(attr):
+            return getattr(self._get_parser(), name)
+
+        @functools.wraps(attr)
+        def method(*args):
+            cache_key = make_key(name, (self._key,) + args)
+            entry = self._cacher.get_entry(cache_key)
+            get_tracer().trace_cache(CACHE_PREFIX, cache_key, entry is not None, [name] + [str(arg) for arg in args])
+            if entry is not None:
+                return entry[0]
+            value = getattr(self._get_parser(), name)(*args)
+            self._cacher.put(cache_key, value)
+            return value
+
+        return method
+
+    def _get_parser(self):
+        if self._parser is None:
+            self._parser = self._parser_class(self._data)
+        return self._parser
+
+
+def cached_parser(parser_class):
+    """
+    Возвращает фабрику парсеров с кешированием результатов, которую можно использовать вместо класса парсера
+    :param type parser_class: Класс парсера
+    :return: callable
+    """
+    cacher = Cacher(CACHE_PREFIX)
+
+    def create(data):
+        return CachedParser(parser_class, data, cacher)
+
+    create.parser_class = parser_class
+    return create
@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from helpers.cache_backends import SQLiteDatabase
+from helpers.cacher import SQLITE_BACKEND, Cacher
+from helpers.memory_cache import get_memory_cache
+from parsers import cached_parser as cached_parser_module
+from parsers.cached_parser import CachedParser, cached_parser, parser_version
+from parsers.f1_news_race_calatog_parser import F1NewsRaceCatalogParser
+from parsers.f1_news_race_result_parser import F1NewsRaceResultParser
+
+
+class ChangedRaceCatalogParser(F1NewsRaceCatalogParser):
+    def links(self):
+        return ('changed',)
+
+
+class TestCachedParser(unittest.TestCase):
+    def setUp(self):
+        base_path = os.path.dirname(os.path.realpath(__file__))
+        with open(os.path.join(base_path, 'responses', 'f1-news-race-catalog-2016.html'), encoding='utf-8') as r:
+            self._html = r.read()
+        self._dir = tempfile.mkdtemp()
+        self._db = SQLiteDatabase(os.path.join(self._dir, 'cache.sqlite3'))
+        patcher = mock.patch('helpers.cacher.get_sqlite_database', return_value=self._db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self._cacher = Cacher('test', SQLITE_BACKEND)
+
+    def tearDown(self):
+        self._db.close()
+        shutil.rmtree(self._dir)
+        get_memory_cache().clear()
+
+    def test_return_parser_results(self):
+        parser = CachedParser(F1NewsRaceCatalogParser, self._html, self._cacher)
+        expected = F1NewsRaceCatalogParser(self._html)
+        self.assertEqual(expected.links(), parser.links())
+        self.assertEqual(expected.tracks(), parser.tracks())
+        self.assertEqual(expected.laps(), parser.laps())
+
+    def test_skip_parsing_if_results_are_cached(self):
+        CachedParser(F1NewsRaceCatalogParser, self._html, self._cacher).links()
+        get_memory_cache().clear()
+        with mock.patch.object(F1NewsRaceCatalogParser, '__init__', return_value=None) as init:
+            links = CachedParser(F1NewsRaceCatalogParser, self._html, self._cacher).links()
+        init.assert_not_called()
+        self.assertEqual(F1NewsRaceCatalogParser(self._html).links(), links)
+
+    def test_key_results_by_page_and_parser(self):
+        links = CachedParser(F1NewsRaceCatalogParser, self._html, self._cacher).links()
+        self.assertEqual(('changed',), CachedParser(ChangedRaceCatalogParser, self._html, self._cacher).links())
+        other = CachedParser(F1NewsRaceCatalogParser, self._html.replace('Мельбурн', 'Мельбурн 2'), self._cacher)
+        self.assertEqual(links, other.links())
+        self.assertEqual(3, len(self._cacher.keys()))
+
+    def test_parser_version_depends_on_code(self):
+        self.assertEqual(parser_version(F1NewsRaceCatalogParser), parser_version(F1NewsRaceCatalogParser))
+        self.assertNotEqual(parser_version(F1NewsRaceCatalogParser), parser_version(ChangedRaceCatalogParser))
+        self.assertNotEqual(parser_version(F1NewsRaceCatalogParser), parser_version(F1NewsRaceResultParser))
+
+    def test_do_not_cache_missing_pages(self):
+        with self.assertRaises(TypeError):
+            CachedParser(F1NewsRaceCatalogParser, None, self._cacher).links()
+        self.assertEqual([], self._cacher.keys())
+
+    def test_factory(self):
+        with mock.patch.object(cached_parser_module, 'Cacher', return_value=self._cacher):
+            create = cached_parser(F1NewsRaceCatalogParser)
+        parser = create(self._html)
+        self.assertIsInstance(parser, CachedParser)
+        self.assertEqual(F1NewsRaceCatalogParser(self._html).links(), parser.links())
+        self.assertEqual(1, len(self._cacher.keys()))
+
+
+if __name__ == '__main__':
+    unittest.main()
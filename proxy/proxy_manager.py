@@ -1,35 +1,215 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import requests
 
+import settings
+from helpers.cacher import Cacher
 from helpers.request import Request
 from parsers.proxy_catalog_parser import ProxyCatalogParser
 
 
-CHECK_PROXY_URL = 'https://ya.ru'
+CHECK_PROXY_URL = settings.CHECK_PROXY_URL
+
+
+class ProxyStats:
+    """Статистика работы прокси сервера: сглаженное время ответа и количество удачных и неудачных запросов"""
+    _smoothing = 0.3
+
+    def __init__(self, url):
+        self.url = url
+        self.latency = None
+        self.successes = 0
+        self.failures = 0
+        self.checked_at = None
+
+    @property
+    def attempts(self):
+        return self.successes + self.failures
+
+    @property
+    def error_rate(self):
+        return self.failures / self.attempts if self.attempts else 0.0
+
+    @property
+    def is_healthy(self):
+        return self.latency is not None and self.successes > 0
+
+    def score(self):
+        """Чем меньше значение, тем лучше прокси"""
+        return self.latency / (1.0 - min(self.error_rate, 0.99))
+
+    def add_success(self, latency):
+        self.successes += 1
+        self.checked_at = time.time()
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += self._smoothing * (latency - self.latency)
+
+    def add_failure(self):
+        self.failures += 1
+        self.checked_at = time.time()
+
+    def as_dict(self):
+        return {
+            'latency': self.latency,
+            'successes': self.successes,
+            'failures': self.failures,
+            'checked_at': self.checked_at,
+        }
+
+    @classmethod
+    def from_dict(cls, url, data):
+        stats = cls(url)
+        stats.latency = data['latency']
+        stats.successes = data['successes']
+        stats.failures = data['failures']
+        stats.checked_at = data['checked_at']
+        return stats
 
 
 class ProxyManager(Request):
-    def __init__(self, scrapper, timeout=10):
+    def __init__(self, scrapper, timeout=10, concurrency=settings.PROXY_CHECK_CONCURRENCY, cache_prefix='proxies'):
+        """
+        :param str cache_prefix: Префикс кеша каталога и статистики прокси, None - не сохранять их на диск
+        """
         super().__init__(timeout=timeout)
         self._scrapper = scrapper
-        self._excluded_proxies = []
+        self._cacher = Cacher(cache_prefix) if cache_prefix is not None else None
+        self._stats = {}
+        self._excluded_proxies = {}
+        self._lock = threading.RLock()
+        self._discovery_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+        self._revalidated_at = time.time()
+        self._load_health()
 
-    def get_proxy(self):
-        data = self._scrapper.scrape('proxy-list')
-        parser = ProxyCatalogParser(data)
-        for ip in parser.proxy_ips():
-            url = 'http://{}'.format(ip)
+    def get_proxy(self, exclude=()):
+        """
+        Возвращает самый быстрый из работающих прокси серверов, если таких нет,
+        то параллельно проверяет прокси из каталога и возвращает первый ответивший
+        :param iterable exclude: Прокси, которые не следует возвращать
+        :return: str|None
+        """
+        exclude = set(exclude)
+        proxy = self._best_proxy(exclude)
+        if proxy is not None:
+            self._schedule_revalidation()
+            return proxy
+        with self._discovery_lock:
+            proxy = self._best_proxy(exclude)
+            if proxy is not None:
+                return proxy
+            return self._discover(exclude)
+
+    def check_proxy(self, url):
+        """
+        Проверяет доступность прокси и обновляет его статистику
+        :param str url: Адрес прокси
+        :return: bool
+        """
+        started = time.monotonic()
+        try:
+            response = self._session.get(self.get_url(), timeout=self.timeout, proxies={'http': url, 'https': url})
+            response.raise_for_status()
+        except requests.RequestException:
+            self.report_failure(url)
+            return False
+        self.report_success(url, time.monotonic() - started)
+        return True
+
+    def report_success(self, url, latency):
+        with self._lock:
+            if url in self._excluded_proxies:
+                return
+            self._stats.setdefault(url, ProxyStats(url)).add_success(latency)
+
+    def report_failure(self, url):
+        with self._lock:
             if url in self._excluded_proxies:
-                continue
-            try:
-                self.proxy = url
-                self.get()
-                return url
-            except (requests.ConnectionError, requests.ReadTimeout):
-                continue
-        return None
+                return
+            stats = self._stats.setdefault(url, ProxyStats(url))
+            stats.add_failure()
+            if stats.attempts >= settings.PROXY_MIN_ATTEMPTS and stats.error_rate > settings.PROXY_MAX_ERROR_RATE:
+                self.forget_proxy(url)
 
     def forget_proxy(self, url):
-        self._excluded_proxies.append(url)
+        with self._lock:
+            self._excluded_proxies[url] = time.time()
+            self._stats.pop(url, None)
+
+    def save_health(self):
+        """Сохраняет статистику прокси на диск, чтобы следующий запуск начинал работу с проверенных прокси"""
+        with self._lock:
+            health = {
+                'stats': {url: stats.as_dict() for url, stats in self._stats.items()},
+                'excluded': dict(self._excluded_proxies),
+            }
+        self._save('health', health)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.save_health()
+        super().close()
+        self._scrapper.close()
 
     def get_url(self):
         return CHECK_PROXY_URL
+
+    def _best_proxy(self, exclude):
+        with self._lock:
+            candidates = [s for s in self._stats.values() if s.is_healthy and s.url not in exclude]
+            if not candidates:
+                return None
+            return min(candidates, key=lambda s: s.score()).url
+
+    def _discover(self, exclude):
+        urls = ['http://{}'.format(ip) for ip in self._load_catalog()]
+        with self._lock:
+            urls = [url for url in urls if url not in self._excluded_proxies and url not in exclude]
+        futures = {self._executor.submit(self.check_proxy, url): url for url in urls}
+        proxy = None
+        for future in as_completed(futures):
+            if future.result():
+                proxy = futures[future]
+                break
+        self.save_health()
+        return proxy
+
+    def _load_catalog(self):
+        catalog = self._cacher.get('catalog') if self._cacher is not None else None
+        if catalog is not None and time.time() - catalog['fetched_at'] < settings.PROXY_CATALOG_TTL:
+            return catalog['ips']
+        data = self._scrapper.scrape('proxy-list')
+        ips = ProxyCatalogParser(data).proxy_ips()
+        self._save('catalog', {'ips': ips, 'fetched_at': time.time()})
+        return ips
+
+    def _load_health(self):
+        health = self._cacher.get('health') if self._cacher is not None else None
+        if health is None:
+            return
+        expired_at = time.time() - settings.PROXY_HEALTH_TTL
+        for url, data in health['stats'].items():
+            if data['checked_at'] is not None and data['checked_at'] > expired_at:
+                self._stats[url] = ProxyStats.from_dict(url, data)
+        for url, excluded_at in health['excluded'].items():
+            if excluded_at > expired_at:
+                self._excluded_proxies[url] = excluded_at
+
+    def _save(self, key, value):
+        if self._cacher is None:
+            return
+        if not self._cacher.update(key, value):
+            self._cacher.put(key, value)
+
+    def _schedule_revalidation(self):
+        with self._lock:
+            if time.time() - self._revalidated_at < settings.PROXY_REVALIDATE_INTERVAL:
+                return
+            self._revalidated_at = time.time()
+            urls = list(self._stats)
+        for url in urls:
+            self._executor.submit(self.check_proxy, url)
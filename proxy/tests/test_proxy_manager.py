@@ -2,35 +2,129 @@ import os
 import unittest
 import re
 
+import requests
 import requests_mock
 
+import settings
 from proxy.proxy_manager import ProxyManager, CHECK_PROXY_URL
 
 
 class MockScraper:
+    def __init__(self):
+        self.calls = 0
+
     def scrape(self, path, *, params=None, headers=None):
+        self.calls += 1
         path = re.sub(r'/', '-', path.lower().strip())
         base_path = os.path.dirname(os.path.realpath(__file__))
         with open(os.path.join(base_path, 'responses/{}'.format(path)), 'r') as r:
             return r.read()
 
+    def close(self):
+        pass
+
 
 class TestProxyManager(unittest.TestCase):
+    cache_prefix = 'test'
+
     def setUp(self):
-        self._manager = ProxyManager(MockScraper())
+        self._manager = ProxyManager(MockScraper(), cache_prefix=self.cache_prefix)
+
+    def tearDown(self):
+        self._manager.close()
+        self._manager._cacher.flush()
 
     def test_get_proxy(self):
         with requests_mock.mock() as m:
             m.get(CHECK_PROXY_URL, text='')
             proxy = self._manager.get_proxy()
-            self.assertEqual('http://35.196.26.166:3128', proxy)
+            self.assertRegex(proxy, r'^http://[\d.]+:\d+$')
 
     def test_forget_proxy(self):
         with requests_mock.mock() as m:
             self._manager.forget_proxy('http://35.196.26.166:3128')
             m.get(CHECK_PROXY_URL, text='')
-            proxy = self._manager.get_proxy()
-            self.assertEqual('http://47.89.22.200:80', proxy)
+            for _ in range(5):
+                self.assertNotEqual('http://35.196.26.166:3128', self._manager.get_proxy())
+
+    def test_get_fastest_proxy(self):
+        self._manager.report_success('http://1.1.1.1:80', 0.5)
+        self._manager.report_success('http://2.2.2.2:80', 0.1)
+        self._manager.report_success('http://3.3.3.3:80', 0.3)
+        self.assertEqual('http://2.2.2.2:80', self._manager.get_proxy())
+        self.assertEqual('http://3.3.3.3:80', self._manager.get_proxy(exclude=['http://2.2.2.2:80']))
+
+    def test_rank_proxy_by_error_rate(self):
+        self._manager.report_success('http://1.1.1.1:80', 0.2)
+        self._manager.report_success('http://2.2.2.2:80', 0.1)
+        self._manager.report_failure('http://2.2.2.2:80')
+        self._manager.report_failure('http://2.2.2.2:80')
+        self.assertEqual('http://1.1.1.1:80', self._manager.get_proxy())
+
+    def test_evict_proxy_with_high_error_rate(self):
+        self._manager.report_success('http://1.1.1.1:80', 0.1)
+        for _ in range(settings.PROXY_MIN_ATTEMPTS):
+            self._manager.report_failure('http://1.1.1.1:80')
+        self.assertNotIn('http://1.1.1.1:80', self._manager._stats)
+        self.assertIn('http://1.1.1.1:80', self._manager._excluded_proxies)
+        self._manager.report_success('http://1.1.1.1:80', 0.1)
+        self.assertNotIn('http://1.1.1.1:80', self._manager._stats)
+
+    def test_check_proxy(self):
+        with requests_mock.mock() as m:
+            m.get(CHECK_PROXY_URL, text='')
+            self.assertTrue(self._manager.check_proxy('http://1.1.1.1:80'))
+            m.get(CHECK_PROXY_URL, exc=requests.ConnectTimeout)
+            self.assertFalse(self._manager.check_proxy('http://2.2.2.2:80'))
+        self.assertTrue(self._manager._stats['http://1.1.1.1:80'].is_healthy)
+        self.assertFalse(self._manager._stats['http://2.2.2.2:80'].is_healthy)
+
+    def test_get_none_if_all_proxies_are_dead(self):
+        with requests_mock.mock() as m:
+            m.get(CHECK_PROXY_URL, exc=requests.ConnectionError)
+            self.assertIsNone(self._manager.get_proxy())
+
+    def test_restore_proxy_health_from_disk(self):
+        self._manager.report_success('http://1.1.1.1:80', 0.2)
+        self._manager.report_success('http://2.2.2.2:80', 0.1)
+        self._manager.forget_proxy('http://3.3.3.3:80')
+        self._manager.save_health()
+
+        manager = ProxyManager(MockScraper(), cache_prefix=self.cache_prefix)
+        self.assertEqual('http://2.2.2.2:80', manager.get_proxy())
+        self.assertEqual(0, manager._scrapper.calls)
+        self.assertIn('http://3.3.3.3:80', manager._excluded_proxies)
+        manager.close()
+
+    def test_ignore_expired_proxy_health(self):
+        self._manager.report_success('http://1.1.1.1:80', 0.2)
+        self._manager._stats['http://1.1.1.1:80'].checked_at -= settings.PROXY_HEALTH_TTL + 1
+        self._manager.save_health()
+
+        manager = ProxyManager(MockScraper(), cache_prefix=self.cache_prefix)
+        self.assertEqual({}, manager._stats)
+        manager.close()
+
+    def test_reuse_cached_proxy_catalog(self):
+        with requests_mock.mock() as m:
+            m.get(CHECK_PROXY_URL, exc=requests.ConnectionError)
+            self._manager.get_proxy()
+            self.assertEqual(1, self._manager._scrapper.calls)
+
+            manager = ProxyManager(MockScraper(), cache_prefix=self.cache_prefix)
+            manager.get_proxy()
+            self.assertEqual(0, manager._scrapper.calls)
+            manager.close()
+
+    def test_do_not_persist_proxies_without_cache_prefix(self):
+        self._manager.report_success('http://1.1.1.1:80', 0.2)
+        self._manager.save_health()
+
+        manager = ProxyManager(MockScraper(), cache_prefix=None)
+        self.assertEqual({}, manager._stats)
+        manager.report_success('http://2.2.2.2:80', 0.1)
+        manager.close()
+        self.assertEqual(['http://1.1.1.1:80'], list(self._manager._cacher.get('health')['stats']))
 
 
 if __name__ == '__main__':
@@ -1,11 +1,121 @@
 import os
+from urllib.parse import urlparse
 
 base_dir = os.path.dirname(__file__)
 
 STORAGE_PATH = os.path.abspath(os.path.join(base_dir, 'storage'))
 
+# Файл трассировки запросов в формате JSON lines, None - не записывать трассировку
+TRACE_PATH = os.path.join(STORAGE_PATH, 'logs', 'trace.jsonl')
+
+# Максимальный размер файла трассировки в байтах: больший файл при запуске переименовывается в trace.jsonl.1
+TRACE_MAX_SIZE = 50 * 1024 * 1024
+
+# Хранилище кеша по умолчанию: file - отдельный файл на каждый ключ, sqlite - одна база данных storage/cache.sqlite3
+CACHE_BACKEND = 'file'
+
+# Хранилища для отдельных префиксов кеша, например {'scraped_data': 'sqlite'}
+CACHE_BACKENDS = {}
+
+# Ограничение размера хранилища для отдельных префиксов кеша в байтах, например {'scraped_data': 2 * 1024 ** 3}.
+# При превышении вытесняются значения, к которым дольше всего не обращались
+CACHE_QUOTAS = {}
+
+# Снимки кеша <префикс>.snapshot из этой директории используются как хранилища только для чтения под основным
+# хранилищем префикса. Снимки создаются командой python3 -m helpers.cache_manager export
+CACHE_SNAPSHOTS_PATH = os.path.join(STORAGE_PATH, 'snapshots')
+
+# Уровень сжатия значений кеша zlib от 0 (без сжатия) до 9
+CACHE_COMPRESSION_LEVEL = 6
+
+# Количество потоков для фонового обновления устаревших значений кеша
+CACHE_REVALIDATE_WORKERS = 2
+
+# Страницы текущего сезона считаются свежими LIVE_PAGES_TTL секунд, затем еще LIVE_PAGES_STALE_TTL секунд
+# отдаются из кеша с обновлением в фоне
+LIVE_PAGES_TTL = 6 * 3600
+LIVE_PAGES_STALE_TTL = 7 * 24 * 3600
+
+# Размер LRU кеша в памяти перед хранилищем кеша в байтах, 0 - не хранить значения в памяти
+MEMORY_CACHE_SIZE = 64 * 1024 * 1024
+
+# Время в секундах, в течение которого повторные запросы отсутствующей или недоступной страницы завершаются
+# сохраненной ошибкой без обращения к сети
+NEGATIVE_CACHE_TTL = 30 * 60
+
 # TODO: Вынести в .env файл
 USE_PROXY = True
 
 PROXY_CATALOG_PROTOCOL = 'https'
 PROXY_CATALOG_DOMAIN = 'www.ip-adress.com'
+
+CHECK_PROXY_URL = 'https://ya.ru'
+
+# Режим записи: все полученные ответы сохраняются в заданную директорию
+RECORD_PATH = os.environ.get('F1_GURU_RECORD_PATH')
+
+# Адрес локального сервера с записанными ответами (python3 -m helpers.fixture_server), если задан,
+# то все запросы к источникам данных, каталогу прокси и проверки прокси выполняются к нему
+REPLAY_URL = os.environ.get('F1_GURU_REPLAY_URL')
+
+if REPLAY_URL:
+    PROXY_CATALOG_PROTOCOL = urlparse(REPLAY_URL).scheme
+    PROXY_CATALOG_DOMAIN = '{}/{}'.format(urlparse(REPLAY_URL).netloc, PROXY_CATALOG_DOMAIN)
+    CHECK_PROXY_URL = '{}/check-proxy'.format(REPLAY_URL.rstrip('/'))
+
+# Максимальное количество keep-alive соединений к одному хосту в пуле каждого скрапера
+HTTP_POOL_SIZE = 10
+
+# Максимальное количество одновременных запросов при загрузке страниц сезона
+CRAWLER_CONCURRENCY = 8
+
+# Количество прокси, проверяемых одновременно
+PROXY_CHECK_CONCURRENCY = 20
+
+# Интервал (в секундах) фоновой перепроверки известных прокси
+PROXY_REVALIDATE_INTERVAL = 300
+
+# Прокси исключается из пула, если доля ошибок превышает PROXY_MAX_ERROR_RATE
+# после как минимум PROXY_MIN_ATTEMPTS запросов через него
+PROXY_MAX_ERROR_RATE = 0.5
+PROXY_MIN_ATTEMPTS = 4
+
+# Время жизни (в секундах) сохраненного на диске каталога прокси и статистики их работы
+PROXY_CATALOG_TTL = 60 * 60
+PROXY_HEALTH_TTL = 6 * 60 * 60
+
+# Дублирование (hedging) медленных запросов через другой прокси: запрос дублируется, если ответ не получен
+# за время, соответствующее перцентилю HEDGE_PERCENTILE последних HEDGE_HISTORY_SIZE запросов
+# (или HEDGE_DEFAULT_DELAY секунд, пока накоплено меньше HEDGE_MIN_SAMPLES замеров)
+USE_HEDGED_REQUESTS = False
+HEDGE_PERCENTILE = 0.95
+HEDGE_HISTORY_SIZE = 200
+HEDGE_MIN_SAMPLES = 20
+HEDGE_DEFAULT_DELAY = 3.0
+
+# Ограничение нагрузки на каждый хост: не более THROTTLE_RATE запросов в секунду (с всплесками до THROTTLE_BURST),
+# количество одновременных запросов подбирается автоматически в пределах [THROTTLE_MIN_CONCURRENCY,
+# THROTTLE_MAX_CONCURRENCY] и снижается, если время ответа выросло в THROTTLE_LATENCY_FACTOR раз
+THROTTLE_RATE = 5
+THROTTLE_BURST = 5
+THROTTLE_MIN_CONCURRENCY = 1
+THROTTLE_MAX_CONCURRENCY = CRAWLER_CONCURRENCY
+THROTTLE_LATENCY_FACTOR = 2.0
+
+# Общий бюджет повторных запросов: каждый запрос добавляет RETRY_BUDGET_RATIO повтора, но не больше
+# RETRY_BUDGET_CAPACITY; повторы сверх бюджета не выполняются
+RETRY_BUDGET_RATIO = 0.2
+RETRY_BUDGET_CAPACITY = 10
+
+# Хост или прокси считается недоступным после CIRCUIT_BREAKER_THRESHOLD ошибок подряд,
+# запросы к нему отклоняются без обращения к сети в течение CIRCUIT_BREAKER_RESET_TIMEOUT секунд
+CIRCUIT_BREAKER_THRESHOLD = 5
+CIRCUIT_BREAKER_RESET_TIMEOUT = 30
+
+# Количество попыток загрузки страницы при параллельной загрузке сезона
+CRAWLER_TRIES = 2
+
+# Фоновая загрузка страниц, которые понадобятся следом за запрошенной: количество потоков (0 - не загружать)
+# и максимальное количество страниц в очереди, остальные предсказанные страницы пропускаются
+PREFETCH_WORKERS = 4
+PREFETCH_QUEUE_SIZE = 64
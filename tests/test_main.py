@@ -0,0 +1,232 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import requests
+
+import main
+import settings
+from decorators import decorators
+from helpers.cache_policy import PERMANENT
+from helpers.cacher import Cacher
+from helpers.memory_cache import get_memory_cache
+from parsers.cached_parser import cached_parser
+
+RESPONSES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'parsers', 'tests',
+                              'responses')
+
+
+def read_response(name):
+    with open(os.path.join(RESPONSES_PATH, name), encoding='utf-8') as r:
+        return r.read()
+
+
+def fake_scrape_data(source, uri, params=None, headers=None):
+    if main.racing_catalog_year(uri, source) is not None:
+        return read_response('f1-news-race-catalog-2016.html')
+    if uri.endswith('grid.shtml'):
+        return read_response('f1-news-starting-positions-4-2016.html')
+    return read_response('f1-news-race-4-2016.html')
+
+
+def isolate_storage(test):
+    """
+    Переносит хранилище во временную директорию на время теста: кеши тестов и результаты парсеров main.PARSERS
+    не попадают в settings.STORAGE_PATH
+    :param unittest.TestCase test: Тест
+    """
+    path = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, path)
+    patcher = mock.patch.object(settings, 'STORAGE_PATH', path)
+    patcher.start()
+    test.addCleanup(patcher.stop)
+    # Кеш результатов создается вместе с парсером, поэтому парсеры создаются заново уже с временным хранилищем
+    parsers = {source: {name: cached_parser(create.parser_class) for name, create in source_parsers.items()}
+               for source, source_parsers in main.PARSERS.items()}
+    patcher = mock.patch.object(main, 'PARSERS', parsers)
+    patcher.start()
+    test.addCleanup(patcher.stop)
+
+
+class TestBackfill(unittest.TestCase):
+    cache_prefix = 'test'
+
+    def setUp(self):
+        isolate_storage(self)
+        self.c = Cacher(self.cache_prefix)
+        self.calls = []
+        self.failing_call = None
+        get_race_results_by_uri = main.get_race_results_by_uri
+
+        def race_results(uri, source='f1news.ru'):
+            self.calls.append(uri)
+            if len(self.calls) == self.failing_call:
+                raise KeyError('New Team')
+            return get_race_results_by_uri(uri, source)
+
+        for name, value in (('scrape_data', fake_scrape_data), ('RACE_CHECKPOINTS', self.c),
+                            ('get_race_results_by_uri', race_results), ('prefetch_race_results', mock.Mock())):
+            patcher = mock.patch.object(main, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        get_memory_cache().clear()
+
+    def test_resume_from_first_unfinished_race(self):
+        expected = main.get_all_race_results(2016)
+        self.calls.clear()
+        self.failing_call = 3
+        with self.assertRaises(KeyError):
+            main.get_all_race_results(2016, resume=True)
+        self.assertEqual(2, len(self.c.get(main.checkpoint_key('races', 2016))))
+
+        self.calls.clear()
+        self.failing_call = None
+        # Средние позиции гонщиков считаются и по результатам гонок из контрольной точки
+        self.assertEqual(expected, main.get_all_race_results(2016, resume=True))
+        links = main.PARSERS['f1news.ru']['race_catalog'](fake_scrape_data('f1news.ru', 'Championship/2016/')).links()
+        self.assertEqual(list(links[2:]) + [links[-1]], self.calls)
+
+    def test_restore_finished_season(self):
+        with mock.patch.object(main, 'is_season_finished', return_value=True):
+            results = main.backfill_race_results([2016])
+            self.calls.clear()
+            self.assertEqual(results, main.backfill_race_results([2016]))
+        self.assertEqual([], self.calls)
+        self.assertEqual([main.checkpoint_key('season', 2016)], self.c.keys())
+
+    def test_keep_race_checkpoints_of_current_season(self):
+        with mock.patch.object(main, 'is_season_finished', return_value=False):
+            main.backfill_race_results([2016])
+            self.calls.clear()
+            main.backfill_race_results([2016])
+        self.assertEqual(1, len(self.calls))
+        self.assertEqual([main.checkpoint_key('races', 2016)], self.c.keys())
+
+    def test_restart_backfill(self):
+        with mock.patch.object(main, 'is_season_finished', return_value=True):
+            main.backfill_race_results([2016])
+            self.calls.clear()
+            main.backfill_race_results([2016], restart=True)
+        self.assertEqual(22, len(self.calls))
+
+    def test_checkpoint_key_depends_on_mappings(self):
+        key = main.checkpoint_key('races', 2016)
+        self.assertTrue(key.startswith('f1news.ru-2016-races-'))
+        with mock.patch.object(main, 'TEAMS_MAPPING', dict(main.TEAMS_MAPPING, **{'New Team': 'New Team'})):
+            self.assertNotEqual(key, main.checkpoint_key('races', 2016))
+
+    def test_season_is_finished_after_its_year(self):
+        with mock.patch('time.localtime', return_value=mock.Mock(tm_year=2019)):
+            self.assertTrue(main.is_season_finished(2018))
+            self.assertFalse(main.is_season_finished(2019))
+
+    def test_revalidate_pages_of_current_season(self):
+        season = main.current_season()
+        for uri in ('Championship/{}/', 'Championship/{}/teampoints.shtml'):
+            self.assertIsNot(PERMANENT, main.SCRAPED_DATA_POLICIES.select([uri.format(season)]))
+            self.assertIs(PERMANENT, main.SCRAPED_DATA_POLICIES.select([uri.format(season - 1)]))
+
+
+
+class TestCrawlPlanner(unittest.TestCase):
+    cache_prefix = 'test'
+
+    def setUp(self):
+        isolate_storage(self)
+        self.test_dir = Cacher(self.cache_prefix)._directory_path
+        self.fetched = []
+        self.missing_pages = set()
+
+        def fetch(source, uri, params=None, headers=None):
+            self.fetched.append(uri)
+            if uri in self.missing_pages:
+                response = requests.Response()
+                response.status_code = 404
+                raise requests.HTTPError('Not found', response=response)
+            return fake_scrape_data(source, uri)
+
+        self.scrape_data = decorators.save_to_cache(self.cache_prefix, negative=main.is_missing_page)(fetch)
+        patcher = mock.patch.object(main, 'scrape_data', self.scrape_data)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        catalog = main.PARSERS['f1news.ru']['race_catalog'](fake_scrape_data('f1news.ru', 'Championship/2016/'))
+        self.races = [uri for link in catalog.links() for uri in (link, link.replace('race.shtml', 'grid.shtml'))]
+
+    def tearDown(self):
+        get_memory_cache().clear()
+
+    def _scrape_data_many(self, source, uris):
+        return [self.scrape_data(source, uri) for uri in uris]
+
+    def test_plan_without_cached_catalogs(self):
+        plan = main.plan_crawl(('racing',), (2016,))
+        self.assertEqual(['Championship/2016/', 'Championship/2015/'], plan.pages)
+        self.assertEqual(plan.pages, plan.missing)
+        self.assertEqual(plan.pages, plan.unexpanded)
+        self.assertEqual([], self.fetched)
+
+    def test_plan_races_of_cached_catalogs(self):
+        self.scrape_data('f1news.ru', 'Championship/2016/')
+        self.scrape_data('f1news.ru', self.races[0])
+        self.missing_pages.add(self.races[1])
+        with self.assertRaises(requests.HTTPError):
+            self.scrape_data('f1news.ru', self.races[1])
+        self.fetched.clear()
+
+        plan = main.plan_crawl(('racing',), (2016,))
+        self.assertEqual(['Championship/2016/'] + self.races + ['Championship/2015/'], plan.pages)
+        # Страница, которой нет на сайте, уже известна и не загружается повторно
+        self.assertEqual(self.races[2:] + ['Championship/2015/'], plan.missing)
+        self.assertEqual(['Championship/2015/'], plan.unexpanded)
+        self.assertEqual([], self.fetched)
+
+    def test_plan_testing_pages(self):
+        plan = main.plan_crawl(('testing',), (2016,))
+        self.assertEqual(list(main.TESTING_URI['f1news.ru'][2016]) + ['Championship/2016/teampoints.shtml'],
+                         plan.pages)
+        self.assertEqual(plan.pages, plan.missing)
+        self.assertEqual([], plan.unexpanded)
+
+    def test_plan_does_not_change_cache(self):
+        Cacher(self.cache_prefix).put('0' * 32, 'legacy')
+        self.scrape_data('f1news.ru', 'Championship/2016/')
+        files = sorted(os.listdir(self.test_dir))
+        main.plan_crawl(('racing', 'testing'), (2016,))
+        self.assertEqual(files, sorted(os.listdir(self.test_dir)))
+
+    def test_crawl_catalogs_before_pages(self):
+        with mock.patch.object(main, 'scrape_data_many', side_effect=self._scrape_data_many) as scrape_data_many:
+            main.crawl_missing(('racing',), (2016,))
+        self.assertEqual([
+            mock.call('f1news.ru', ['Championship/2016/', 'Championship/2015/']),
+            mock.call('f1news.ru', self.races),
+        ], scrape_data_many.call_args_list)
+        self.assertEqual([], main.plan_crawl(('racing',), (2016,)).missing)
+
+    def test_raise_exception_if_period_is_empty(self):
+        with self.assertRaises(ValueError) as context:
+            main.plan_data_sets(['racing', '2016', '2015'])
+        self.assertEqual('Year 2016 is after year 2015', str(context.exception))
+
+
+class TestJoinTeamResults(unittest.TestCase):
+    def test_join_without_changing_results(self):
+        results = [
+            ['1', 'Hamilton', 'Mercedes', '1:20.000', '50', 'C3'],
+            ['2', 'Vettel', 'Ferrari', '1:21.000', '40', 'C3'],
+            ['3', 'Bottas', 'Mercedes', '1:22.000', '30', 'C2'],
+        ]
+        expected = [list(result) for result in results]
+        self.assertEqual([
+            ['1', 'Hamilton', 'Mercedes', '1:20.000', 80, 'C3'],
+            ['2', 'Vettel', 'Ferrari', '1:21.000', '40', 'C3'],
+        ], main.join_team_results(results))
+        self.assertEqual(expected, results)
+
+
+if __name__ == '__main__':
+    unittest.main()